@@ -6,22 +6,31 @@ cd ~/git/supp-ai-data/
 source activate suppai
 
 # Get new papers and run through pipeline
-echo 'Preprocessing data...'
-python scripts/preprocess.py
-
-echo 'Running beaker experiments...'
-python scripts/run_beaker.py
-
-echo 'Get S2 paper data...'
-python scripts/get_pubmed_paper_info.py
-
-echo 'Postprocessing data...'
-python scripts/postprocess.py
+# (stages with unchanged inputs are skipped, so rerunning after a failure resumes at the failed stage;
+# set DDI_BACKEND=local to run BERT-DDI on this machine instead of Beaker)
+echo 'Running pipeline...'
+python scripts/run_pipeline.py || exit 1
 
 # Upload to GCS and grant permissions
 echo 'Uploading data to GCP...'
 HEADER=$(jq -r '.header_str' config/log.json)
 gsutil cp output/$HEADER.tar.gz -p ai2-reviz gs://supp-ai-data/
 gsutil iam ch allUsers:roles/storage.legacyObjectReader gs://supp-ai-data/$HEADER.tar.gz
+if [ -f output/$HEADER.delta.json.gz ]; then
+  gsutil cp output/$HEADER.delta.json.gz -p ai2-reviz gs://supp-ai-data/
+  gsutil iam ch allUsers:roles/storage.legacyObjectReader gs://supp-ai-data/$HEADER.delta.json.gz
+fi
+if [ -f output/$HEADER.sqlite ]; then
+  gsutil cp output/$HEADER.sqlite -p ai2-reviz gs://supp-ai-data/
+  gsutil iam ch allUsers:roles/storage.legacyObjectReader gs://supp-ai-data/$HEADER.sqlite
+fi
+if [ -f output/$HEADER.graph.bin ]; then
+  gsutil cp output/$HEADER.graph.bin -p ai2-reviz gs://supp-ai-data/
+  gsutil iam ch allUsers:roles/storage.legacyObjectReader gs://supp-ai-data/$HEADER.graph.bin
+fi
+if [ -f output/$HEADER.names.json.gz ]; then
+  gsutil cp output/$HEADER.names.json.gz -p ai2-reviz gs://supp-ai-data/
+  gsutil iam ch allUsers:roles/storage.legacyObjectReader gs://supp-ai-data/$HEADER.names.json.gz
+fi
 
 echo 'done.'
\ No newline at end of file
@@ -1,8 +1,20 @@
+"""
+Add preferred names, synonyms, definitions, and tradenames to CUI clusters
+Only clusters that are new (no metadata yet) or whose preferred name or tradenames changed are updated, with point
+lookups in the local UMLS store (build it once with scripts/build_umls_store.py)
+Usage: python scripts/add_cui_info.py [--all] [CUI ...]
+
+"""
+
 import os
+import sys
 import json
-import tqdm
-from collections import defaultdict
+import argparse
+from typing import Dict, List, Tuple
 import unicodedata
+from collections import defaultdict
+
+from suppai.umls_store import UMLSStore, UMLS_STORE_FILE
 
 
 def process_synonyms(all_names):
@@ -24,14 +36,56 @@ def process_synonyms(all_names):
     return syn
 
 
-# CUI cluster file
-CUI_FILE = 'data/cui_clusters.json'
+def get_tradenames(cui: str, tradename_dict: Dict) -> List[str]:
+    return [trade[1] for trade in tradename_dict[cui]][:20] if cui in tradename_dict else []
 
-# MRCONSO file from UMLS (current version 2018AB)
-MRCONSO_FILE = '/Users/lucyw/git/hack19_supplements/data/MRCONSO.RRF'
 
-# MRDEF file from UMLS (current version 2018AB)
-MRDEF_FILE = '/Users/lucyw/git/hack19_supplements/data/MRDEF.RRF'
+def needs_update(cui: str, entry: Dict, pref_name_dict: Dict, tradename_dict: Dict, is_drug: bool) -> bool:
+    """
+    Whether a cluster is new or its preferred name or tradenames changed
+    :param cui:
+    :param entry: cluster entry
+    :param pref_name_dict:
+    :param tradename_dict: None if tradenames are not available
+    :param is_drug:
+    :return:
+    """
+    if any(key not in entry for key in ['preferred_name', 'synonyms', 'definition']):
+        return True
+    if cui in pref_name_dict and entry['preferred_name'] != pref_name_dict[cui]:
+        return True
+    if is_drug and tradename_dict is not None and entry.get('tradenames') != get_tradenames(cui, tradename_dict):
+        return True
+    return False
+
+
+def cui_metadata(cui: str, names: List[Tuple[str, str]], definition: str, pref_name_dict: Dict) -> Dict:
+    """
+    Preferred name, synonyms, and definition of a cluster
+    :param cui:
+    :param names: (tty, name) in MRCONSO order
+    :param definition:
+    :param pref_name_dict:
+    :return:
+    """
+    synonyms = process_synonyms([(TTY_sort_order[tty], tty, name) for tty, name in names])
+    if cui in pref_name_dict:
+        pref_name = pref_name_dict[cui]
+    elif synonyms:
+        pref_name = synonyms[0].title() if len(synonyms[0]) > 4 else synonyms[0]
+        synonyms = synonyms[1:]
+    else:
+        print(f'No UMLS names for {cui}!')
+        pref_name = cui
+    return {
+        "preferred_name": pref_name,
+        "synonyms": synonyms,
+        "definition": definition
+    }
+
+
+# CUI cluster file
+CUI_FILE = 'data/cui_clusters.json'
 
 # Drug tradename file
 DRUG_TRADENAME_FILE = '/Users/lucyw/git/hack19_supplements/data/tradename_mapping.json'
@@ -48,63 +102,56 @@ TTY_sort_order = {"MH": 0,                      # main heading, supplementary co
 TTY_sort_order = defaultdict(lambda: 5, TTY_sort_order)
 
 
-# read CUI dict
-with open(CUI_FILE, 'r') as f:
-    cui_dict = json.load(f)
-
-all_cuis = set(cui_dict['supplements'].keys()) | set(cui_dict['drugs'].keys())
-
-# read tradenames
-with open(DRUG_TRADENAME_FILE, 'r') as f:
-    tradename_dict = json.load(f)
-
-# read preferred names
-with open(PREFERRED_NAME_FILE, 'r') as f:
-    pref_name_dict = json.load(f)
-
-# read UMLS names and aliases from MRCONSO.RRF, and populate cui_to_names
-cui_to_all_names = defaultdict(list)
-with open(MRCONSO_FILE, mode='r') as mrconso_file:
-    for line in tqdm.tqdm(mrconso_file, desc=f"reading {MRCONSO_FILE}"):
-        splits = line.strip().split('|')
-        cui, lang, tty, name = splits[0], splits[1], splits[12], splits[14]
-        # keep only english language names
-        if cui in all_cuis and lang == 'ENG':
-            cui_to_all_names[cui].append((TTY_sort_order[tty], tty, name))
-
-# read UMLS definitions from MRDEF.RRF, and populate cui_to_def
-cui_to_def = defaultdict(str)
-with open(MRDEF_FILE, mode='r') as mrdef_file:
-    for line in tqdm.tqdm(mrdef_file, desc=f"reading {MRDEF_FILE}"):
-        splits = line.strip().split('|')
-        cui, def_text = splits[0], splits[5]
-        if cui in all_cuis and def_text and not cui_to_def[cui]:
-            cui_to_def[cui] = def_text
-
-# add metadata to supplement CUIs
-for k, v in cui_dict['supplements'].items():
-    synonyms = process_synonyms(cui_to_all_names[k])
-    if k in pref_name_dict:
-        pref_name = pref_name_dict[k]
-    else:
-        pref_name = synonyms[0].title() if len(synonyms[0]) > 4 else synonyms[0]
-        synonyms = synonyms[1:]
-    v['preferred_name'] = pref_name
-    v['synonyms'] = synonyms
-    v['definition'] = cui_to_def[k]
-
-# add metadata to drug CUIs
-for k, v in cui_dict['drugs'].items():
-    synonyms = process_synonyms(cui_to_all_names[k])
-    if k in pref_name_dict:
-        pref_name = pref_name_dict[k]
-    else:
-        pref_name = synonyms[0].title() if len(synonyms[0]) > 4 else synonyms[0]
-        synonyms = synonyms[1:]
-    v['preferred_name'] = pref_name
-    v['synonyms'] = synonyms
-    v['definition'] = cui_to_def[k]
-    v['tradenames'] = [trade[1] for trade in tradename_dict[k]][:20] if k in tradename_dict else []
-
-with open(CUI_FILE, 'w') as outf:
-    json.dump(cui_dict, outf, indent=4, sort_keys=True)
\ No newline at end of file
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('cuis', nargs='*', help='clusters to update even if unchanged')
+    parser.add_argument('--all', action='store_true', help='update all clusters')
+    parser.add_argument('--umls-store', default=UMLS_STORE_FILE)
+    args = parser.parse_args()
+
+    if not os.path.exists(args.umls_store):
+        print(f'{args.umls_store} not found; build it with scripts/build_umls_store.py <MRCONSO.RRF> <MRDEF.RRF>')
+        sys.exit(1)
+
+    # read CUI dict
+    with open(CUI_FILE, 'r') as f:
+        cui_dict = json.load(f)
+
+    # read tradenames (existing tradenames are kept if the file is not available)
+    tradename_dict = None
+    if os.path.exists(DRUG_TRADENAME_FILE):
+        with open(DRUG_TRADENAME_FILE, 'r') as f:
+            tradename_dict = json.load(f)
+
+    # read preferred names
+    with open(PREFERRED_NAME_FILE, 'r') as f:
+        pref_name_dict = json.load(f)
+
+    # clusters to update
+    to_update = []
+    for cluster_type in ['supplements', 'drugs']:
+        for k, v in cui_dict[cluster_type].items():
+            if args.all or k in args.cuis or needs_update(k, v, pref_name_dict, tradename_dict, cluster_type == 'drugs'):
+                to_update.append((cluster_type, k))
+    print(f'Updating {len(to_update)} of {len(cui_dict["supplements"]) + len(cui_dict["drugs"])} clusters.')
+
+    # look up UMLS names and definitions of those clusters only
+    umls_store = UMLSStore(args.umls_store)
+    cui_to_names = umls_store.get_names(k for _, k in to_update)
+    cui_to_def = umls_store.get_definitions(k for _, k in to_update)
+    umls_store.close()
+
+    # add metadata to supplement and drug CUIs
+    for cluster_type, k in to_update:
+        v = cui_dict[cluster_type][k]
+        v.update(cui_metadata(k, cui_to_names.get(k, []), cui_to_def.get(k, ''), pref_name_dict))
+        if cluster_type == 'drugs':
+            if tradename_dict is not None:
+                v['tradenames'] = get_tradenames(k, tradename_dict)
+            else:
+                v.setdefault('tradenames', [])
+
+    with open(CUI_FILE, 'w') as outf:
+        json.dump(cui_dict, outf, indent=4, sort_keys=True)
+
+    print('done.')
@@ -0,0 +1,82 @@
+"""
+Propagate a CUI cluster file change without rerunning NER or DDI over all papers (see suppai.cluster_impact)
+Candidates for pairs that became valid are written to a new run directory and config/log.json is pointed at it;
+then run BERT-DDI on that directory and postprocess, which re-aggregates all runs with the new clusters
+Usage: python scripts/apply_cluster_change.py <previous cluster file> [<current cluster file>]
+
+"""
+
+import os
+import sys
+import json
+import glob
+from datetime import datetime
+
+from suppai.cui_handler import CUIHandler, CUI_FILE
+from suppai.cluster_impact import RawCuiIndex, diff_clusters, find_new_candidates, ENTITY_RECORD, CANDIDATE_RECORD
+
+
+DATA_DIR = '/net/s3/s2-research/lucyw/suppai-data/'
+INDEX_FILE = os.path.join(DATA_DIR, 'raw_cui_index.sqlite')
+LOG_FILE = 'config/log.json'
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    old_handler = CUIHandler(sys.argv[1])
+    new_handler = CUIHandler(sys.argv[2] if len(sys.argv) > 2 else CUI_FILE)
+
+    diff = diff_clusters(old_handler, new_handler)
+    print(f'{len(diff.added_clusters)} clusters added, {len(diff.removed_clusters)} removed.')
+    print(f'{len(diff.type_changed)} member CUIs changed type, {len(diff.cluster_changed)} moved between clusters.')
+
+    # index raw CUIs of all runs (only new or modified files are read)
+    index = RawCuiIndex(INDEX_FILE)
+    num_indexed = index.add_files(sorted(glob.glob(os.path.join(DATA_DIR, '*', 's2_entities', 'entities.jsonl.*'))), ENTITY_RECORD)
+    num_indexed += index.add_files(sorted(glob.glob(os.path.join(DATA_DIR, '*', 's2_supp_sents', '*.jsonl'))), CANDIDATE_RECORD)
+    print(f'{num_indexed} files indexed.')
+
+    new_candidates = find_new_candidates(index, diff, new_handler)
+    index.close()
+    print(f'{len(new_candidates)} new candidate pairs to classify.')
+
+    with open(LOG_FILE, 'r') as f:
+        log_dict = json.load(f)
+
+    # determine output file name (same scheme as preprocess)
+    header_time = datetime.now().strftime('%Y%m%d')
+    addendum_num = 1
+    while os.path.exists(f'output/{header_time}_{addendum_num:02d}.tar.gz'):
+        addendum_num += 1
+    header_str = f'{header_time}_{addendum_num:02d}'
+
+    if new_candidates:
+        base_dir = os.path.join(DATA_DIR, header_str)
+        supp_sents_dir = os.path.join(base_dir, 's2_supp_sents')
+        ddi_output_dir = os.path.join(base_dir, 'ddi_output')
+        os.makedirs(supp_sents_dir, exist_ok=True)
+        os.makedirs(ddi_output_dir, exist_ok=True)
+        with open(os.path.join(supp_sents_dir, f'supp_sentences_{header_str}.jsonl'), 'w') as out_f:
+            for candidate in new_candidates:
+                json.dump(candidate, out_f)
+                out_f.write('\n')
+        log_dict["supp_sents_dir"] = supp_sents_dir
+        log_dict["ddi_output_dir"] = ddi_output_dir
+
+    # paper timestamp is unchanged: no new papers were fetched
+    log_dict["header_str"] = header_str
+    log_dict["aggregate"] = True
+    log_dict["output_file"] = f'output/{header_str}.tar.gz'
+    with open(LOG_FILE, 'w') as out_f:
+        json.dump(log_dict, out_f, indent=4)
+
+    if new_candidates:
+        print(f'Next: classify {log_dict["supp_sents_dir"]} (scripts/run_beaker.py or scripts/run_local_ddi.py), '
+              f'then run scripts/postprocess.py')
+    else:
+        print('Next: run scripts/postprocess.py')
+
+    print('done.')
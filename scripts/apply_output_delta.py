@@ -0,0 +1,29 @@
+"""
+Apply a release delta to a previous release tarball and write the new release (in the new release's format,
+identical to the tarball postprocess wrote)
+Usage: python scripts/apply_output_delta.py <previous.tar.gz> <delta.json.gz> <output.tar.gz>
+
+"""
+
+import os
+import sys
+import tempfile
+
+from suppai.output_delta import apply_release_delta, delta_summary
+
+
+if __name__ == '__main__':
+    if len(sys.argv) != 4:
+        print(__doc__)
+        sys.exit(1)
+
+    previous_release_file, delta_file, output_file = sys.argv[1:]
+
+    print(f'Applying {delta_file} to {previous_release_file}...')
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output_file))) as work_dir:
+        delta = apply_release_delta(previous_release_file, delta_file, output_file, work_dir)
+    print(f'Applied delta: {delta_summary(delta)}')
+    print(f'Release {delta["meta"]["last_updated_on"]} ({delta.get("output", {}).get("format", "legacy")}) '
+          f'written to {output_file}')
+
+    print('done.')
@@ -0,0 +1,119 @@
+"""
+Benchmark name index search: mean, p50, and p99 latency per query kind (1-2 character prefixes, longer prefixes,
+inner-word prefixes, misspellings) over names of a release's name index, or of a synthetic index of --num-cuis CUIs
+Usage: python scripts/benchmark_name_index.py [--index-file FILE | --num-cuis N] [--queries N]
+
+"""
+
+import time
+import random
+import argparse
+import statistics
+from typing import Dict, List
+
+from suppai.name_index import NameIndex, build_name_index
+
+
+# onset + vowel + coda syllables, giving about as many distinct trigrams per name as UMLS names have
+SYLLABLES = [
+    onset + vowel + coda
+    for onset in ['', 'b', 'c', 'd', 'f', 'g', 'h', 'k', 'l', 'm', 'n', 'p', 'r', 's', 't', 'v', 'x', 'z', 'ch', 'ph',
+                  'th', 'tr', 'cl', 'pr', 'st']
+    for vowel in ['a', 'e', 'i', 'o', 'u', 'y', 'ae', 'ou']
+    for coda in ['', 'n', 'l', 'r', 's', 'x', 'm', 't', 'ne', 'de', 'te', 'ol', 'in']
+]
+
+
+def synthetic_cui_dict(num_cuis: int, seed: int = 0) -> Dict[str, Dict]:
+    """
+    CUI metadata with random chemical-looking names (about three names per CUI)
+    :param num_cuis:
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+
+    def _name():
+        words = [''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))) for _ in range(rng.randint(1, 3))]
+        return ' '.join(words)
+
+    return {
+        f'C{i:07d}': {
+            "ent_type": rng.choice(["supplement", "drug"]),
+            "preferred_name": _name().title(),
+            "synonyms": [_name() for _ in range(rng.randint(0, 3))],
+            "tradenames": [_name().title() for _ in range(rng.randint(0, 1))]
+        } for i in range(num_cuis)
+    }
+
+
+def sample_queries(index: NameIndex, num_queries: int, seed: int = 0) -> Dict[str, List[str]]:
+    """
+    Queries per kind, cut from names in the index
+    :param index:
+    :param num_queries: per kind
+    :param seed:
+    :return:
+    """
+    rng = random.Random(seed)
+    names = [name[1] for name in index.names]
+    queries = {"short_prefix": [], "prefix": [], "inner_word": [], "misspelled": []}
+    while min(len(q) for q in queries.values()) < num_queries:
+        name = rng.choice(names)
+        queries["short_prefix"].append(name[:rng.randint(1, 2)])
+        queries["prefix"].append(name[:rng.randint(3, max(3, len(name)))])
+        words = name.split(' ')
+        if len(words) > 1:
+            word = rng.choice(words[1:])
+            queries["inner_word"].append(word[:rng.randint(3, max(3, len(word)))])
+        if len(name) > 5:
+            position = rng.randrange(1, len(name) - 1)
+            queries["misspelled"].append(name[:position] + name[position + 1:])
+    return {kind: q[:num_queries] for kind, q in queries.items()}
+
+
+def benchmark(index: NameIndex, queries: Dict[str, List[str]], limit: int = 10) -> Dict[str, Dict[str, float]]:
+    """
+    Latency per query kind
+    :param index:
+    :param queries: query kind -> queries
+    :param limit:
+    :return: query kind -> mean, p50, p99 (milliseconds)
+    """
+    results = dict()
+    for kind, kind_queries in queries.items():
+        latencies = []
+        for query in kind_queries:
+            start_time = time.perf_counter()
+            index.search(query, limit=limit)
+            latencies.append((time.perf_counter() - start_time) * 1000)
+        latencies.sort()
+        results[kind] = {
+            "mean": statistics.mean(latencies),
+            "p50": latencies[len(latencies) // 2],
+            "p99": latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+        }
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--index-file', help='name index of a release (default: build a synthetic index)')
+    parser.add_argument('--num-cuis', type=int, default=26000, help='CUIs of the synthetic index')
+    parser.add_argument('--queries', type=int, default=2000, help='queries per kind')
+    parser.add_argument('--limit', type=int, default=10)
+    args = parser.parse_args()
+
+    if args.index_file:
+        index = NameIndex.load(args.index_file)
+    else:
+        print(f'Building a synthetic index of {args.num_cuis} CUIs...')
+        start_time = time.time()
+        index = NameIndex(build_name_index(synthetic_cui_dict(args.num_cuis)))
+        print(f'Built in {time.time() - start_time:.1f}s')
+    print(f'{len(index)} names.')
+
+    for kind, stats in benchmark(index, sample_queries(index, args.queries), args.limit).items():
+        print(f'  {kind}: mean {stats["mean"]:.3f} ms, p50 {stats["p50"]:.3f} ms, p99 {stats["p99"]:.3f} ms')
+
+    print('done.')
@@ -0,0 +1,40 @@
+"""
+Build a restricted UMLS KB and ANN index for the NER linker (see suppai.restricted_kb)
+By default concepts of the kept semantic types are included; with --clusters only CUI cluster members are included
+With --mentions (a file of corpus mention strings, one per line), distractors are also searched for those mentions
+and the agreement of the full and restricted linkers on them is recorded in the manifest
+Usage: python scripts/build_restricted_kb.py [--output-dir DIR] [--clusters] [--no-distractors] [--mentions FILE]
+
+"""
+
+import argparse
+
+from suppai.cui_handler import CUIHandler
+from suppai.restricted_kb import build_restricted_kb, RESTRICTED_KB_DIR
+from suppai.ner_and_linker import BETTER_SCORE_THRESHOLD
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--output-dir', default=RESTRICTED_KB_DIR)
+    parser.add_argument('--clusters', action='store_true', help='only keep CUI cluster members')
+    parser.add_argument('--no-distractors', action='store_true', help='do not add distractor concepts')
+    parser.add_argument('--threshold', type=float, default=BETTER_SCORE_THRESHOLD, help='distractor similarity threshold')
+    parser.add_argument('--mentions', help='file of corpus mention strings (one per line)')
+    args = parser.parse_args()
+
+    keep_cuis = CUIHandler().valid_cuis if args.clusters else None
+    mentions = None
+    if args.mentions:
+        with open(args.mentions, 'r') as f:
+            mentions = [line.strip() for line in f if line.strip()]
+    manifest = build_restricted_kb(
+        args.output_dir,
+        keep_cuis=keep_cuis,
+        distractors=not args.no_distractors,
+        threshold=args.threshold,
+        mentions=mentions
+    )
+    print(f"{manifest['num_concepts']} concepts written to {args.output_dir}")
+
+    print('done.')
@@ -0,0 +1,23 @@
+"""
+Convert UMLS MRCONSO.RRF and MRDEF.RRF into the indexed local UMLS store (see suppai.umls_store)
+Usage: python scripts/build_umls_store.py <MRCONSO.RRF> <MRDEF.RRF> [<store file>]
+
+"""
+
+import sys
+
+from suppai.umls_store import UMLSStore, UMLS_STORE_FILE
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 3:
+        print(__doc__)
+        sys.exit(1)
+
+    store_file = sys.argv[3] if len(sys.argv) > 3 else UMLS_STORE_FILE
+    umls_store = UMLSStore(store_file)
+    umls_store.build(sys.argv[1], sys.argv[2])
+    print(f'{len(umls_store)} CUIs with English names in {store_file}')
+    umls_store.close()
+
+    print('done.')
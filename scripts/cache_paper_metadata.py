@@ -0,0 +1,25 @@
+"""
+Add paper metadata from downloaded S2 papers dataset shards to the local metadata cache
+Usage: python scripts/cache_paper_metadata.py <papers shard> [<papers shard> ...]
+
+"""
+
+import sys
+
+from suppai.paper_metadata import PaperMetadataCache, cache_papers_shards
+from suppai.utils.db_utils import PAPER_METADATA_CACHE
+
+
+if __name__ == '__main__':
+    if len(sys.argv) < 2:
+        print(__doc__)
+        sys.exit(1)
+
+    cache = PaperMetadataCache(PAPER_METADATA_CACHE)
+    for shard_file in sys.argv[1:]:
+        num_cached = cache_papers_shards(cache, [shard_file])
+        print(f'{num_cached} papers cached from {shard_file}')
+    print(f'{len(cache)} papers in {PAPER_METADATA_CACHE}')
+    cache.close()
+
+    print('done.')
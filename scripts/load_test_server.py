@@ -0,0 +1,169 @@
+"""
+Local load test of the query server: keep-alive connections request random CUIs, interactions, evidence pages, and
+papers of the latest release, then p50/p99 latency and requests per second are reported per endpoint
+Unless --port is given, a server is started on a free port for the test
+Usage: python scripts/load_test_server.py [--port PORT] [--connections N] [--duration SECONDS]
+
+"""
+
+import os
+import sys
+import time
+import socket
+import random
+import asyncio
+import argparse
+import tempfile
+import itertools
+import subprocess
+from collections import defaultdict
+from typing import Dict, List, Tuple
+
+from suppai.query_server import Release, latest_release, OUTPUT_DIR
+
+
+# keys sampled per dataset
+SAMPLE_SIZE = 2000
+
+
+def sample_targets(output_dir: str) -> Dict[str, List[str]]:
+    """
+    Request targets per endpoint, from keys of the latest release
+    :param output_dir:
+    :return:
+    """
+    tar_file = latest_release(output_dir)
+    if tar_file is None:
+        print(f'No release in {output_dir}')
+        sys.exit(1)
+    # a separate work dir, so a running server's extracted bundle is left alone
+    with tempfile.TemporaryDirectory() as work_dir:
+        release = Release(tar_file, work_dir)
+        try:
+            cuis = list(itertools.islice(release.keys("cuis"), SAMPLE_SIZE))
+            interaction_ids = list(itertools.islice(release.keys("sentences"), SAMPLE_SIZE))
+            paper_ids = list(itertools.islice(release.keys("papers"), SAMPLE_SIZE))
+        finally:
+            release.close(wait=True)
+    return {
+        "cui": [f'/cui/{cui}' for cui in cuis],
+        "interactions": [f'/cui/{cui}/interactions' for cui in cuis],
+        "sentences": [f'/interaction/{i}/sentences?offset={offset}&limit=20'
+                      for i in interaction_ids for offset in (0, 20)],
+        "paper": [f'/paper/{paper_id}' for paper_id in paper_ids]
+    }
+
+
+async def _request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str) -> int:
+    writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    content_length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            content_length = int(value)
+    await reader.readexactly(content_length)
+    return status
+
+
+async def _client(host: str, port: int, targets: Dict[str, List[str]], deadline: float,
+                  results: List[Tuple[str, float, int]]):
+    reader, writer = await asyncio.open_connection(host, port)
+    endpoints = [endpoint for endpoint, endpoint_targets in targets.items() if endpoint_targets]
+    try:
+        while time.perf_counter() < deadline:
+            endpoint = random.choice(endpoints)
+            start = time.perf_counter()
+            status = await _request(reader, writer, random.choice(targets[endpoint]))
+            results.append((endpoint, time.perf_counter() - start, status))
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    return sorted_values[min(len(sorted_values) - 1, int(q * len(sorted_values)))]
+
+
+async def run_load_test(host: str, port: int, targets: Dict[str, List[str]], connections: int, duration: float):
+    results = []
+    # warm-up request so the first client does not pay for the release load
+    reader, writer = await asyncio.open_connection(host, port)
+    await _request(reader, writer, '/meta')
+    writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host, port, targets, start + duration, results) for _ in range(connections)
+    ])
+    elapsed = time.perf_counter() - start
+
+    by_endpoint = defaultdict(list)
+    for endpoint, latency, status in results:
+        by_endpoint[endpoint].append((latency, status))
+        by_endpoint["all"].append((latency, status))
+
+    print(f'{len(results)} requests in {elapsed:.1f}s over {connections} connections')
+    print(f'{"endpoint":<14}{"requests":>10}{"rps":>10}{"p50 ms":>10}{"p99 ms":>10}{"errors":>8}')
+    for endpoint in sorted(by_endpoint, key=lambda e: (e == "all", e)):
+        latencies = sorted(latency for latency, _ in by_endpoint[endpoint])
+        errors = sum(1 for _, status in by_endpoint[endpoint] if status >= 500)
+        print(f'{endpoint:<14}{len(latencies):>10}{len(latencies) / elapsed:>10.0f}'
+              f'{percentile(latencies, 0.5) * 1000:>10.2f}{percentile(latencies, 0.99) * 1000:>10.2f}{errors:>8}')
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def _wait_for_port(port: int, timeout: float):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.2)
+    raise TimeoutError(f'Server did not start on port {port}')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, help='port of a running server (default: start one)')
+    parser.add_argument('--output-dir', default=OUTPUT_DIR)
+    parser.add_argument('--connections', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds')
+    parser.add_argument('--startup-timeout', type=float, default=600.0,
+                        help='seconds to wait for a started server to load the release')
+    args = parser.parse_args()
+
+    print('Sampling request targets...')
+    targets = sample_targets(args.output_dir)
+    if not any(targets.values()):
+        print('The release is empty')
+        sys.exit(1)
+
+    server_process = None
+    port = args.port
+    if port is None:
+        port = _free_port()
+        server_process = subprocess.Popen([
+            sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve_release.py'),
+            '--port', str(port), '--output-dir', args.output_dir
+        ])
+        _wait_for_port(port, args.startup_timeout)
+
+    try:
+        asyncio.run(run_load_test(args.host, port, targets, args.connections, args.duration))
+    finally:
+        if server_process:
+            server_process.terminate()
+            server_process.wait()
+
+    print('done.')
@@ -10,29 +10,39 @@ import json
 import glob
 import tqdm
 import gzip
-import tarfile
-from typing import List, Dict, Tuple, Set
+from typing import List, Dict, Tuple, Set, Optional, Mapping
 from collections import defaultdict, Counter
 import copy
 import re
+import hashlib
 
+from suppai import metrics
 from suppai.cui_handler import CUIHandler
+from suppai.evidence_store import EvidenceStore, EvidenceList, JsonSentenceDict, select_top_evidence
+from suppai.interaction_graph import interaction_aggregates, write_interaction_graph
+from suppai.name_index import write_name_index
+from suppai.output_delta import (
+    load_release, write_legacy_release, write_sharded_release, compute_release_delta, apply_delta, delta_summary,
+    write_delta, LEGACY_OUTPUT
+)
+from suppai.packaging import release_mtime
+from suppai.query_index import build_query_index
 from suppai.utils.db_utils import get_paper_metadata_no_sha
 from suppai.utils.list_utils import chunk_iter
 from suppai.data import CUIMetadata, PaperAuthor, PaperMetadata, LabeledSpan, EvidenceSentence
 
 
-def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> List[EvidenceSentence]:
+def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> EvidenceStore:
     """
     Read all inputs from input directories and keep only those with
     :param input_dirs:
     :param label_dirs:
     :return:
     """
-    positives = []
+    positives = EvidenceStore()
     total_sents = 0
 
-    # uniq_set (k = paper_id, v = set((sentence, arg1, arg2)))
+    # uniq_set (k = paper_id, v = set(digest of (sentence, arg1, arg2)))
     uniq_set = defaultdict(set)
     uniq_id = 0
 
@@ -48,15 +58,16 @@ def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> List[Evidenc
             if not os.path.exists(label_file):
                 print(f"Label file doesn't exist! {label_file}")
 
-            # read labels and keep only positives
-            positive_keys = set([])
+            # read labels and keep only positives (k = id, v = positive class probability)
+            positive_keys = dict()
             with open(label_file, 'r') as lab_f:
                 for line_index, line in enumerate(tqdm.tqdm(lab_f, desc=f"reading {label_file}")):
                     if 0 < READ_TOP_K_LINES <= line_index:
                         break
+                    metrics.incr("postprocess.bytes_read", len(line))
                     entry = json.loads(line)
                     if int(entry["label-model"]) == 1:
-                        positive_keys.add(entry["id"])
+                        positive_keys[entry["id"]] = positive_confidence(entry)
 
             # get sentence info for positive sentences
             with open(in_file, 'r') as in_f:
@@ -64,6 +75,8 @@ def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> List[Evidenc
                     total_sents += 1
                     if 0 < READ_TOP_K_LINES <= line_index:
                         break
+                    metrics.incr("postprocess.bytes_read", len(line))
+                    metrics.incr("postprocess.candidates")
                     entry = json.loads(line)
                     pid, _ = entry['id'].split('-')
                     arg1_cui = handler.normalize_cui(entry['arg1']['id'])
@@ -79,7 +92,11 @@ def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> List[Evidenc
                     if entry["id"] in positive_keys:
                         # add sentence if sentence and entity pair does not already exist
                         # (filters for duplicate sentences w/ the same entity mentions)
-                        if (entry['sentence'], arg1_cui, arg2_cui) in uniq_set[pid]:
+                        uniq_key = hashlib.blake2b(
+                            f"{entry['sentence']}\t{arg1_cui}\t{arg2_cui}".encode('utf-8'), digest_size=16
+                        ).digest()
+                        if uniq_key in uniq_set[pid]:
+                            metrics.incr("postprocess.duplicates")
                             continue
                         else:
                             new_evidence = EvidenceSentence(
@@ -87,56 +104,67 @@ def keep_positives(input_dirs: List[str], label_dirs: List[str]) -> List[Evidenc
                                 paper_id=pid,
                                 sentence_id=entry['sentence_id'],
                                 sentence=re.sub(r'\s', ' ', entry['sentence']),
-                                confidence=None,
+                                confidence=positive_keys[entry["id"]],
                                 arg1=LabeledSpan(id=arg1_cui, span=span1_inds),
                                 arg2=LabeledSpan(id=arg2_cui, span=span2_inds)
                             )
                             positives.append(new_evidence)
-                            uniq_set[pid].add(
-                                (entry['sentence'], arg1_cui, arg2_cui)
-                            )
+                            metrics.incr("postprocess.positives")
+                            uniq_set[pid].add(uniq_key)
                             uniq_id += 1
 
     print(f'{len(positives)} positive sentences out of {total_sents}.')
     return positives
 
 
+def positive_confidence(label_entry: Dict) -> Optional[float]:
+    """
+    Model probability of the positive class for a label entry (None if probs were not output)
+    :param label_entry:
+    :return:
+    """
+    probs = label_entry.get("probs")
+    if not probs:
+        return None
+    return float(probs[1])
+
+
 def create_interaction_sentence_dicts(
-        positives: List[EvidenceSentence], blocklist: List[str]
-) -> Tuple[Dict, Dict, List]:
+        positives: EvidenceStore, blocklist: List[str]
+) -> Tuple[Dict, Dict[str, EvidenceList], List]:
     """
     Create interaction and sentence dicts
     :param positives:
     :param blocklist:
-    :return:
+    :return: interaction dict, sentence dict (interaction id -> rows of positives), skipped (reason, row)
     """
     # initialize
     interaction_dict = defaultdict(set)
-    sentence_dict = defaultdict(list)
+    sentence_dict = defaultdict(lambda: EvidenceList(positives))
     skip_list = []
 
     # create CUI handler
     handler = CUIHandler()
 
-    for pos in tqdm.tqdm(positives):
+    for row, pos in enumerate(tqdm.tqdm(positives, total=len(positives))):
         # skip if sentence empty
         if not pos.sentence:
-            skip_list.append(('empty_sentence', pos))
+            skip_list.append(('empty_sentence', row))
             continue
 
         # if either cui are not normalizable
         if not pos.arg1.id or not pos.arg2.id:
-            skip_list.append(('missing_cuis', pos))
+            skip_list.append(('missing_cuis', row))
             continue
 
         # if CUIs are the same, skip
         if pos.arg1.id == pos.arg2.id:
-            skip_list.append(('same_cuis', pos))
+            skip_list.append(('same_cuis', row))
             continue
 
         # if not one supplement and one drug or both supplements, skip
         if not handler.is_supp_drug(pos.arg1.id, pos.arg2.id) and not handler.is_supp_supp(pos.arg1.id, pos.arg2.id):
-            skip_list.append(('no_supps', pos))
+            skip_list.append(('no_supps', row))
             continue
 
         # if any of the spans are in blocklist
@@ -144,31 +172,31 @@ def create_interaction_sentence_dicts(
         span2_lower = pos.sentence[pos.arg2.span[0]:pos.arg2.span[1]].strip(' .,').lower()
 
         if span1_lower in blocklist or span2_lower in blocklist:
-            skip_list.append(('block_list', pos))
+            skip_list.append(('block_list', row))
             continue
 
         # if either span starts or ends with compound(s)
         if span1_lower.startswith("compound") or span1_lower.endswith("compound") or span1_lower.endswith("compounds"):
-            skip_list.append(('compound_str', pos))
+            skip_list.append(('compound_str', row))
             continue
         if span2_lower.startswith("compound") or span2_lower.endswith("compound") or span2_lower.endswith("compounds"):
-            skip_list.append(('compound_str', pos))
+            skip_list.append(('compound_str', row))
             continue
 
         # if 'atp' linked to azathioprine
         if pos.arg1.id == 'C0004482' and span1_lower == 'atp':
-            skip_list.append(('atp_str', pos))
+            skip_list.append(('atp_str', row))
             continue
         if pos.arg2.id == 'C0004482' and span2_lower == 'atp':
-            skip_list.append(('atp_str', pos))
+            skip_list.append(('atp_str', row))
             continue
 
         # if 'ca2' linked to infliximab
         if pos.arg1.id == 'C0666743' and (span1_lower == 'ca2' or span1_lower == 'ca2+'):
-            skip_list.append(('ca2_str', pos))
+            skip_list.append(('ca2_str', row))
             continue
         if pos.arg2.id == 'C0666743' and (span2_lower == 'ca2' or span2_lower == 'ca2+'):
-            skip_list.append(('ca2_str', pos))
+            skip_list.append(('ca2_str', row))
             continue
 
         # construct interaction id
@@ -179,12 +207,12 @@ def create_interaction_sentence_dicts(
         interaction_dict[pos.arg2.id].add(interaction_id)
 
         # add interaction sentence to sentence dict
-        sentence_dict[interaction_id].append(pos)
+        sentence_dict[interaction_id].append(row)
 
     return interaction_dict, sentence_dict, skip_list
 
 
-def create_cui_metadata_dict(interaction_dict: Dict[str, Set], sentence_dict: Dict[str, List[EvidenceSentence]]):
+def create_cui_metadata_dict(interaction_dict: Dict[str, Set], sentence_dict: Dict[str, EvidenceList]):
     """
     Create CUI metadata dict
     :param interaction_dict:
@@ -230,11 +258,11 @@ def create_cui_metadata_dict(interaction_dict: Dict[str, Set], sentence_dict: Di
 
 def create_paper_metadata_dict(
         interaction_dict: Dict[str, Set],
-        sentence_dict: Dict[str, List[EvidenceSentence]],
+        sentence_dict: Dict[str, EvidenceList],
         cui_dict: Dict[str, CUIMetadata]
 ) -> Tuple[
     Dict[str, Set],
-    Dict[str, List[EvidenceSentence]],
+    Dict[str, EvidenceList],
     Dict[str, CUIMetadata],
     Dict[str, PaperMetadata]
 ]:
@@ -246,11 +274,10 @@ def create_paper_metadata_dict(
     :return:
     """
     # get the set of paper ids
-    all_paper_ids = []
+    all_paper_ids = set()
     for entries in sentence_dict.values():
-        for entry in entries:
-            all_paper_ids.append(entry.paper_id)
-    all_paper_ids = list(set(all_paper_ids))
+        all_paper_ids.update(entries.paper_ids())
+    all_paper_ids = list(all_paper_ids)
     print(f'{len(all_paper_ids)} papers')
 
     # initialize metadata dict
@@ -277,7 +304,7 @@ def create_paper_metadata_dict(
 
     # get paper metadata from DB
     print(f'fetching paper metadata ({len(all_paper_ids)})...')
-    chunk_size = 1000
+    chunk_size = PAPER_METADATA_CHUNK_SIZE
     for paper_chunk_index, paper_chunk in enumerate(
             tqdm.tqdm(chunk_iter(all_paper_ids, chunk_size), total=(len(all_paper_ids) // chunk_size + 1),
                       desc='Fetching paper metadata')):
@@ -307,7 +334,7 @@ def create_paper_metadata_dict(
     interactions_to_remove = []
     if paper_ids_to_remove:
         for interaction_id, sentences in sentence_dict.items():
-            new_sents = [sent for sent in sentences if sent.paper_id not in paper_ids_to_remove]
+            new_sents = sentences.filter(lambda store, row: store.paper_id(row) not in paper_ids_to_remove)
             if new_sents:
                 sentence_dict[interaction_id] = new_sents
             else:
@@ -329,67 +356,163 @@ def create_paper_metadata_dict(
     return interaction_dict, sentence_dict, cui_dict, paper_metadata_dict
 
 
-def form_dicts(interactions: List[EvidenceSentence], output_file: str, blocklist_spans: List[str], timestr: str):
+def form_dicts(
+        interactions: EvidenceStore,
+        output_file: str,
+        blocklist_spans: List[str],
+        timestr: str,
+        output_format: str = 'legacy',
+        query_index_file: Optional[str] = None,
+        graph_file: Optional[str] = None,
+        name_index_file: Optional[str] = None,
+        previous_release_file: Optional[str] = None,
+        max_sentences: int = 0,
+        check_delta: bool = False
+):
     """
     Create final dictionaries for supp.ai
     :param interactions:
     :param output_file:
     :param blocklist_spans:
     :param timestr:
+    :param output_format: "legacy" (four indented JSON dicts) or "sharded" (see suppai.output_bundle)
+    :param query_index_file: if given, also build a SQLite query index (see suppai.query_index)
+    :param graph_file: if given, also write the CSR interaction graph (see suppai.interaction_graph)
+    :param name_index_file: if given, also write the name autocomplete index (see suppai.name_index)
+    :param previous_release_file: if given, also write a delta from this release (see suppai.output_delta)
+    :param max_sentences: keep only the most confident sentences per interaction (0 keeps all)
+    :param check_delta: check that the delta reproduces this release (see write_release_delta)
     :return:
     """
     # CREATE INTERACTION IDS AND SENTENCE DICT
     print('Creating interaction and sentence dicts...')
-    interaction_dict, sentence_dict, skipped = create_interaction_sentence_dicts(interactions, blocklist_spans)
+    with metrics.timer("postprocess.interaction_dicts"):
+        interaction_dict, sentence_dict, skipped = create_interaction_sentence_dicts(interactions, blocklist_spans)
 
+    skip_reasons = Counter([s[0] for s in skipped])
+    for reason, count in skip_reasons.items():
+        metrics.incr(f"postprocess.skipped.{reason}", count)
     print(f'Skipped {len(skipped)} sentences: ')
-    print(Counter([s[0] for s in skipped]).most_common(10))
+    print(skip_reasons.most_common(10))
 
     # CREATE CUI METADATA DICT FROM ENTRIES IN INTERACTIONS
     print('Creating CUI metadata dict...')
-    interaction_dict, sentence_dict, cui_dict = create_cui_metadata_dict(interaction_dict, sentence_dict)
+    with metrics.timer("postprocess.cui_metadata"):
+        interaction_dict, sentence_dict, cui_dict = create_cui_metadata_dict(interaction_dict, sentence_dict)
 
     # CREATE PAPER METADATA DICT AND REMOVE MISSING ENTRIES FROM OTHER DICTS
     print('Creating paper metadata dict...')
-    interaction_dict, sentence_dict, cui_dict, paper_metadata_dict = create_paper_metadata_dict(interaction_dict, sentence_dict, cui_dict)
-
-    interaction_dict = {k: list(v) for k, v in interaction_dict.items()}
-    sentence_dict = {k: [s.as_json() for s in v] for k, v in sentence_dict.items()}
+    with metrics.timer("postprocess.paper_metadata"):
+        interaction_dict, sentence_dict, cui_dict, paper_metadata_dict = create_paper_metadata_dict(interaction_dict, sentence_dict, cui_dict)
+
+    # papers of all sentences (before the top-k cut) for the interaction graph aggregates
+    interaction_papers = {k: set(v.paper_ids()) for k, v in sentence_dict.items()} if graph_file else dict()
+
+    # RANK SENTENCES BY CONFIDENCE AND KEEP THE TOP ONES PER INTERACTION
+    with metrics.timer("postprocess.top_evidence"):
+        sentence_dict, sentence_counts = select_top_evidence(sentence_dict, max_sentences)
+    metrics.incr("postprocess.interactions", len(interaction_dict))
+    metrics.incr("postprocess.cuis", len(cui_dict))
+    metrics.incr("postprocess.papers", len(paper_metadata_dict))
+    print(f'Kept {sum(len(v) for v in sentence_dict.values())} of {sum(sentence_counts.values())} sentences.')
+
+    # interaction lists are sorted so identical releases serialize identically
+    interaction_dict = {k: sorted(v) for k, v in interaction_dict.items()}
+    # sentence entries are built from the evidence store as each interaction is written
+    sentence_dict = JsonSentenceDict(sentence_dict)
     cui_dict = {k: v.as_json() for k, v in cui_dict.items()}
     paper_metadata_dict = {k: v.as_json() for k, v in paper_metadata_dict.items()}
 
-    # output file names
-    interaction_file = 'output/interaction_id_dict.json'
-    sentence_file = 'output/sentence_dict.json'
-    paper_file = 'output/paper_metadata.json'
-    cui_file = 'output/cui_metadata.json'
-    meta_file = 'output/meta.json'
-
-    # write to output
-    with open(interaction_file, 'w') as out_f:
-        json.dump(interaction_dict, out_f, indent=4, sort_keys=True)
-    with open(sentence_file, 'w') as out_f:
-        json.dump(sentence_dict, out_f, indent=4, sort_keys=True)
-    with open(paper_file, 'w') as out_f:
-        json.dump(paper_metadata_dict, out_f, indent=4, sort_keys=True)
-    with open(cui_file, 'w') as out_f:
-        json.dump(cui_dict, out_f, indent=4, sort_keys=True)
-    with open(meta_file, 'w') as out_f:
-        json.dump({
-            "last_updated_on": timestr
-        }, out_f)
-
-    # tar and zip dicts together
-    with tarfile.open(output_file, "w:gz") as tar:
-        tar.add(interaction_file, arcname=os.path.split(interaction_file)[1])
-        tar.add(sentence_file, arcname=os.path.split(sentence_file)[1])
-        tar.add(paper_file, arcname=os.path.split(paper_file)[1])
-        tar.add(cui_file, arcname=os.path.split(cui_file)[1])
-        tar.add(meta_file, arcname=os.path.split(meta_file)[1])
+    datasets = {
+        "interactions": interaction_dict,
+        "sentences": sentence_dict,
+        "sentence_counts": sentence_counts,
+        "papers": paper_metadata_dict,
+        "cuis": cui_dict
+    }
+    meta = {"last_updated_on": timestr}
+    # archive members are dated with the release timestamp, so rebuilding a release gives an identical tarball
+    mtime = release_mtime(timestr)
+    # recorded in the delta, so applying it writes the release in the same format
+    output = {"format": "sharded", "compression": BUNDLE_COMPRESSION} if output_format == 'sharded' else LEGACY_OUTPUT
+
+    if query_index_file:
+        print(f'Building query index {query_index_file}...')
+        with metrics.timer("postprocess.query_index"):
+            build_query_index(
+                query_index_file, interaction_dict, sentence_dict, cui_dict, paper_metadata_dict, meta,
+                sentence_counts=sentence_counts
+            )
+
+    if graph_file:
+        print(f'Writing interaction graph {graph_file}...')
+        with metrics.timer("postprocess.interaction_graph"):
+            interaction_ids = set(i for interactions in interaction_dict.values() for i in interactions)
+            write_interaction_graph(
+                graph_file,
+                interaction_aggregates(interaction_ids, sentence_counts, interaction_papers, paper_metadata_dict),
+                meta
+            )
+
+    if name_index_file:
+        print(f'Writing name index {name_index_file}...')
+        with metrics.timer("postprocess.name_index"):
+            # CUIs with more interactions rank first among equal matches
+            write_name_index(name_index_file, cui_dict, {k: len(v) for k, v in interaction_dict.items()}, meta)
+
+    if previous_release_file:
+        with metrics.timer("postprocess.delta"):
+            write_release_delta(previous_release_file, datasets, meta, output_file.replace('.tar.gz', '.delta.json.gz'),
+                                output=output, check=check_delta)
+
+    with metrics.timer("postprocess.write_output"):
+        if output_format == 'sharded':
+            write_sharded_release(output_file, datasets, meta, BUNDLE_DIR, BUNDLE_COMPRESSION, mtime)
+        else:
+            write_legacy_release(output_file, datasets, meta, mtime=mtime)
+    if metrics.ENABLED and os.path.exists(output_file):
+        metrics.incr("postprocess.bytes_written", os.path.getsize(output_file))
+
+
+def write_release_delta(
+        previous_release_file: str,
+        datasets: Mapping[str, Mapping],
+        meta: Dict,
+        delta_file: str,
+        output: Optional[Dict] = None,
+        check: bool = False
+):
+    """
+    Write the patch from the previous release to this one
+    :param previous_release_file:
+    :param datasets:
+    :param meta:
+    :param delta_file:
+    :param output: output format of this release (see compute_delta)
+    :param check: also load the previous release, apply the delta, and compare with this release key by key
+                  (debugging; holds both releases in memory)
+    :return:
+    """
+    print(f'Computing delta from {previous_release_file}...')
+    delta = compute_release_delta(previous_release_file, datasets, meta, output)
+
+    if check:
+        old_datasets, old_meta = load_release(previous_release_file)
+        patched_datasets, _ = apply_delta(old_datasets, old_meta, delta)
+        del old_datasets
+        for name, data in datasets.items():
+            patched_data = patched_datasets.get(name, dict())
+            if len(patched_data) != len(data) or any(patched_data.get(k) != v for k, v in data.items()):
+                print(f'Delta does not reproduce {name} of the new release! Skipping delta.')
+                return
+
+    write_delta(delta_file, delta)
+    print(f'Delta written to {delta_file}: {delta_summary(delta)}')
 
 
 DATA_DIR = '/net/s3/s2-research/lucyw/suppai-data/'
 LOG_FILE = 'config/log.json'
+METRICS_DIR = 'output/metrics/'
 BLOCKLIST_FILE = 'data/blocklist.txt'
 MEDLINE_METADATA = os.path.join('/net/s3/s2-research/lucyw/pubmed/', 'pmid_metadata.json.gz')
 
@@ -412,6 +535,27 @@ ANIMAL_MESH_TERMS = {'Animals'}
 HUMAN_MESH_TERMS = {'Humans'}
 
 READ_TOP_K_LINES = 0
+# paper ids per metadata lookup (cache misses in a chunk are fetched from the S2 API concurrently)
+PAPER_METADATA_CHUNK_SIZE = 10000
+
+# output format ("legacy" or "sharded"; override with "output_format" in the log file)
+OUTPUT_FORMAT = 'legacy'
+BUNDLE_DIR = 'output/bundle/'
+# per-shard compression for the sharded format (None or "zstd")
+BUNDLE_COMPRESSION = None
+# evidence sentences kept per interaction, most confident first (0 keeps all; set a cap with
+# "max_sentences_per_interaction" in the log file)
+MAX_SENTENCES_PER_INTERACTION = 0
+# build a SQLite query index next to the output tarball
+BUILD_QUERY_INDEX = True
+# write the CSR interaction graph with per-interaction aggregates next to the output tarball
+BUILD_INTERACTION_GRAPH = True
+# write the name autocomplete index next to the output tarball
+BUILD_NAME_INDEX = True
+# write a delta against the previous release in output/
+WRITE_DELTA = True
+# check that the delta reproduces the new release (slow, loads the previous release; log.json "check_delta")
+CHECK_DELTA = False
 
 if __name__ == '__main__':
     # read preprocessing log file
@@ -433,7 +577,8 @@ if __name__ == '__main__':
         all_label_dir = [log_dict['ddi_output_dir']]
 
     # filter and keep only positive interactions labeled by model
-    interactions = keep_positives(all_input_dir, all_label_dir)
+    with metrics.timer("postprocess.keep_positives"):
+        interactions = keep_positives(all_input_dir, all_label_dir)
 
     # load blocklist spans
     blocklist_spans = []
@@ -441,17 +586,29 @@ if __name__ == '__main__':
         for line in f:
             blocklist_spans.append(line.strip())
 
+    # previous release (output names sort by date)
+    previous_releases = sorted(f for f in glob.glob('output/*.tar.gz') if f != output_file)
+    previous_release_file = previous_releases[-1] if WRITE_DELTA and previous_releases else None
+
     # form final dictionaries
-    form_dicts(interactions, output_file, blocklist_spans, log_dict['timestamp'])
+    form_dicts(
+        interactions,
+        output_file,
+        blocklist_spans,
+        log_dict['timestamp'],
+        output_format=log_dict.get('output_format', OUTPUT_FORMAT),
+        query_index_file=output_file.replace('.tar.gz', '.sqlite') if BUILD_QUERY_INDEX else None,
+        graph_file=output_file.replace('.tar.gz', '.graph.bin') if BUILD_INTERACTION_GRAPH else None,
+        name_index_file=output_file.replace('.tar.gz', '.names.json.gz') if BUILD_NAME_INDEX else None,
+        previous_release_file=previous_release_file,
+        max_sentences=log_dict.get('max_sentences_per_interaction', MAX_SENTENCES_PER_INTERACTION),
+        check_delta=log_dict.get('check_delta', CHECK_DELTA)
+    )
     print(f'Dicts written to {output_file}')
 
-    # write config file
-    with open('config/config.json', 'w') as config_f:
-        json.dump({
-            "timestamp": log_dict["timestamp"],
-            "rerun_ner": False,
-            "rerun_ddi": False,
-            "bert_ddi_model": log_dict['bert_ddi_model']
-        }, config_f, indent=4)
+    # export metrics (if SUPPAI_METRICS=1)
+    metrics_file = metrics.export('postprocess', os.path.join(METRICS_DIR, log_dict['header_str']), extra={"header_str": log_dict['header_str']})
+    if metrics_file:
+        print(f'Metrics written to {metrics_file}')
 
     print('done.')
\ No newline at end of file
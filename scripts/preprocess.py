@@ -10,15 +10,20 @@ import glob
 import tqdm
 import multiprocessing
 from datetime import datetime
-from typing import Dict
-import itertools
+from typing import Dict, List, Optional, Iterator
 import shutil
 import logging
 
 from suppai.data_getter import DataGetter
 from suppai.ner_and_linker import DrugSupplementLinker
+from suppai.restricted_kb import has_restricted_kb
+from suppai.exact_match import ExactMatchDictionary, PREFERRED_NAME_FILE
 from suppai.cui_handler import CUIHandler
+from suppai.sentence_filter import filter_sentences
+from suppai.paper_ner import iter_linked_papers
+from suppai import metrics
 from suppai.utils.list_utils import make_chunks
+from suppai.utils.file_utils import plan_byte_ranges, iter_byte_range
 
 
 logger = logging.getLogger("spacy")
@@ -28,81 +33,123 @@ logger = logging.getLogger("scispacy")
 logger.setLevel(logging.ERROR)
 
 
-def clean_ent(ent: Dict) -> Dict:
+def _set_ner_threads():
+    # set environmental variables for spacy multiprocessing
+    # NOTE: currently also need to change scispacy/candidate_generation.py:158 to:
+    # original_neighbours = self.ann_index.knnQueryBatch(vectors, k=k, num_threads=1)
+    # additional num_threads flag prevents scispacy from starting too many threads (keeps each process to 1 CPU)
+    os.environ["MKL_NUM_THREADS"] = "1"
+    os.environ["OMP_NUM_THREADS"] = "1"
+
+
+# per-process NER state, set up once per worker and reused for every range it processes
+_worker_state = dict()
+
+
+def _init_ner_worker(cui_handler: CUIHandler, preferred_names: Optional[Dict[str, str]] = None):
+    _set_ner_threads()
+    _worker_state["cui_handler"] = cui_handler
+    _worker_state["preferred_names"] = preferred_names
+
+
+def _get_linker() -> DrugSupplementLinker:
+    # fire up scispacy linker on a worker's first range
+    if "linker" not in _worker_state:
+        kb_dir = RESTRICTED_KB_DIR if RESTRICTED_KB_DIR and has_restricted_kb(RESTRICTED_KB_DIR) else None
+        exact_matcher = None
+        if EXACT_MATCH_LINKING:
+            exact_matcher = ExactMatchDictionary.from_handler(_worker_state["cui_handler"], _worker_state["preferred_names"])
+        _worker_state["linker"] = DrugSupplementLinker(kb_dir=kb_dir, exact_matcher=exact_matcher)
+    return _worker_state["linker"]
+
+
+def _read_entries(byte_range) -> Iterator[Dict]:
+    for line in iter_byte_range(byte_range):
+        metrics.incr("ner.bytes_read", len(line))
+        yield json.loads(line)
+
+
+def run_ranges(worker_fn, batches: List[Dict], cui_handler: CUIHandler, preferred_names: Optional[Dict[str, str]] = None):
     """
-    Get top cui from scispacy entity linking output
-    Return entity dictionary
-    :param ent:
+    Hand byte ranges to the worker pool one at a time, largest first; idle workers keep pulling ranges until
+    none are left, so the stage ends about one range (not one input file) after the last worker frees up
+    :param worker_fn: batch_run_ner_linking or batch_run_ner_and_filter
+    :param batches: batch dicts, each with a "byte_range"
+    :param cui_handler: sent once to each worker rather than with every range
+    :param preferred_names: CUI -> preferred name, for exact-match linking
     :return:
     """
-    return {
-        "span": [[ent['start'], ent['end']]],
-        "string": ent['string'],
-        "umls_types": ent['linked_cuis'][0][1],
-        "id": ent['linked_cuis'][0][0]
-    }
+    batches = sorted(batches, key=lambda b: b["byte_range"].num_bytes, reverse=True)
+    initargs = (cui_handler, preferred_names)
+    with multiprocessing.Pool(processes=NUM_PROCESSES, initializer=_init_ner_worker, initargs=initargs) as p:
+        for snapshot in tqdm.tqdm(p.imap_unordered(worker_fn, batches, chunksize=1), total=len(batches)):
+            metrics.merge([snapshot])
 
 
 def batch_run_ner_linking(batch_dict: Dict):
     """
-    Process one batch of paper files (files are jsonl with one paper per line)
+    Process one byte range of a paper file (files are jsonl with one paper per line)
     :param batch_dict:
     :return:
     """
-    # set environmental variables for spacy multiprocessing
-    # NOTE: currently also need to change scispacy/candidate_generation.py:158 to:
-    # original_neighbours = self.ann_index.knnQueryBatch(vectors, k=k, num_threads=1)
-    # additional num_threads flag prevents scispacy from starting too many threads (keeps each process to 1 CPU)
-    os.environ["MKL_NUM_THREADS"] = "1"
-    os.environ["OMP_NUM_THREADS"] = "1"
-
-    input_file = batch_dict["file_to_process"]
+    byte_range = batch_dict["byte_range"]
     entity_file = batch_dict["entity_file"]
     skipped_file = batch_dict["skipped_file"]
 
-    # fire up scispacy linker
-    ds_linker = DrugSupplementLinker()
+    ds_linker = _get_linker()
 
-    with open(input_file, 'r') as f, open(entity_file, 'w+') as outf, open(skipped_file, 'w+') as skip_f:
-        # process input file
-        for line in tqdm.tqdm(f):
-            entry = json.loads(line)
-
-            # skip if no title
-            if not entry['title']:
+    with open(entity_file, 'w+') as outf, open(skipped_file, 'w+') as skip_f:
+        # process input range
+        for entry, sentences in iter_linked_papers(ds_linker, _read_entries(byte_range), NER_DOC_BATCH_SIZE, TWO_PHASE_NER):
+            if sentences is None:
                 skip_f.write(f"{entry['corpus_id']}\n")
                 continue
+            for output_dict in sentences:
+                json.dump(output_dict, outf)
+                outf.write('\n')
+        metrics.incr("ner.bytes_written", outf.tell())
 
-            # skip if no abstract
-            if not entry['abstract']:
-                skip_f.write(f"{entry['corpus_id']}\n")
-                continue
+    return metrics.collect() if metrics.ENABLED else None
 
-            # form doc text
-            doc_text = entry['title'] + '. ' + entry['abstract']
-            try:
-                ents_per_sentence = ds_linker.get_linked_entities(
-                    doc_text,
-                    top_k=3
-                )
-            except Exception as e:
-                skip_f.write(f"{entry['corpus_id']}\n")
-                continue
 
-            # iterate through sentences
-            for sent in ents_per_sentence:
-                if not sent["sentence"].strip():
+def batch_run_ner_and_filter(batch_dict: Dict):
+    """
+    Process one byte range of a paper file, passing each paper's linked sentences straight to the supp/drug filter
+    (no intermediate entity file round trip; entity files are an optional side output)
+    :param batch_dict:
+    :return:
+    """
+    byte_range = batch_dict["byte_range"]
+    output_file = batch_dict["output_file"]
+    entity_file = batch_dict.get("entity_file")
+    skipped_file = batch_dict["skipped_file"]
+    handler = _worker_state["cui_handler"]
+
+    ds_linker = _get_linker()
+
+    ent_f = open(entity_file, 'w+') if entity_file else None
+    with open(output_file, 'w+') as out_f, open(skipped_file, 'w+') as skip_f:
+
+        def _linked_sentences():
+            for entry, sentences in iter_linked_papers(ds_linker, _read_entries(byte_range), NER_DOC_BATCH_SIZE, TWO_PHASE_NER):
+                if sentences is None:
+                    skip_f.write(f"{entry['corpus_id']}\n")
                     continue
-                entities = sent["entities"]
-                if entities and len(entities) > 0:
-                    output_dict = {
-                        "id": entry["corpus_id"],
-                        "sentence_id": sent["sent_num"],
-                        "sentence": sent["sentence"].strip(),
-                        "entities": entities
-                    }
-                    json.dump(output_dict, outf)
-                    outf.write('\n')
+                for sent in sentences:
+                    if ent_f:
+                        json.dump(sent, ent_f)
+                        ent_f.write('\n')
+                    yield sent
+
+        for output_dict in filter_sentences(_linked_sentences(), handler):
+            json.dump(output_dict, out_f)
+            out_f.write('\n')
+        metrics.incr("filter.bytes_written", out_f.tell())
+    if ent_f:
+        metrics.incr("ner.bytes_written", ent_f.tell())
+        ent_f.close()
+
+    return metrics.collect() if metrics.ENABLED else None
 
 
 def batch_filter_sentences(batch_dict: Dict):
@@ -116,52 +163,37 @@ def batch_filter_sentences(batch_dict: Dict):
     handler = batch_dict["cui_handler"]
 
     with open(input_file, 'r') as in_f, open(output_file, 'w+') as out_f:
-        counter = 0
-        for line in tqdm.tqdm(in_f):
-            sent = json.loads(line.strip())
-            entities = sent["entities"]
 
-            # skip sentence if only one detected entity
-            if len(entities) < 2:
-                continue
-
-            # skip sentence if all entity strings are the same
-            if len(set([ent["string"].strip() for ent in entities])) < 2:
-                continue
+        def _read_sentences():
+            for line in tqdm.tqdm(in_f):
+                metrics.incr("filter.bytes_read", len(line))
+                yield json.loads(line.strip())
 
-            # clean entities and construct dicts
-            keep_ents = [clean_ent(ent) for ent in entities]
+        for output_dict in filter_sentences(_read_sentences(), handler):
+            json.dump(output_dict, out_f)
+            out_f.write('\n')
+        metrics.incr("filter.bytes_written", out_f.tell())
 
-            # generate sentence entry for each pair of entities
-            for ent1, ent2 in itertools.combinations(keep_ents, 2):
-
-                # skip if same id
-                if ent1['id'] == ent2['id']:
-                    continue
-
-                # skip if same entity
-                if ent1['string'].strip() == ent2['string'].strip():
-                    continue
-
-                # skip if not supp-drug or supp-supp
-                if not (handler.is_supp_drug(ent1['id'], ent2['id']) or handler.is_supp_supp(ent1['id'], ent2['id'])):
-                    continue
-
-                # create sentence entry for DDI model
-                output_dict = {
-                    "id": str(sent["id"]) + '-' + str(counter),
-                    "sentence_id": sent["sentence_id"],
-                    "sentence": sent["sentence"],
-                    "arg1": ent1,
-                    "arg2": ent2
-                }
-                json.dump(output_dict, out_f)
-                out_f.write('\n')
-                counter += 1
+    return metrics.collect() if metrics.ENABLED else None
 
 
 CONFIG_FILE = 'config/config.json'
+METRICS_DIR = 'output/metrics/'
 NUM_PROCESSES = multiprocessing.cpu_count() // 8
+# size of the document ranges handed to NER workers (a few thousand abstracts)
+NER_RANGE_BYTES = 4 << 20
+# run NER over whole batches first, then link only mentions in sentences that can yield an entity pair
+# (entity files then only contain those sentences)
+TWO_PHASE_NER = True
+NER_DOC_BATCH_SIZE = 64
+# link against the restricted KB if it has been built (scripts/build_restricted_kb.py); None always uses all of UMLS
+RESTRICTED_KB_DIR = 'data/restricted_kb/'
+# resolve exact name matches of CUI clusters without querying the ANN index
+EXACT_MATCH_LINKING = True
+# filter sentences inside the NER workers instead of re-reading entity files after NER
+STREAM_NER_FILTER = True
+# also write entity files when streaming (needed to later re-filter this run with rerun_ddi)
+WRITE_ENTITY_FILES = True
 
 if __name__ == '__main__':
     # load config file
@@ -226,42 +258,60 @@ if __name__ == '__main__':
     else:
         all_files = glob.glob(os.path.join(RAW_DATA_DIR, 's2_data_*'))
     print(f'{len(all_files)} S2 data files for NER and linking.')
+    byte_ranges = plan_byte_ranges(sorted(all_files), NER_RANGE_BYTES)
+    print(f'{len(byte_ranges)} document ranges.')
 
-    batches = [{
-        "batch_num": batch_num,
-        "file_to_process": file_name,
-        "entity_file": os.path.join(ENTITY_DIR, f'entities.jsonl.{batch_num}'),
-        "skipped_file": os.path.join(ENTITY_DIR, f'skipped.txt.{batch_num}')
-    } for batch_num, file_name in enumerate(all_files)]
-    with multiprocessing.Pool(processes=NUM_PROCESSES) as p:
-        p.map(batch_run_ner_linking, batches)
-
-    # --- filter sentences for supp/drug CUIs ---
-    print('Filtering sentences...')
     # create CUI handler
     cui_handler = CUIHandler()
-    # form batches
-    if rerun_ner or not (rerun_ner or rerun_ddi):
-        all_files = glob.glob(os.path.join(ENTITY_DIR, 'entities.jsonl.*'))
+    preferred_names = None
+    if EXACT_MATCH_LINKING and os.path.exists(PREFERRED_NAME_FILE):
+        with open(PREFERRED_NAME_FILE, 'r') as f:
+            preferred_names = json.load(f)
+
+    # sentences are filtered as they come out of NER unless historical entity files must be re-filtered
+    filter_from_ner = rerun_ner or not (rerun_ner or rerun_ddi)
+
+    if STREAM_NER_FILTER and filter_from_ner:
+        print('Filtering sentences as NER runs...')
+        batches = [{
+            "byte_range": byte_range,
+            "output_file": os.path.join(SUPP_SENTS_DIR, f'sentences.jsonl.{byte_range.range_id:06d}'),
+            "entity_file": os.path.join(ENTITY_DIR, f'entities.jsonl.{byte_range.range_id:06d}') if WRITE_ENTITY_FILES else None,
+            "skipped_file": os.path.join(ENTITY_DIR, f'skipped.txt.{byte_range.range_id:06d}')
+        } for byte_range in byte_ranges]
+        run_ranges(batch_run_ner_and_filter, batches, cui_handler, preferred_names)
     else:
-        all_files = []
-        for ent_dir in glob.glob(os.path.join(DATA_DIR, '*', 's2_entities')):
-            all_files += glob.glob(os.path.join(ent_dir, 'entities.jsonl.*'))
-    print(f'{len(all_files)} entity files for filtering.')
-
-    batches = [{
-        "input_file": filename,
-        "output_file": os.path.join(SUPP_SENTS_DIR, f'sentences.jsonl.{batch_num}'),
-        "cui_handler": cui_handler
-    } for batch_num, filename in enumerate(
-        sorted(all_files)
-    )]
-    with multiprocessing.Pool(processes=NUM_PROCESSES) as p:
-        p.map(batch_filter_sentences, batches)
-
-    # aggregate into one file
+        batches = [{
+            "byte_range": byte_range,
+            "entity_file": os.path.join(ENTITY_DIR, f'entities.jsonl.{byte_range.range_id:06d}'),
+            "skipped_file": os.path.join(ENTITY_DIR, f'skipped.txt.{byte_range.range_id:06d}')
+        } for byte_range in byte_ranges]
+        run_ranges(batch_run_ner_linking, batches, cui_handler, preferred_names)
+
+        # --- filter sentences for supp/drug CUIs ---
+        print('Filtering sentences...')
+        # form batches
+        if filter_from_ner:
+            all_files = glob.glob(os.path.join(ENTITY_DIR, 'entities.jsonl.*'))
+        else:
+            all_files = []
+            for ent_dir in glob.glob(os.path.join(DATA_DIR, '*', 's2_entities')):
+                all_files += glob.glob(os.path.join(ent_dir, 'entities.jsonl.*'))
+        print(f'{len(all_files)} entity files for filtering.')
+
+        batches = [{
+            "input_file": filename,
+            "output_file": os.path.join(SUPP_SENTS_DIR, f'sentences.jsonl.{batch_num:06d}'),
+            "cui_handler": cui_handler
+        } for batch_num, filename in enumerate(
+            sorted(all_files)
+        )]
+        with multiprocessing.Pool(processes=NUM_PROCESSES) as p:
+            metrics.merge(p.map(batch_filter_sentences, batches))
+
+    # aggregate into one file (in range order, so reruns over the same inputs produce the same file)
     with open(os.path.join(SUPP_SENTS_DIR, f'supp_sentences_{header_str}.jsonl'), 'wb') as wfd:
-        for f in glob.glob(os.path.join(SUPP_SENTS_DIR, 'sentences.jsonl.*')):
+        for f in sorted(glob.glob(os.path.join(SUPP_SENTS_DIR, 'sentences.jsonl.*'))):
             with open(f, 'rb') as fd:
                 shutil.copyfileobj(fd, wfd)
             os.remove(f)
@@ -282,4 +332,9 @@ if __name__ == '__main__':
     with open('config/log.json', 'w+') as out_f:
         json.dump(log_dict, out_f, indent=4)
 
+    # --- export metrics (if SUPPAI_METRICS=1) ---
+    metrics_file = metrics.export('preprocess', os.path.join(METRICS_DIR, header_str), extra={"header_str": header_str})
+    if metrics_file:
+        print(f'Metrics written to {metrics_file}')
+
     print('done.')
\ No newline at end of file
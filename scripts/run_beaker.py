@@ -2,51 +2,24 @@ import os
 import sys
 import glob
 import json
-import subprocess
-import time
+import asyncio
 import shutil
 
-from suppai.utils.list_utils import make_chunks
-
-
-BEAKER_TEMPLATE = """
-description: BERT_DDI eval {}
-tasks:
-- spec:
-    image: im_2pdmza6rgoc1
-    resultPath: /output
-    args:
-    - python
-    - -m
-    - allennlp.run
-    - evaluate_custom
-    - --include-package
-    - bert_ddi
-    - --evaluation-data-file
-    - /dataset/data.jsonl
-    - --metadata-fields
-    - id,sentence,label,logits,probs
-    - --output-file
-    - /output/eval-output.jsonl
-    - --output-metrics-file
-    - /output/metrics.json
-    - --cuda-device
-    - "0"
-    - /model/model.tar.gz
-    datasetMounts:
-    - datasetId: {}
-      subPath: {}
-      containerPath: /dataset/data.jsonl
-    - datasetId: {}
-      containerPath: /model
-    requirements:
-      gpuCount: 1
-  cluster: ai2/on-prem-ai2-server
-"""
+from suppai.ddi_jobs import BeakerBackend, run_jobs
+from suppai.prediction_cache import PredictionCache, partition_candidates, complete_labels
+from suppai.utils.file_utils import split_jsonl, manifest_file
+
 
 LOG_FILE = 'config/log.json'
 BEAKER_DIR = 'beaker/'
-CHUNK_SIZE = 1000000
+# ~1M candidate sentences per Beaker dataset
+CHUNK_BYTES = 700 * 1024 * 1024
+PREDICTION_CACHE = '/net/s3/s2-research/lucyw/suppai-data/ddi_cache.sqlite'
+
+# per-experiment polling backoff (seconds) and retries for failed experiments
+POLL_INTERVAL = 60
+MAX_POLL_INTERVAL = 600
+MAX_ATTEMPTS = 3
 
 
 if __name__ == '__main__':
@@ -60,98 +33,64 @@ if __name__ == '__main__':
     bert_ddi_model = log_dict['bert_ddi_model']
 
     # get sentences
-    try:
-        supp_sents_file = glob.glob(os.path.join(supp_sents_dir, '*.jsonl'))[0]
-    except IndexError:
+    supp_sents_files = sorted(glob.glob(os.path.join(supp_sents_dir, '*.jsonl')))
+    if not supp_sents_files:
         print('No sentences! Exiting!')
         sys.exit(1)
 
-    # split file
-    all_sents = []
-    with open(supp_sents_file, 'r') as f:
-        for line in f:
-            all_sents.append(line)
-    num_files = max(len(all_sents) // CHUNK_SIZE, 1)
-
-    # write to batch files
-    dataset_files = []
-    for i, sents in enumerate(make_chunks(all_sents, num_files)):
-        out_file = os.path.join(supp_sents_dir, f'supp_sents.jsonl.{i:02d}')
-        with open(out_file, 'w') as outf:
-            for line in sents:
-                outf.write(line)
-        dataset_files.append(out_file)
-
-    # upload each dataset to beaker
-    ds_ids = []
-    for ds_file in dataset_files:
-        print(f'Creating dataset: {ds_file}')
-        beaker_args = ['beaker', 'dataset', 'create', ds_file]
-        ds_output = subprocess.check_output(' '.join(beaker_args), stderr=subprocess.STDOUT, shell=True)
-        ds_sents = [s.strip() for s in ds_output.decode('utf-8').split('\n')]
-        ds_identifier = ds_sents[0].split()[-1]
-        ds_ids.append(ds_identifier)
-
-    # create beaker templates
-    exp_ids = []
-    for i, (ds_file, ds_id) in enumerate(zip(dataset_files, ds_ids)):
-        if not ds_id:
-            print('No dataset identifier! Skipping!')
-            continue
-        print(f'Starting experiment: {ds_id}')
-        exp_header = f'supp_ai_exp_{i:02d}'
-        yaml_file = os.path.join(BEAKER_DIR, f'{exp_header}.yaml')
-        with open(yaml_file, 'w') as yaml_f:
-            yaml_f.write(BEAKER_TEMPLATE.format(exp_header, ds_id, ds_file.split('/')[-1], bert_ddi_model))
-        beaker_args = ['beaker', 'experiment', 'create', yaml_file]
-        exp_output = subprocess.check_output(' '.join(beaker_args), stderr=subprocess.STDOUT, shell=True)
-        exp_sents = [s.strip() for s in exp_output.decode('utf-8').split('\n')]
-        exp_identifier = exp_sents[0].split()[-1]
-        exp_ids.append(exp_identifier)
-
-    # monitor experiments until done
-    # TODO: this no longer works; no result ID is returned
-    start_time = time.time()
-    while True:
-        now_time = time.time() - start_time
-        print(f"Elapsed time: {now_time}", end="")
-        all_done = True
-        output_datasets = dict()
-        for i, exp_id in enumerate(exp_ids):
-            if not exp_id:
-                continue
-            beaker_args = ['beaker', 'experiment', 'inspect', exp_id]
-            exp_output = subprocess.check_output(' '.join(beaker_args), stderr=subprocess.STDOUT, shell=True)
-            exp_info = exp_output.decode('utf-8').split()
-            status_str = exp_info[-1]
-            if status_str == 'succeeded':
-                output_datasets[exp_id] = exp_info[5]
-            elif status_str == 'failed':
-                output_datasets[exp_id] = "FAILED"
-            else:
-                all_done = False
-                break
-        # check if all experiments done
-        if all_done:
-            print('Experiments done.')
-            break
-        else:
-            # wait 15 min and try all experiments again
-            time.sleep(600)
-
-    # download all output datasets
-    for i, (exp_id, ds_id) in enumerate(output_datasets.items()):
-        output_file = os.path.join(ddi_output_dir, f'output_part{i:02d}')
-        beaker_args = ['beaker', 'dataset', 'fetch', '--output={}'.format(output_file), ds_id]
-        ds_output = subprocess.run(beaker_args)
+    # only submit candidates not already classified by this model; write labels for cached candidates
+    cache = PredictionCache(PREDICTION_CACHE, bert_ddi_model)
+    uncached_file = os.path.join(supp_sents_dir, 'uncached_sents.tmp')
+    cached_label_dir = os.path.join(ddi_output_dir, 'output_part_cached')
+    os.makedirs(cached_label_dir, exist_ok=True)
+    pending = partition_candidates(
+        cache, supp_sents_files, uncached_file, os.path.join(cached_label_dir, 'eval-output.jsonl')
+    )
+
+    # split into byte-balanced batch files in one streaming pass (each with a manifest)
+    dataset_files = split_jsonl(
+        [uncached_file], os.path.join(supp_sents_dir, 'supp_sents.jsonl'), chunk_bytes=CHUNK_BYTES
+    )
+
+    # upload datasets, run experiments, and fetch results concurrently
+    os.makedirs(BEAKER_DIR, exist_ok=True)
+    backend = BeakerBackend(bert_ddi_model, BEAKER_DIR)
+    results = asyncio.run(run_jobs(
+        backend,
+        dataset_files,
+        ddi_output_dir,
+        max_attempts=MAX_ATTEMPTS,
+        poll_interval=POLL_INTERVAL,
+        max_poll_interval=MAX_POLL_INTERVAL
+    ))
+    ds_ids = [backend.dataset_ids.get(ds_file) for ds_file in dataset_files]
 
     # aggregate outputs into one file
-    with open(os.path.join(ddi_output_dir, f'supp_labels_{header_str}.jsonl'), 'wb') as wfd:
+    label_file = os.path.join(ddi_output_dir, f'supp_labels_{header_str}.jsonl')
+    with open(label_file, 'wb') as wfd:
         for f in glob.glob(os.path.join(ddi_output_dir, 'output_part*/' 'eval-output.jsonl')):
             with open(f, 'rb') as fd:
                 shutil.copyfileobj(fd, wfd)
             os.remove(f)
 
+    # cache new predictions and fill in labels for duplicate candidates
+    num_cached = complete_labels(cache, label_file, pending)
+    print(f'{num_cached} new predictions cached.')
+    cache.close()
+
+    # completed chunks are now cached, so a rerun only resubmits the failed ones
+    failed_chunks = [result.chunk_file for result in results if not result.succeeded]
+    if failed_chunks:
+        print(f'{len(failed_chunks)} chunks failed: {failed_chunks}')
+        print('Rerun to retry failed chunks. Exiting!')
+        sys.exit(1)
+
+    # remove batch files
+    os.remove(uncached_file)
+    for ds_file in dataset_files:
+        os.remove(ds_file)
+        os.remove(manifest_file(ds_file))
+
     # write beaker dataset ids to log file
     log_dict["bert_ddi_model"] = bert_ddi_model
     log_dict["beaker_dataset_ids"] = ds_ids
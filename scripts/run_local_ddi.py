@@ -0,0 +1,120 @@
+"""
+Run BERT-DDI classification locally on CPU instead of in Beaker
+Writes the same label files as run_beaker.py
+
+"""
+
+import os
+import sys
+import glob
+import json
+import math
+import asyncio
+import shutil
+import multiprocessing
+
+from suppai.ddi_jobs import LocalProcessBackend, run_jobs
+from suppai.prediction_cache import PredictionCache, local_model_id, partition_candidates, complete_labels
+from suppai.utils.file_utils import split_jsonl, manifest_file
+
+
+LOG_FILE = 'config/log.json'
+
+# HuggingFace-format export of the BERT-DDI model (override with "local_ddi_model" in the log file)
+LOCAL_MODEL_DIR = 'models/bert_ddi/'
+
+# use ONNX Runtime (model_dir/model.onnx) or dynamic int8 quantization of the PyTorch model
+USE_ONNX = False
+QUANTIZE = True
+
+THREADS_PER_PROCESS = 2
+NUM_PROCESSES = max(multiprocessing.cpu_count() // THREADS_PER_PROCESS, 1)
+CHUNK_BYTES = 64 * 1024 * 1024
+POLL_INTERVAL = 5
+PREDICTION_CACHE = '/net/s3/s2-research/lucyw/suppai-data/ddi_cache.sqlite'
+
+
+if __name__ == '__main__':
+    # read preprocessing log file
+    with open(LOG_FILE, 'r') as f:
+        log_dict = json.load(f)
+
+    supp_sents_dir = log_dict['supp_sents_dir']
+    ddi_output_dir = log_dict['ddi_output_dir']
+    header_str = log_dict['header_str']
+    model_dir = log_dict.get('local_ddi_model', LOCAL_MODEL_DIR)
+
+    # get sentences
+    supp_sents_files = sorted(glob.glob(os.path.join(supp_sents_dir, '*.jsonl')))
+    if not supp_sents_files:
+        print('No sentences! Exiting!')
+        sys.exit(1)
+
+    # only classify candidates not already classified by this model; write labels for cached candidates
+    # (keyed by the model's identity, not its path, so a re-exported model does not reuse stale predictions)
+    model_id = local_model_id(model_dir)
+    print(f'Prediction cache model id: {model_id}')
+    cache = PredictionCache(PREDICTION_CACHE, model_id)
+    uncached_file = os.path.join(supp_sents_dir, 'uncached_sents.tmp')
+    cached_label_dir = os.path.join(ddi_output_dir, 'output_part_cached')
+    os.makedirs(cached_label_dir, exist_ok=True)
+    pending = partition_candidates(
+        cache, supp_sents_files, uncached_file, os.path.join(cached_label_dir, 'eval-output.jsonl')
+    )
+
+    # split into byte-balanced chunk files in one streaming pass, so all processes have work
+    num_chunks = max(math.ceil(os.path.getsize(uncached_file) / CHUNK_BYTES), NUM_PROCESSES)
+    chunk_files = split_jsonl([uncached_file], os.path.join(supp_sents_dir, 'supp_sents.jsonl'), num_chunks=num_chunks)
+
+    # classify chunks in a process pool, retrying any chunk that fails or comes back incomplete
+    print(f'Classifying {len(pending)} sentences in {len(chunk_files)} chunks with {NUM_PROCESSES} processes...')
+    backend = LocalProcessBackend(
+        model_dir,
+        num_processes=NUM_PROCESSES,
+        threads_per_process=THREADS_PER_PROCESS,
+        use_onnx=USE_ONNX,
+        quantize=QUANTIZE
+    )
+    results = asyncio.run(run_jobs(
+        backend,
+        chunk_files,
+        ddi_output_dir,
+        max_concurrent=NUM_PROCESSES,
+        poll_interval=POLL_INTERVAL,
+        max_poll_interval=POLL_INTERVAL
+    ))
+    backend.close()
+
+    # aggregate outputs into one file
+    label_file = os.path.join(ddi_output_dir, f'supp_labels_{header_str}.jsonl')
+    with open(label_file, 'wb') as wfd:
+        for f in sorted(glob.glob(os.path.join(ddi_output_dir, 'output_part*/' 'eval-output.jsonl'))):
+            with open(f, 'rb') as fd:
+                shutil.copyfileobj(fd, wfd)
+            os.remove(f)
+
+    # cache new predictions and fill in labels for duplicate candidates
+    num_cached = complete_labels(cache, label_file, pending)
+    print(f'{num_cached} new predictions cached.')
+    cache.close()
+
+    # completed chunks are now cached, so a rerun only reclassifies the failed ones
+    failed_chunks = [result.chunk_file for result in results if not result.succeeded]
+    if failed_chunks:
+        print(f'{len(failed_chunks)} chunks failed: {failed_chunks}')
+        print('Rerun to retry failed chunks. Exiting!')
+        sys.exit(1)
+
+    # remove chunk files
+    os.remove(uncached_file)
+    for in_file in chunk_files:
+        os.remove(in_file)
+        os.remove(manifest_file(in_file))
+
+    # write model info to log file
+    log_dict["local_ddi_model"] = model_dir
+
+    with open(LOG_FILE, 'w') as f:
+        json.dump(log_dict, f, indent=4)
+
+    print('done.')
@@ -0,0 +1,113 @@
+"""
+Run the pipeline stages as a DAG (see suppai.pipeline)
+Stages whose inputs are unchanged since their last successful run are skipped, so rerunning after a failure
+resumes at the failed stage; MEDLINE extraction runs alongside preprocessing. Once every stage has succeeded, the
+config file is advanced to the next release (papers updated since this run's timestamp)
+Usage: python scripts/run_pipeline.py [--force STAGE ...]
+
+"""
+
+import os
+import sys
+import json
+import argparse
+from datetime import date
+
+from suppai.pipeline import Pipeline, Stage, STAGE_FAILED, STAGE_BLOCKED
+
+
+CONFIG_FILE = 'config/config.json'
+LOG_FILE = 'config/log.json'
+STATE_FILE = 'config/pipeline_state.json'
+MEDLINE_METADATA = '/net/s3/s2-research/lucyw/pubmed/pmid_metadata.json.gz'
+
+# set DDI_BACKEND=local to run BERT-DDI on this machine instead of Beaker
+DDI_SCRIPT = 'scripts/run_local_ddi.py' if os.getenv('DDI_BACKEND') == 'local' else 'scripts/run_beaker.py'
+
+STAGES = [
+    Stage(
+        name='preprocess',
+        command=[sys.executable, 'scripts/preprocess.py'],
+        inputs=[CONFIG_FILE, 'scripts/preprocess.py'],
+        outputs=['{supp_sents_dir}']
+    ),
+    Stage(
+        name='medline',
+        command=[sys.executable, 'scripts/get_pubmed_paper_info.py'],
+        inputs=['scripts/get_pubmed_paper_info.py'],
+        outputs=[MEDLINE_METADATA],
+        # the MEDLINE update files are remote: refresh at most once a day
+        keys=['run_date']
+    ),
+    Stage(
+        name='ddi',
+        command=[sys.executable, DDI_SCRIPT],
+        inputs=['{supp_sents_dir}', DDI_SCRIPT],
+        outputs=['{ddi_output_dir}'],
+        depends_on=['preprocess']
+    ),
+    Stage(
+        name='postprocess',
+        command=[sys.executable, 'scripts/postprocess.py'],
+        inputs=['{supp_sents_dir}', '{ddi_output_dir}', MEDLINE_METADATA, 'data/blocklist.txt', 'scripts/postprocess.py'],
+        outputs=['{output_file}'],
+        depends_on=['ddi', 'medline']
+    ),
+    Stage(
+        name='validate',
+        command=[sys.executable, 'scripts/validate_output.py'],
+        inputs=['{output_file}', 'scripts/validate_output.py'],
+        outputs=['output/{header_str}.validation.json'],
+        depends_on=['postprocess']
+    )
+]
+
+
+def read_log() -> dict:
+    if not os.path.exists(LOG_FILE):
+        return dict()
+    with open(LOG_FILE, 'r') as f:
+        return json.load(f)
+
+
+def pipeline_context() -> dict:
+    return dict(read_log(), run_date=date.today().isoformat())
+
+
+def advance_config():
+    """
+    Point the config file at the release just built, so the next run retrieves papers updated since then
+    Done here rather than in postprocess: the config file is an input of preprocess, and rewriting it before the
+    release is validated would restart a rerun after a failed validation at preprocess
+    :return:
+    """
+    log_dict = read_log()
+    with open(CONFIG_FILE, 'w') as config_f:
+        json.dump({
+            "timestamp": log_dict["timestamp"],
+            "rerun_ner": False,
+            "rerun_ddi": False,
+            "bert_ddi_model": log_dict['bert_ddi_model']
+        }, config_f, indent=4)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', nargs='+', default=[], choices=[stage.name for stage in STAGES],
+                        help='stages to run even if up to date')
+    args = parser.parse_args()
+
+    pipeline = Pipeline(STAGES, STATE_FILE, context_fn=pipeline_context)
+    results = pipeline.run(force=args.force)
+
+    print('Stage timing:')
+    for name in pipeline.order:
+        print(f'  {name}: {results[name].status} ({results[name].elapsed:.1f}s)')
+
+    if any(result.status in (STAGE_FAILED, STAGE_BLOCKED) for result in results.values()):
+        sys.exit(1)
+
+    advance_config()
+    print(f'{CONFIG_FILE} advanced to this release')
+
+    print('done.')
@@ -0,0 +1,30 @@
+"""
+Serve the latest release in output/ over HTTP (see suppai.query_server)
+Usage: python scripts/serve_release.py [--host HOST] [--port PORT]
+
+"""
+
+import asyncio
+import argparse
+
+from suppai.query_server import QueryServer, OUTPUT_DIR, WORK_DIR, CACHE_SIZE, RELOAD_INTERVAL
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('--output-dir', default=OUTPUT_DIR, help='directory with release tarballs')
+    parser.add_argument('--work-dir', default=WORK_DIR, help='where sharded bundles are extracted')
+    parser.add_argument('--cache-size', type=int, default=CACHE_SIZE, help='entries in the LRU cache')
+    parser.add_argument('--reload-interval', type=float, default=RELOAD_INTERVAL,
+                        help='seconds between checks for a new release')
+    args = parser.parse_args()
+
+    server = QueryServer(args.output_dir, args.work_dir, args.cache_size, args.reload_interval)
+    try:
+        asyncio.run(server.serve_forever(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
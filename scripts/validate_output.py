@@ -0,0 +1,47 @@
+"""
+Validate release output in one streaming pass before upload (see suppai.output_validator)
+Writes a report next to the release and exits non-zero if any invariant is violated
+Usage: python scripts/validate_output.py [<release.tar.gz | bundle dir | output dir>] [--workers N]
+
+"""
+
+import os
+import sys
+import json
+import argparse
+
+from suppai.output_validator import validate_output, CHECKS
+
+
+LOG_FILE = 'config/log.json'
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('path', nargs='?', help='output to validate (default: output_file in config/log.json)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='parallel shard/file scans')
+    args = parser.parse_args()
+
+    path = args.path
+    if not path:
+        with open(LOG_FILE, 'r') as f:
+            log = json.load(f)
+        path = log['output_file']
+    report_file = (path[:-len('.tar.gz')] if path.endswith('.tar.gz') else path.rstrip('/')) + '.validation.json'
+
+    print(f'Validating {path}...')
+    report = validate_output(path, workers=args.workers)
+    print(f'Entries: {report["entries"]}')
+    for check, count in report["violation_counts"].items():
+        print(f'  {check} ({CHECKS[check]}): {"ok" if not count else f"{count} violations"}')
+    for violation in report["violations"]:
+        print(f'  [{violation["check"]}] {violation["key"]}: {violation["message"]}')
+
+    with open(report_file, 'w') as f:
+        json.dump(report, f, indent=4)
+    print(f'Report written to {report_file}')
+
+    if not report["valid"]:
+        sys.exit(1)
+
+    print('done.')
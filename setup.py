@@ -7,6 +7,13 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
     ],
+    extras_require={
+        # local BERT-DDI inference (scripts/run_local_ddi.py); onnx for exports that include a model.onnx
+        'local-ddi': ['torch', 'transformers'],
+        'onnx': ['onnxruntime', 'transformers'],
+        # zstd-compressed bundle shards (BUNDLE_COMPRESSION = "zstd") and archives (write_archive compression="zst")
+        'zstd': ['zstandard'],
+    },
     tests_require=[
     ],
     zip_safe=False,
@@ -0,0 +1,238 @@
+"""
+Local (CPU) BERT-DDI inference over candidate sentence files
+Alternative to running the classifier as Beaker experiments
+
+"""
+
+import os
+import json
+import math
+from typing import List, Dict, Iterator, Tuple, Optional
+
+from suppai.utils.list_utils import chunk_iter
+
+
+# entity markers inserted around arg1 and arg2 spans (must match the markers used when training BERT-DDI)
+ARG1_MARKERS = ('<< ', ' >>')
+ARG2_MARKERS = ('[[ ', ' ]]')
+
+# maximum wordpiece length of a candidate sentence
+MAX_SEQ_LENGTH = 128
+
+# dynamic batching: cap on padded tokens (batch size x longest sequence) per forward pass
+MAX_TOKENS_PER_BATCH = 8192
+MAX_BATCH_SIZE = 128
+
+# number of candidates read and length-sorted together before batching
+SORT_WINDOW = 4096
+
+
+def mark_entities(entry: Dict) -> str:
+    """
+    Insert entity markers around the arg1 and arg2 spans of a candidate sentence
+    :param entry: candidate sentence entry from batch_filter_sentences
+    :return:
+    """
+    sentence = entry['sentence']
+    start1, end1 = entry['arg1']['span'][0]
+    start2, end2 = entry['arg2']['span'][0]
+
+    # markers in sentence order; where one span ends exactly at the start of the other, the closing marker goes first
+    insertions = sorted([
+        (start1, 1, ARG1_MARKERS[0]), (end1, 0, ARG1_MARKERS[1]),
+        (start2, 1, ARG2_MARKERS[0]), (end2, 0, ARG2_MARKERS[1])
+    ], key=lambda x: (x[0], x[1]))
+
+    pieces = []
+    position = 0
+    for offset, _, marker in insertions:
+        pieces.append(sentence[position:offset])
+        pieces.append(marker)
+        position = offset
+    pieces.append(sentence[position:])
+    sentence = ''.join(pieces)
+    return sentence
+
+
+def length_batches(
+        lengths: List[int],
+        max_tokens: int = MAX_TOKENS_PER_BATCH,
+        max_batch_size: int = MAX_BATCH_SIZE
+) -> Iterator[List[int]]:
+    """
+    Group item indices into batches of similar length so padding is minimal
+    Each batch is capped by its padded size (batch size x longest item)
+    :param lengths: sequence length of each item
+    :param max_tokens:
+    :param max_batch_size:
+    :return: lists of indices into lengths
+    """
+    batch = []
+    batch_max_len = 0
+    for index in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+        new_max_len = max(batch_max_len, lengths[index])
+        if batch and (new_max_len * (len(batch) + 1) > max_tokens or len(batch) >= max_batch_size):
+            yield batch
+            batch = []
+            new_max_len = lengths[index]
+        batch.append(index)
+        batch_max_len = new_max_len
+    if batch:
+        yield batch
+
+
+def softmax(logits: List[float]) -> List[float]:
+    """
+    Softmax over one row of logits
+    :param logits:
+    :return:
+    """
+    max_logit = max(logits)
+    exps = [math.exp(l - max_logit) for l in logits]
+    total = sum(exps)
+    return [e / total for e in exps]
+
+
+class BertDdiClassifier:
+    """
+    CPU BERT-DDI classifier loaded from a HuggingFace-format export of the model
+    (model_dir contains config.json, the tokenizer files, and the weights; model.onnx if use_onnx)
+    """
+    def __init__(
+            self,
+            model_dir: str,
+            use_onnx: bool = False,
+            quantize: bool = False,
+            num_threads: int = 1,
+            max_seq_length: int = MAX_SEQ_LENGTH
+    ):
+        # heavy dependencies are only needed when running inference locally
+        from transformers import AutoTokenizer
+
+        assert os.path.exists(model_dir)
+
+        self.max_seq_length = max_seq_length
+        self.use_onnx = use_onnx
+        self.tokenizer = AutoTokenizer.from_pretrained(model_dir)
+
+        if use_onnx:
+            import onnxruntime
+            options = onnxruntime.SessionOptions()
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+            self.session = onnxruntime.InferenceSession(
+                os.path.join(model_dir, 'model.onnx'),
+                sess_options=options,
+                providers=['CPUExecutionProvider']
+            )
+            self.onnx_inputs = {inp.name for inp in self.session.get_inputs()}
+        else:
+            import torch
+            from transformers import AutoModelForSequenceClassification
+            torch.set_num_threads(num_threads)
+            model = AutoModelForSequenceClassification.from_pretrained(model_dir)
+            model.eval()
+            # dynamic int8 quantization of the linear layers (most of BERT's compute on CPU)
+            if quantize:
+                model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+            self.model = model
+
+    def tokenize(self, sentences: List[str]) -> List[List[int]]:
+        """
+        Convert sentences to wordpiece ids (truncated, unpadded)
+        :param sentences:
+        :return:
+        """
+        return self.tokenizer(
+            sentences,
+            truncation=True,
+            max_length=self.max_seq_length
+        )['input_ids']
+
+    def predict_ids(self, input_ids: List[List[int]]) -> List[List[float]]:
+        """
+        Run one padded batch through the model and return logits
+        :param input_ids:
+        :return:
+        """
+        padded = self.tokenizer.pad(
+            {"input_ids": input_ids},
+            padding='longest',
+            return_tensors='np' if self.use_onnx else 'pt'
+        )
+        if self.use_onnx:
+            feeds = {k: v for k, v in padded.items() if k in self.onnx_inputs}
+            if 'token_type_ids' in self.onnx_inputs and 'token_type_ids' not in feeds:
+                feeds['token_type_ids'] = padded['input_ids'] * 0
+            logits = self.session.run(None, feeds)[0]
+            return logits.tolist()
+
+        import torch
+        with torch.no_grad():
+            logits = self.model(**padded).logits
+        return logits.tolist()
+
+    def classify(self, entries: List[Dict]) -> List[Tuple[List[float], List[float]]]:
+        """
+        Classify candidate sentence entries with dynamic, length-sorted batching
+        :param entries:
+        :return: (logits, probs) per entry, in input order
+        """
+        input_ids = self.tokenize([mark_entities(entry) for entry in entries])
+        results = [None] * len(entries)
+        for batch in length_batches([len(ids) for ids in input_ids]):
+            batch_logits = self.predict_ids([input_ids[i] for i in batch])
+            for i, logits in zip(batch, batch_logits):
+                results[i] = (logits, softmax(logits))
+        return results
+
+
+def form_label_entry(entry: Dict, logits: List[float], probs: List[float]) -> Dict:
+    """
+    Form one eval-output.jsonl entry in the format written by the Beaker evaluate_custom command
+    :param entry:
+    :param logits:
+    :param probs:
+    :return:
+    """
+    return {
+        "id": entry["id"],
+        "sentence": entry["sentence"],
+        "logits": logits,
+        "probs": probs,
+        "label-model": max(range(len(probs)), key=lambda i: probs[i])
+    }
+
+
+def classify_file(classifier: BertDdiClassifier, input_file: str, output_file: str) -> int:
+    """
+    Classify all candidates in a jsonl file and write eval-output.jsonl style labels
+    :param classifier:
+    :param input_file:
+    :param output_file:
+    :return: number of candidates classified
+    """
+    total = 0
+    with open(input_file, 'r') as in_f, open(output_file, 'w') as out_f:
+        for window in chunk_iter(in_f, SORT_WINDOW):
+            entries = [json.loads(line) for line in window]
+            for entry, (logits, probs) in zip(entries, classifier.classify(entries)):
+                json.dump(form_label_entry(entry, logits, probs), out_f)
+                out_f.write('\n')
+            total += len(entries)
+    return total
+
+
+# per-process classifier for classify_job workers
+_worker_classifier: Optional[BertDdiClassifier] = None
+
+
+def init_classifier_worker(model_kwargs: Dict):
+    global _worker_classifier
+    _worker_classifier = BertDdiClassifier(**model_kwargs)
+
+
+def classify_job(job: Tuple[str, str]) -> int:
+    input_file, output_file = job
+    return classify_file(_worker_classifier, input_file, output_file)
+
@@ -0,0 +1,196 @@
+"""
+Propagate CUI cluster changes without rerunning NER or DDI
+Candidate validity depends only on the supplement/drug type of the raw linked CUIs, so after a cluster file change
+only sentences containing a CUI whose type changed are re-filtered, and only pairs that were not candidates before
+need classification. Members moved between clusters of the same type only need re-aggregation (postprocess
+normalizes CUIs), and pairs that became invalid are dropped by postprocess
+
+"""
+
+import os
+import json
+import sqlite3
+from typing import Dict, Set, List, Iterable, Iterator, NamedTuple, Tuple
+
+from suppai.cui_handler import CUIHandler
+from suppai.sentence_filter import filter_sentence
+from suppai.utils.list_utils import chunk_iter
+
+
+ENTITY_RECORD = 'entity'
+CANDIDATE_RECORD = 'candidate'
+
+QUERY_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 10000
+
+
+class ClusterDiff(NamedTuple):
+    # member CUIs whose type (supplement, drug, or none) changed: their sentences are re-filtered
+    type_changed: Set[str]
+    # member CUIs moved to another cluster of the same type: re-aggregation only
+    cluster_changed: Set[str]
+    added_clusters: Set[str]
+    removed_clusters: Set[str]
+
+
+def _member_map(handler: CUIHandler) -> Dict[str, Tuple[str, str]]:
+    return {cui: (handler.get_cui_type(cui), cluster_cui) for cui, cluster_cui in handler.map_dict.items()}
+
+
+def diff_clusters(old_handler: CUIHandler, new_handler: CUIHandler) -> ClusterDiff:
+    """
+    Member CUIs affected by a cluster file change
+    :param old_handler:
+    :param new_handler:
+    :return:
+    """
+    old_members = _member_map(old_handler)
+    new_members = _member_map(new_handler)
+    type_changed = set()
+    cluster_changed = set()
+    for cui in old_members.keys() | new_members.keys():
+        old_type, old_cluster = old_members.get(cui, ("", None))
+        new_type, new_cluster = new_members.get(cui, ("", None))
+        if old_type != new_type:
+            type_changed.add(cui)
+        elif old_cluster != new_cluster:
+            cluster_changed.add(cui)
+    old_clusters = old_handler.supps | old_handler.drugs
+    new_clusters = new_handler.supps | new_handler.drugs
+    return ClusterDiff(type_changed, cluster_changed, new_clusters - old_clusters, old_clusters - new_clusters)
+
+
+def record_cuis(record: Dict, kind: str) -> Set[str]:
+    """
+    Raw linked CUIs of an entity file sentence or a candidate
+    :param record:
+    :param kind:
+    :return:
+    """
+    if kind == ENTITY_RECORD:
+        return set(ent['linked_cuis'][0][0] for ent in record['entities'] if ent['linked_cuis'])
+    return {record['arg1']['id'], record['arg2']['id']}
+
+
+def candidate_key(candidate: Dict) -> Tuple:
+    """
+    Identity of a candidate regardless of its id and argument order
+    :param candidate:
+    :return:
+    """
+    pid = str(candidate['id']).split('-')[0]
+    args = sorted((arg['id'], tuple(map(tuple, arg['span']))) for arg in [candidate['arg1'], candidate['arg2']])
+    return pid, candidate['sentence_id'], candidate['sentence'], tuple(args)
+
+
+class RawCuiIndex:
+    """
+    SQLite index from raw linked CUI to the entity file sentences and candidates that contain it
+    Files are (re)indexed only when their size or mtime changed
+    """
+    def __init__(self, index_file: str):
+        index_dir = os.path.dirname(index_file)
+        if index_dir:
+            os.makedirs(index_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(index_file)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS files "
+            "(file_id INTEGER PRIMARY KEY, path TEXT UNIQUE, kind TEXT, size INTEGER, mtime_ns INTEGER)"
+        )
+        self.conn.execute("CREATE TABLE IF NOT EXISTS records (cui TEXT, file_id INTEGER, offset INTEGER)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS records_cui ON records (cui)")
+        self.conn.commit()
+
+    def add_file(self, path: str, kind: str) -> bool:
+        """
+        Index the records of a jsonl file
+        :param path:
+        :param kind: ENTITY_RECORD or CANDIDATE_RECORD
+        :return: whether the file was (re)indexed
+        """
+        stat = os.stat(path)
+        row = self.conn.execute("SELECT file_id, size, mtime_ns FROM files WHERE path = ?", (path,)).fetchone()
+        if row and row[1] == stat.st_size and row[2] == stat.st_mtime_ns:
+            return False
+        if row:
+            self.conn.execute("DELETE FROM records WHERE file_id = ?", (row[0],))
+            self.conn.execute("DELETE FROM files WHERE file_id = ?", (row[0],))
+        file_id = self.conn.execute(
+            "INSERT INTO files (path, kind, size, mtime_ns) VALUES (?, ?, ?, ?)",
+            (path, kind, stat.st_size, stat.st_mtime_ns)
+        ).lastrowid
+
+        def _rows():
+            with open(path, 'rb') as f:
+                offset = 0
+                for line in f:
+                    if line.strip():
+                        for cui in record_cuis(json.loads(line), kind):
+                            yield cui, file_id, offset
+                    offset += len(line)
+
+        for rows in chunk_iter(_rows(), INSERT_BATCH_SIZE):
+            self.conn.executemany("INSERT INTO records (cui, file_id, offset) VALUES (?, ?, ?)", rows)
+        self.conn.commit()
+        return True
+
+    def add_files(self, paths: Iterable[str], kind: str) -> int:
+        return sum(self.add_file(path, kind) for path in paths)
+
+    def records(self, cuis: Iterable[str], kind: str) -> Iterator[Dict]:
+        """
+        Records of a kind that contain any of the CUIs (each record once, in file and offset order)
+        :param cuis:
+        :param kind:
+        :return:
+        """
+        locations = set()
+        for cui_chunk in chunk_iter(sorted(set(cuis)), QUERY_BATCH_SIZE):
+            locations.update(self.conn.execute(
+                f"SELECT files.path, records.offset FROM records JOIN files ON records.file_id = files.file_id "
+                f"WHERE files.kind = ? AND records.cui IN ({','.join('?' * len(cui_chunk))})",
+                (kind,) + cui_chunk
+            ))
+        current_path = None
+        f = None
+        for path, offset in sorted(locations):
+            if path != current_path:
+                if f:
+                    f.close()
+                f = open(path, 'rb')
+                current_path = path
+            f.seek(offset)
+            yield json.loads(f.readline())
+        if f:
+            f.close()
+
+    def close(self):
+        self.conn.close()
+
+
+def find_new_candidates(index: RawCuiIndex, diff: ClusterDiff, new_handler: CUIHandler) -> List[Dict]:
+    """
+    Re-filter the sentences of type-changed CUIs with the new clusters, keeping pairs that were not candidates before
+    :param index:
+    :param diff:
+    :param new_handler:
+    :return: new candidates (ids unique within the returned list)
+    """
+    existing = set(candidate_key(c) for c in index.records(diff.type_changed, CANDIDATE_RECORD))
+
+    new_candidates = []
+    seen = set()
+    for sent in index.records(diff.type_changed, ENTITY_RECORD):
+        for candidate in filter_sentence(sent, new_handler, len(new_candidates)):
+            # pairs without a type-changed CUI were valid before, so they are already candidates
+            if not record_cuis(candidate, CANDIDATE_RECORD) & diff.type_changed:
+                continue
+            key = candidate_key(candidate)
+            # pairs that were valid under the old types too; the same sentence may be in several runs' entity files
+            if key in existing or key in seen:
+                continue
+            seen.add(key)
+            candidate["id"] = f"{sent['id']}-{len(new_candidates)}"
+            new_candidates.append(candidate)
+    return new_candidates
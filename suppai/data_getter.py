@@ -13,6 +13,9 @@ import urllib
 import subprocess
 from easy_entrez import EntrezAPI
 
+from suppai.paper_metadata import PaperMetadataIndexWriter, read_papers_shard, metadata_from_dataset_record
+from suppai.utils.db_utils import PAPER_METADATA_INDEX
+
 entrez_api = EntrezAPI(
     'supp.ai',
     'lucylw@uw.edu',
@@ -44,6 +47,9 @@ class DataGetterAPI:
         """
         output_file = os.path.join(self.output_dir, f's2ids.txt')
 
+        # paper metadata for postprocess is captured in the same pass over the shards
+        metadata_writer = PaperMetadataIndexWriter(PAPER_METADATA_INDEX)
+
         # Get info about the latest release
         latest_release = requests.get("http://api.semanticscholar.org/datasets/v1/release/latest").json()
         print(latest_release['README'])
@@ -68,13 +74,13 @@ class DataGetterAPI:
             
             # get pubmed papers
             keep_corpus_ids = []
-            with open(paper_temp_file, 'r') as f:
-                for line in tqdm.tqdm(f):
-                    entry = json.loads(line)
-                    # check if pubmed or pmc id
-                    if entry['externalids']['PubMed']:
-                        keep_corpus_ids.append((entry['corpusid'], entry['externalids']['PubMed'], entry['title']))
-                        continue
+            paper_metadata = dict()
+            for entry in tqdm.tqdm(read_papers_shard(paper_temp_file)):
+                # check if pubmed or pmc id
+                if entry['externalids']['PubMed']:
+                    keep_corpus_ids.append((entry['corpusid'], entry['externalids']['PubMed'], entry['title']))
+                    paper_metadata[str(entry['corpusid'])] = metadata_from_dataset_record(entry)
+                    continue
 
             # write to output file
             with open(output_file, 'a+') as outf:
@@ -82,12 +88,19 @@ class DataGetterAPI:
                 for row in keep_corpus_ids:
                     writer.writerow(row)
 
+            # write sorted metadata run
+            metadata_writer.add_run(f"papers-part{i:04d}", paper_metadata)
+
             # write done file
             open(done_file, 'w').close()
 
             # delete temp file
             os.remove(paper_temp_file)
 
+        # merge metadata runs into the metadata index
+        num_papers = metadata_writer.finalize()
+        print(f'{num_papers} papers in metadata index {PAPER_METADATA_INDEX}')
+
         return output_file
 
     def get_abstracts(self, id_file):
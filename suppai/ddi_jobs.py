@@ -0,0 +1,338 @@
+"""
+Asynchronous orchestration of BERT-DDI inference jobs
+Chunks are submitted concurrently, each job is polled with its own backoff, and results are
+fetched as soon as a job finishes; only failed chunks are retried
+
+"""
+
+import os
+import abc
+import json
+import time
+import asyncio
+import concurrent.futures
+from typing import List, Dict, Optional, NamedTuple, Callable
+
+from suppai.bert_ddi import form_label_entry, init_classifier_worker, classify_job
+from suppai.utils.file_utils import manifest_file, read_manifest, count_lines
+
+
+JOB_RUNNING = 'running'
+JOB_SUCCEEDED = 'succeeded'
+JOB_FAILED = 'failed'
+
+# output file name written by the BERT-DDI evaluation command
+EVAL_OUTPUT_FILE = 'eval-output.jsonl'
+
+BEAKER_TEMPLATE = """
+description: BERT_DDI eval {}
+tasks:
+- spec:
+    image: im_2pdmza6rgoc1
+    resultPath: /output
+    args:
+    - python
+    - -m
+    - allennlp.run
+    - evaluate_custom
+    - --include-package
+    - bert_ddi
+    - --evaluation-data-file
+    - /dataset/data.jsonl
+    - --metadata-fields
+    - id,sentence,label,logits,probs
+    - --output-file
+    - /output/eval-output.jsonl
+    - --output-metrics-file
+    - /output/metrics.json
+    - --cuda-device
+    - "0"
+    - /model/model.tar.gz
+    datasetMounts:
+    - datasetId: {}
+      subPath: {}
+      containerPath: /dataset/data.jsonl
+    - datasetId: {}
+      containerPath: /model
+    requirements:
+      gpuCount: 1
+  cluster: ai2/on-prem-ai2-server
+"""
+
+
+class ChunkResult(NamedTuple):
+    """
+    Outcome of running one chunk through a backend
+    """
+    chunk_file: str
+    job_id: Optional[str]
+    output_file: Optional[str]
+    attempts: int
+    succeeded: bool
+    elapsed: float
+
+
+class JobBackend(abc.ABC):
+    """
+    Interface for DDI inference backends
+    """
+    @abc.abstractmethod
+    async def submit(self, chunk_file: str, name: str) -> str:
+        """
+        Start a job classifying chunk_file and return its job id
+        """
+
+    @abc.abstractmethod
+    async def status(self, job_id: str) -> str:
+        """
+        Return one of JOB_RUNNING, JOB_SUCCEEDED, JOB_FAILED
+        """
+
+    @abc.abstractmethod
+    async def fetch(self, job_id: str, output_dir: str) -> str:
+        """
+        Download the job's labels into output_dir and return the label file path
+        """
+
+
+async def run_command(*args: str) -> str:
+    """
+    Run a command without blocking the event loop and return its stdout
+    :param args:
+    :return:
+    """
+    proc = await asyncio.create_subprocess_exec(
+        *args,
+        stdout=asyncio.subprocess.PIPE,
+        stderr=asyncio.subprocess.STDOUT
+    )
+    stdout, _ = await proc.communicate()
+    output = stdout.decode('utf-8')
+    if proc.returncode != 0:
+        raise RuntimeError(f"{' '.join(args)} failed: {output}")
+    return output
+
+
+class BeakerBackend(JobBackend):
+    """
+    Runs each chunk as a Beaker dataset + GPU experiment
+    """
+    def __init__(self, bert_ddi_model: str, beaker_dir: str):
+        self.bert_ddi_model = bert_ddi_model
+        self.beaker_dir = beaker_dir
+        self.dataset_ids = dict()
+
+    async def submit(self, chunk_file: str, name: str) -> str:
+        ds_output = await run_command('beaker', 'dataset', 'create', chunk_file)
+        ds_id = ds_output.strip().split('\n')[0].split()[-1]
+        self.dataset_ids[chunk_file] = ds_id
+
+        yaml_file = os.path.join(self.beaker_dir, f'{name}.yaml')
+        with open(yaml_file, 'w') as yaml_f:
+            yaml_f.write(BEAKER_TEMPLATE.format(name, ds_id, os.path.basename(chunk_file), self.bert_ddi_model))
+        exp_output = await run_command('beaker', 'experiment', 'create', yaml_file)
+        return exp_output.strip().split('\n')[0].split()[-1]
+
+    async def _inspect(self, job_id: str) -> Dict:
+        output = await run_command('beaker', 'experiment', 'get', '--format', 'json', job_id)
+        return json.loads(output)[0]['jobs'][-1]
+
+    async def status(self, job_id: str) -> str:
+        job = await self._inspect(job_id)
+        job_status = job.get('status', {})
+        if 'finalized' not in job_status and 'exited' not in job_status:
+            return JOB_RUNNING
+        if job_status.get('exitCode') == 0:
+            return JOB_SUCCEEDED
+        return JOB_FAILED
+
+    async def fetch(self, job_id: str, output_dir: str) -> str:
+        job = await self._inspect(job_id)
+        result_id = job['result']['beaker']
+        await run_command('beaker', 'dataset', 'fetch', f'--output={output_dir}', result_id)
+        return os.path.join(output_dir, EVAL_OUTPUT_FILE)
+
+
+class LocalProcessBackend(JobBackend):
+    """
+    Runs each chunk through the local CPU classifier in a process pool (see suppai.bert_ddi)
+    """
+    def __init__(self, model_dir: str, num_processes: int = 1, threads_per_process: int = 1, **model_kwargs):
+        model_kwargs.update({"model_dir": model_dir, "num_threads": threads_per_process})
+        self.executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=num_processes, initializer=init_classifier_worker, initargs=(model_kwargs,)
+        )
+        self.futures = dict()
+
+    async def submit(self, chunk_file: str, name: str) -> str:
+        output_file = f'{chunk_file}.labels.tmp'
+        future = asyncio.get_running_loop().run_in_executor(self.executor, classify_job, (chunk_file, output_file))
+        self.futures[name] = (future, output_file)
+        return name
+
+    async def status(self, job_id: str) -> str:
+        future, _ = self.futures[job_id]
+        if not future.done():
+            return JOB_RUNNING
+        return JOB_FAILED if future.exception() else JOB_SUCCEEDED
+
+    async def fetch(self, job_id: str, output_dir: str) -> str:
+        _, output_file = self.futures.pop(job_id)
+        fetched_file = os.path.join(output_dir, EVAL_OUTPUT_FILE)
+        os.replace(output_file, fetched_file)
+        return fetched_file
+
+    def close(self):
+        self.executor.shutdown()
+
+
+class FakeBackend(JobBackend):
+    """
+    In-process backend for tests: jobs "run" for a fixed time and label candidates with label_fn
+    Chunks listed in fail_once fail on their first attempt; chunks in error_once raise an unexpected error
+    (as from malformed backend output) on their first status check
+    """
+    def __init__(
+            self,
+            label_fn: Callable[[Dict], int],
+            run_time: float = 0.0,
+            fail_once: Optional[List[str]] = None,
+            error_once: Optional[List[str]] = None
+    ):
+        self.label_fn = label_fn
+        self.run_time = run_time
+        self.fail_once = set(fail_once or [])
+        self.error_once = set(error_once or [])
+        self.jobs = dict()
+        self.submissions = []
+        # jobs submitted and not yet seen finished, and the most at any time
+        self.running = set()
+        self.max_running = 0
+
+    async def submit(self, chunk_file: str, name: str) -> str:
+        job_id = f'{name}-{len(self.submissions)}'
+        fail = chunk_file in self.fail_once
+        self.fail_once.discard(chunk_file)
+        self.jobs[job_id] = (chunk_file, time.monotonic(), fail)
+        self.submissions.append(chunk_file)
+        self.running.add(job_id)
+        self.max_running = max(self.max_running, len(self.running))
+        return job_id
+
+    async def status(self, job_id: str) -> str:
+        chunk_file, start_time, fail = self.jobs[job_id]
+        if chunk_file in self.error_once:
+            self.error_once.discard(chunk_file)
+            self.running.discard(job_id)
+            raise KeyError('jobs')
+        if time.monotonic() - start_time < self.run_time:
+            return JOB_RUNNING
+        self.running.discard(job_id)
+        return JOB_FAILED if fail else JOB_SUCCEEDED
+
+    async def fetch(self, job_id: str, output_dir: str) -> str:
+        chunk_file, _, _ = self.jobs[job_id]
+        output_file = os.path.join(output_dir, EVAL_OUTPUT_FILE)
+        with open(chunk_file, 'r') as in_f, open(output_file, 'w') as out_f:
+            for line in in_f:
+                entry = json.loads(line)
+                label = self.label_fn(entry)
+                probs = [1.0 - label, float(label)]
+                json.dump(form_label_entry(entry, probs, probs), out_f)
+                out_f.write('\n')
+        return output_file
+
+
+async def run_chunk(
+        backend: JobBackend,
+        chunk_file: str,
+        name: str,
+        output_dir: str,
+        max_attempts: int = 3,
+        poll_interval: float = 30.0,
+        max_poll_interval: float = 600.0
+) -> ChunkResult:
+    """
+    Submit one chunk, poll it with exponential backoff, and fetch its labels when done
+    Failed jobs, failed commands, and incomplete outputs are retried up to max_attempts
+    :param backend:
+    :param chunk_file:
+    :param name:
+    :param output_dir:
+    :param max_attempts:
+    :param poll_interval: initial delay between status checks
+    :param max_poll_interval:
+    :return:
+    """
+    start_time = time.monotonic()
+    os.makedirs(output_dir, exist_ok=True)
+
+    # expected output size if the chunk has a manifest
+    expected_lines = read_manifest(chunk_file)["num_lines"] if os.path.exists(manifest_file(chunk_file)) else None
+
+    job_id = None
+    for attempt in range(1, max_attempts + 1):
+        try:
+            job_id = await backend.submit(chunk_file, name)
+            delay = poll_interval
+            while True:
+                status = await backend.status(job_id)
+                if status != JOB_RUNNING:
+                    break
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, max_poll_interval)
+
+            if status == JOB_SUCCEEDED:
+                output_file = await backend.fetch(job_id, output_dir)
+                if expected_lines is None or count_lines(output_file) == expected_lines:
+                    return ChunkResult(chunk_file, job_id, output_file, attempt, True, time.monotonic() - start_time)
+                print(f'{name}: incomplete output from {job_id}')
+            else:
+                print(f'{name}: job {job_id} failed')
+        except Exception as e:
+            # failed commands, and malformed backend output; other chunks keep running
+            print(f'{name}: {e!r}')
+
+    return ChunkResult(chunk_file, job_id, None, max_attempts, False, time.monotonic() - start_time)
+
+
+async def run_jobs(
+        backend: JobBackend,
+        chunk_files: List[str],
+        output_root: str,
+        max_concurrent: int = 16,
+        **kwargs
+) -> List[ChunkResult]:
+    """
+    Run all chunks concurrently; chunk i's labels are fetched into {output_root}/output_part{i:02d}
+    :param backend:
+    :param chunk_files:
+    :param output_root:
+    :param max_concurrent: cap on simultaneously active jobs
+    :param kwargs: passed to run_chunk
+    :return: results in chunk order
+    """
+    semaphore = asyncio.Semaphore(max_concurrent)
+
+    async def _run(i: int, chunk_file: str) -> ChunkResult:
+        async with semaphore:
+            result = await run_chunk(
+                backend,
+                chunk_file,
+                f'supp_ai_exp_{i:02d}',
+                os.path.join(output_root, f'output_part{i:02d}'),
+                **kwargs
+            )
+        status = 'done' if result.succeeded else 'FAILED'
+        print(f'{chunk_file}: {status} after {result.attempts} attempt(s), {result.elapsed:.0f}s')
+        return result
+
+    results = await asyncio.gather(
+        *[_run(i, chunk_file) for i, chunk_file in enumerate(chunk_files)], return_exceptions=True
+    )
+    # errors outside run_chunk's retries (e.g. creating the output directory) fail only their chunk
+    for i, result in enumerate(results):
+        if isinstance(result, BaseException):
+            print(f'{chunk_files[i]}: FAILED: {result!r}')
+            results[i] = ChunkResult(chunk_files[i], None, None, 0, False, 0.0)
+    return results
@@ -0,0 +1,205 @@
+"""
+Array-backed storage for evidence sentences in postprocess
+Fields are kept in typed columns, CUIs and paper ids are interned to integer codes, and all sentence text
+lives in one UTF-8 pool, so millions of sentences cost a few dozen bytes each plus their text instead of
+an EvidenceSentence, two LabeledSpans, two span lists, and several strings apiece
+
+"""
+
+import math
+import heapq
+from array import array
+from typing import Dict, List, Iterable, Iterator, Callable, Mapping, Optional, Tuple
+
+from suppai.data import EvidenceSentence, LabeledSpan
+
+
+class StringInterner:
+    """
+    Two-way mapping between strings and dense integer codes
+    """
+    def __init__(self):
+        self.codes: Dict[str, int] = dict()
+        self.strings: List[str] = []
+
+    def __len__(self):
+        return len(self.strings)
+
+    def intern(self, s: str) -> int:
+        code = self.codes.get(s)
+        if code is None:
+            code = len(self.strings)
+            self.codes[s] = code
+            self.strings.append(s)
+        return code
+
+
+class EvidenceStore:
+    """
+    Columnar store of evidence sentences; rows are addressed by their index
+    """
+    def __init__(self):
+        self.paper_ids = StringInterner()
+        self.cuis = StringInterner()
+
+        self.uids = array('q')
+        self.sentence_ids = array('l')
+        self.paper_codes = array('L')
+        self.arg1_codes = array('L')
+        self.arg2_codes = array('L')
+        # arg1 start, arg1 end, arg2 start, arg2 end per row
+        self.spans = array('l')
+        # NaN for missing confidence
+        self.confidences = array('d')
+
+        # sentence text pool; row i is text[text_offsets[i]:text_offsets[i + 1]]
+        self.text = bytearray()
+        self.text_offsets = array('Q', [0])
+
+    def __len__(self):
+        return len(self.uids)
+
+    def append(self, evidence: EvidenceSentence) -> int:
+        """
+        Add an evidence sentence
+        :param evidence:
+        :return: row index
+        """
+        self.uids.append(evidence.uid)
+        self.sentence_ids.append(evidence.sentence_id)
+        self.paper_codes.append(self.paper_ids.intern(evidence.paper_id))
+        self.arg1_codes.append(self.cuis.intern(evidence.arg1.id))
+        self.arg2_codes.append(self.cuis.intern(evidence.arg2.id))
+        self.spans.extend(evidence.arg1.span[:2])
+        self.spans.extend(evidence.arg2.span[:2])
+        self.confidences.append(math.nan if evidence.confidence is None else evidence.confidence)
+        self.text += evidence.sentence.encode('utf-8')
+        self.text_offsets.append(len(self.text))
+        return len(self.uids) - 1
+
+    def sentence(self, row: int) -> str:
+        return self.text[self.text_offsets[row]:self.text_offsets[row + 1]].decode('utf-8')
+
+    def paper_id(self, row: int) -> str:
+        return self.paper_ids.strings[self.paper_codes[row]]
+
+    def confidence(self, row: int) -> Optional[float]:
+        confidence = self.confidences[row]
+        return None if math.isnan(confidence) else confidence
+
+    def __getitem__(self, row: int) -> EvidenceSentence:
+        return EvidenceSentence(
+            uid=self.uids[row],
+            paper_id=self.paper_id(row),
+            sentence_id=self.sentence_ids[row],
+            sentence=self.sentence(row),
+            confidence=self.confidence(row),
+            arg1=LabeledSpan(id=self.cuis.strings[self.arg1_codes[row]], span=list(self.spans[4 * row:4 * row + 2])),
+            arg2=LabeledSpan(id=self.cuis.strings[self.arg2_codes[row]], span=list(self.spans[4 * row + 2:4 * row + 4]))
+        )
+
+    def __iter__(self) -> Iterator[EvidenceSentence]:
+        for row in range(len(self)):
+            yield self[row]
+
+    def as_json(self, row: int) -> Dict:
+        """
+        Output dict entry for a row, built directly from the columns (same as EvidenceSentence.as_json)
+        :param row:
+        :return:
+        """
+        return {
+            "uid": self.uids[row],
+            "paper_id": self.paper_id(row),
+            "sentence_id": self.sentence_ids[row],
+            "sentence": self.sentence(row),
+            "confidence": self.confidence(row),
+            "arg1": {"id": self.cuis.strings[self.arg1_codes[row]], "span": [self.spans[4 * row], self.spans[4 * row + 1]]},
+            "arg2": {"id": self.cuis.strings[self.arg2_codes[row]], "span": [self.spans[4 * row + 2], self.spans[4 * row + 3]]}
+        }
+
+
+class EvidenceList:
+    """
+    List of store rows (e.g. the sentences of one interaction), iterated as EvidenceSentences
+    """
+    __slots__ = ('store', 'rows')
+
+    def __init__(self, store: EvidenceStore, rows: Iterable[int] = ()):
+        self.store = store
+        self.rows = array('L', rows)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __iter__(self) -> Iterator[EvidenceSentence]:
+        for row in self.rows:
+            yield self.store[row]
+
+    def append(self, row: int):
+        self.rows.append(row)
+
+    def paper_ids(self) -> Iterator[str]:
+        for row in self.rows:
+            yield self.store.paper_id(row)
+
+    def filter(self, keep: Callable[[EvidenceStore, int], bool]) -> 'EvidenceList':
+        return EvidenceList(self.store, (row for row in self.rows if keep(self.store, row)))
+
+    def as_json(self) -> List[Dict]:
+        return [self.store.as_json(row) for row in self.rows]
+
+
+class JsonSentenceDict(Mapping):
+    """
+    Read-only view of interaction id -> EvidenceList as interaction id -> list of output dict entries
+    Entries are built from the store on access, so the JSON form of all sentences never exists at once
+    """
+    def __init__(self, sentence_dict: Mapping[str, EvidenceList]):
+        self.sentence_dict = sentence_dict
+
+    def __getitem__(self, interaction_id: str) -> List[Dict]:
+        return self.sentence_dict[interaction_id].as_json()
+
+    def __iter__(self):
+        return iter(self.sentence_dict)
+
+    def __len__(self):
+        return len(self.sentence_dict)
+
+
+def select_top_evidence(
+        sentence_dict: Dict[str, EvidenceList], max_sentences: int
+) -> Tuple[Dict[str, EvidenceList], Dict[str, int]]:
+    """
+    Keep the max_sentences most confident sentences per interaction, ranked by confidence
+    Sentences without confidence rank last; ties keep the earlier sentence
+    :param sentence_dict:
+    :param max_sentences: 0 keeps all sentences (still ranked)
+    :return: top sentence dict, number of sentences per interaction before the cut
+    """
+    top_sentence_dict = dict()
+    sentence_counts = dict()
+    for interaction_id, sentences in sentence_dict.items():
+        store = sentences.store
+
+        def _rank(row: int) -> Tuple[float, int]:
+            confidence = store.confidences[row]
+            return (-math.inf if math.isnan(confidence) else confidence), -store.uids[row]
+
+        if 0 < max_sentences < len(sentences):
+            # bounded min-heap of the best rows seen so far
+            heap = []
+            for row in sentences.rows:
+                item = (_rank(row), row)
+                if len(heap) < max_sentences:
+                    heapq.heappush(heap, item)
+                elif item > heap[0]:
+                    heapq.heapreplace(heap, item)
+            rows = [row for _, row in sorted(heap, reverse=True)]
+        else:
+            rows = sorted(sentences.rows, key=_rank, reverse=True)
+
+        top_sentence_dict[interaction_id] = EvidenceList(store, rows)
+        sentence_counts[interaction_id] = len(sentences)
+    return top_sentence_dict, sentence_counts
@@ -0,0 +1,91 @@
+"""
+Dictionary-based exact-match linking of mentions to CUI clusters
+Mentions whose case/whitespace-normalized text equals the preferred name, a synonym, or a tradename of exactly one
+cluster are resolved without TF-IDF vectorization or an ANN query (see ner_and_linker.link_mentions)
+
+"""
+
+import os
+import re
+import json
+import unicodedata
+from collections import defaultdict
+from typing import Dict, Optional, Callable
+
+from suppai.cui_handler import CUIHandler, CUI_FILE
+
+
+PREFERRED_NAME_FILE = 'data/preferred_names.json'
+
+WHITESPACE_RE = re.compile(r'\s+')
+
+
+def normalize_mention(text: str) -> str:
+    return WHITESPACE_RE.sub(' ', unicodedata.normalize('NFC', text)).strip().casefold()
+
+
+class ExactMatchDictionary:
+    """
+    Normalized name -> cluster CUI
+    Names shared by more than one cluster are left out (those mentions go through the ANN linker)
+    """
+    def __init__(self, names: Dict[str, str], cluster_of: Dict[str, str]):
+        """
+        :param names: normalized name -> cluster CUI
+        :param cluster_of: member CUI -> cluster CUI (to compare ANN linker output against exact matches)
+        """
+        self.names = names
+        self.cluster_of = cluster_of
+        self.num_resolved = 0
+
+    @classmethod
+    def from_handler(cls, handler: CUIHandler, preferred_names: Optional[Dict[str, str]] = None):
+        """
+        Build from the names in the CUI cluster file, and optionally preferred names (CUI -> name)
+        :param handler:
+        :param preferred_names:
+        :return:
+        """
+        name_clusters = defaultdict(set)
+        for cluster_type in ['supplements', 'drugs']:
+            for cluster_cui, cluster in handler.cluster_dict[cluster_type].items():
+                for name in [cluster['preferred_name']] + cluster['synonyms'] + cluster.get('tradenames', []):
+                    if name:
+                        name_clusters[normalize_mention(name)].add(cluster_cui)
+
+        for cui, name in (preferred_names or dict()).items():
+            cluster_cui = handler.normalize_cui(cui)
+            if cluster_cui and name:
+                name_clusters[normalize_mention(name)].add(cluster_cui)
+
+        names = {
+            name: next(iter(cluster_cuis))
+            for name, cluster_cuis in name_clusters.items()
+            if name and len(cluster_cuis) == 1 and next(iter(cluster_cuis)) in handler.map_dict
+        }
+        return cls(names, dict(handler.map_dict))
+
+    @classmethod
+    def from_files(cls, cluster_file: str = CUI_FILE, preferred_name_file: Optional[str] = PREFERRED_NAME_FILE):
+        preferred_names = None
+        if preferred_name_file and os.path.exists(preferred_name_file):
+            with open(preferred_name_file, 'r') as f:
+                preferred_names = json.load(f)
+        return cls.from_handler(CUIHandler(cluster_file), preferred_names)
+
+    def restrict(self, keep_cui: Callable[[str], bool]) -> 'ExactMatchDictionary':
+        """
+        Dictionary with only the names of clusters for which keep_cui is true
+        :param keep_cui:
+        :return:
+        """
+        return ExactMatchDictionary(
+            {name: cui for name, cui in self.names.items() if keep_cui(cui)},
+            self.cluster_of
+        )
+
+    def lookup(self, mention: str) -> Optional[str]:
+        return self.names.get(normalize_mention(mention))
+
+    def __len__(self):
+        return len(self.names)
@@ -0,0 +1,268 @@
+"""
+Interaction graph over CUIs in compressed sparse row (CSR) form, with per-edge aggregates
+Row i of the adjacency holds the interactions of the i-th CUI (CUIs sorted), ordered by sentence count (most first),
+so neighbors and "top interactions for X" are slices of flat arrays. The file is memory-mapped by InteractionGraph
+
+File layout: MAGIC, uint32 header length, JSON header, then the arrays (native byte order, 8-byte aligned)
+
+"""
+
+import os
+import sys
+import mmap
+import json
+import struct
+from array import array
+from typing import Dict, List, Mapping, Optional, Iterable, Tuple
+
+
+MAGIC = b'SUPPAIG\0'
+FORMAT_VERSION = 1
+
+# per-edge aggregates, stored as uint32 arrays aligned with the adjacency
+EDGE_FIELDS = ["sentence_count", "paper_count", "clinical_study", "human_study", "animal_study", "retraction"]
+PAPER_FLAGS = ["clinical_study", "human_study", "animal_study", "retraction"]
+
+ALIGNMENT = 8
+
+
+def interaction_aggregates(
+        interaction_ids: Iterable[str],
+        sentence_counts: Mapping[str, int],
+        interaction_papers: Mapping[str, Iterable[str]],
+        paper_dict: Mapping[str, Mapping]
+) -> Dict[str, Tuple[int, ...]]:
+    """
+    Per-interaction aggregates in EDGE_FIELDS order
+    :param interaction_ids:
+    :param sentence_counts: sentences per interaction (before any top-k cut)
+    :param interaction_papers: interaction id -> paper ids of all its sentences
+    :param paper_dict: paper id -> paper metadata (output JSON form); papers without metadata are not counted
+    :return:
+    """
+    aggregates = dict()
+    for interaction_id in interaction_ids:
+        papers = [paper_dict[paper_id] for paper_id in set(interaction_papers.get(interaction_id, ())) if paper_id in paper_dict]
+        aggregates[interaction_id] = (
+            sentence_counts.get(interaction_id, 0),
+            len(papers),
+            *(sum(1 for paper in papers if paper[flag]) for flag in PAPER_FLAGS)
+        )
+    return aggregates
+
+
+def _typed(typecode: str, values: Iterable[int]) -> array:
+    arr = array(typecode, values)
+    assert arr.itemsize == struct.calcsize(typecode)
+    return arr
+
+
+def write_interaction_graph(graph_file: str, aggregates: Mapping[str, Tuple[int, ...]], meta: Optional[Dict] = None):
+    """
+    Write the CSR interaction graph
+    :param graph_file: existing file is replaced
+    :param aggregates: interaction id ("CUI1-CUI2") -> aggregates in EDGE_FIELDS order
+    :param meta: stored in the header (e.g. last_updated_on)
+    :return:
+    """
+    rows = dict()
+    for interaction_id, values in aggregates.items():
+        cui1, cui2 = interaction_id.split('-')
+        rows.setdefault(cui1, []).append((cui2, True, values))
+        rows.setdefault(cui2, []).append((cui1, False, values))
+
+    cuis = sorted(rows)
+    node_index = {cui: i for i, cui in enumerate(cuis)}
+    cui_width = max((len(cui) for cui in cuis), default=0)
+
+    indptr = _typed('Q', [0])
+    neighbors = _typed('I', [])
+    row_first = _typed('B', [])
+    fields = {field: _typed('I', []) for field in EDGE_FIELDS}
+    for cui in cuis:
+        # most sentences first; ties by neighbor
+        for neighbor, first, values in sorted(rows[cui], key=lambda x: (-x[2][0], x[0])):
+            neighbors.append(node_index[neighbor])
+            row_first.append(first)
+            for field, value in zip(EDGE_FIELDS, values):
+                fields[field].append(value)
+        indptr.append(len(neighbors))
+
+    arrays = [
+        ("cuis", 'B', array('B', b''.join(cui.encode('ascii').ljust(cui_width, b'\0') for cui in cuis))),
+        ("indptr", 'Q', indptr),
+        ("neighbors", 'I', neighbors),
+        ("row_first", 'B', row_first)
+    ] + [(field, 'I', fields[field]) for field in EDGE_FIELDS]
+
+    # offsets are relative to the end of the (padded) header
+    layout = dict()
+    offset = 0
+    for name, typecode, arr in arrays:
+        layout[name] = {"offset": offset, "typecode": typecode, "length": len(arr)}
+        offset += -(-len(arr) * arr.itemsize // ALIGNMENT) * ALIGNMENT
+
+    header = json.dumps({
+        "format_version": FORMAT_VERSION,
+        "byteorder": sys.byteorder,
+        "num_nodes": len(cuis),
+        "num_edges": len(aggregates),
+        "cui_width": cui_width,
+        "edge_fields": EDGE_FIELDS,
+        "arrays": layout,
+        "meta": meta or dict()
+    }).encode('utf-8')
+    prefix_length = len(MAGIC) + 4 + len(header)
+    header += b' ' * (-prefix_length % ALIGNMENT)
+
+    tmp_file = f'{graph_file}.tmp'
+    with open(tmp_file, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        for name, typecode, arr in arrays:
+            data = arr.tobytes()
+            f.write(data)
+            f.write(b'\0' * (-len(data) % ALIGNMENT))
+    os.replace(tmp_file, graph_file)
+
+
+class InteractionGraph:
+    """
+    Memory-mapped reader of a graph written by write_interaction_graph
+    Arrays are exposed as memoryviews (no copies): the neighbors of node i are neighbors[indptr[i]:indptr[i + 1]],
+    and edge_array(field) is aligned with neighbors
+    """
+    def __init__(self, graph_file: str):
+        self._f = open(graph_file, 'rb')
+        self._mm = mmap.mmap(self._f.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._mm[:len(MAGIC)] != MAGIC:
+            self.close()
+            raise ValueError(f"{graph_file} is not an interaction graph")
+        header_length = struct.unpack_from('<I', self._mm, len(MAGIC))[0]
+        data_start = len(MAGIC) + 4 + header_length
+        self.header = json.loads(self._mm[len(MAGIC) + 4:data_start])
+        if self.header["format_version"] != FORMAT_VERSION or self.header["byteorder"] != sys.byteorder:
+            self.close()
+            raise ValueError(f"Unsupported interaction graph format in {graph_file}")
+
+        view = memoryview(self._mm)
+        self._arrays = dict()
+        for name, info in self.header["arrays"].items():
+            itemsize = struct.calcsize(info["typecode"])
+            start = data_start + info["offset"]
+            self._arrays[name] = view[start:start + info["length"] * itemsize].cast(info["typecode"])
+        view.release()
+
+        self.cui_width = self.header["cui_width"]
+        self.indptr = self._arrays["indptr"]
+        self.neighbors = self._arrays["neighbors"]
+
+    @property
+    def meta(self) -> Dict:
+        return self.header["meta"]
+
+    @property
+    def num_nodes(self) -> int:
+        return self.header["num_nodes"]
+
+    @property
+    def num_edges(self) -> int:
+        return self.header["num_edges"]
+
+    def edge_array(self, field: str) -> memoryview:
+        return self._arrays[field]
+
+    def cui(self, node: int) -> str:
+        start = node * self.cui_width
+        return bytes(self._arrays["cuis"][start:start + self.cui_width]).rstrip(b'\0').decode('ascii')
+
+    def node(self, cui: str) -> Optional[int]:
+        """
+        Node index of a CUI (binary search over the sorted CUIs)
+        :param cui:
+        :return: None if the CUI has no interactions
+        """
+        low, high = 0, self.num_nodes
+        while low < high:
+            mid = (low + high) // 2
+            if self.cui(mid) < cui:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.num_nodes and self.cui(low) == cui:
+            return low
+        return None
+
+    def row(self, cui: str) -> Tuple[int, int]:
+        """
+        Adjacency slice of a CUI
+        :param cui:
+        :return: (start, end); empty for unknown CUIs
+        """
+        node = self.node(cui)
+        if node is None:
+            return 0, 0
+        return self.indptr[node], self.indptr[node + 1]
+
+    def degree(self, cui: str) -> int:
+        start, end = self.row(cui)
+        return end - start
+
+    def neighbor_cuis(self, cui: str) -> List[str]:
+        start, end = self.row(cui)
+        return [self.cui(node) for node in self.neighbors[start:end]]
+
+    def _edge(self, cui: str, position: int) -> Dict:
+        neighbor = self.cui(self.neighbors[position])
+        entry = {
+            "interaction_id": f'{cui}-{neighbor}' if self._arrays["row_first"][position] else f'{neighbor}-{cui}',
+            "cui": neighbor
+        }
+        for field in EDGE_FIELDS:
+            entry[field] = self._arrays[field][position]
+        return entry
+
+    def top_interactions(self, cui: str, limit: Optional[int] = None) -> List[Dict]:
+        """
+        Interactions of a CUI with their aggregates, most sentences first
+        :param cui:
+        :param limit:
+        :return:
+        """
+        start, end = self.row(cui)
+        if limit is not None:
+            end = min(end, start + limit)
+        return [self._edge(cui, position) for position in range(start, end)]
+
+    def interaction(self, cui1: str, cui2: str) -> Optional[Dict]:
+        """
+        Aggregates of the interaction between two CUIs (scans the shorter row)
+        :param cui1:
+        :param cui2:
+        :return: None if they do not interact
+        """
+        if self.degree(cui2) < self.degree(cui1):
+            cui1, cui2 = cui2, cui1
+        other = self.node(cui2)
+        if other is None:
+            return None
+        start, end = self.row(cui1)
+        for position in range(start, end):
+            if self.neighbors[position] == other:
+                return self._edge(cui1, position)
+        return None
+
+    def close(self):
+        # views into the map must be released before it can be closed
+        for arr in getattr(self, '_arrays', dict()).values():
+            arr.release()
+        self._arrays = dict()
+        self._mm.close()
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
@@ -0,0 +1,201 @@
+"""
+Lightweight timers and counters for the pipeline hot paths
+Disabled unless SUPPAI_METRICS=1; when disabled, incr is a flag check and timer returns a shared no-op context.
+Worker processes return collect() snapshots from their tasks and the parent merges them before export()
+
+"""
+
+import os
+import json
+import time
+from collections import defaultdict
+from typing import Dict, Optional, Iterable
+
+
+ENV_ENABLED = 'SUPPAI_METRICS'
+# directory for Prometheus textfile collector output (optional)
+ENV_PROMETHEUS_DIR = 'SUPPAI_PROMETHEUS_DIR'
+PROMETHEUS_PREFIX = 'suppai'
+
+ENABLED = os.getenv(ENV_ENABLED) == '1'
+
+# derived metrics: name -> (numerator counter, denominator counter or timer)
+RATIOS = {
+    "ner.docs_per_second": ("ner.docs", "ner.document"),
+    "ner.sentences_per_second": ("ner.sentences", "ner.document"),
+    "ner.batch_docs_per_second": ("ner.docs", "ner.batch"),
+    "ner.entities_per_doc": ("ner.entities", "ner.docs"),
+    "ner.linker_candidates_per_entity": ("ner.linker_candidates", "ner.entities"),
+    "ner.linked_mentions_per_entity": ("ner.linked_mentions", "ner.entities"),
+    "ner.exact_match_rate": ("ner.exact_match.resolved", "ner.exact_match.lookups"),
+    "ner.exact_match_agreement": ("ner.exact_match.agreed", "ner.exact_match.audited"),
+    "filter.sentences_per_second": ("filter.sentences", "filter.sentence"),
+    "filter.candidates_per_sentence": ("filter.candidates", "filter.sentences"),
+    "postprocess.positive_rate": ("postprocess.positives", "postprocess.candidates")
+}
+
+_counters = defaultdict(int)
+# timer name -> [count, total seconds]
+_timers = defaultdict(lambda: [0, 0.0])
+
+
+def enable(enabled: bool = True):
+    """
+    Turn metrics on or off (also for worker processes started afterwards)
+    :param enabled:
+    :return:
+    """
+    global ENABLED
+    ENABLED = enabled
+    os.environ[ENV_ENABLED] = '1' if enabled else '0'
+
+
+def incr(name: str, value: float = 1):
+    if ENABLED:
+        _counters[name] += value
+
+
+class _Timer:
+    __slots__ = ('name', 'start')
+
+    def __init__(self, name: str):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        entry = _timers[self.name]
+        entry[0] += 1
+        entry[1] += time.perf_counter() - self.start
+        return False
+
+
+class _NullTimer:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL_TIMER = _NullTimer()
+
+
+def timer(name: str):
+    """
+    Context manager adding the elapsed time of its block to a timer
+    :param name:
+    :return:
+    """
+    return _Timer(name) if ENABLED else _NULL_TIMER
+
+
+def collect(reset: bool = True) -> Dict:
+    """
+    Snapshot of this process's metrics (to return from a worker task)
+    :param reset: clear metrics after the snapshot, so a worker's next task is not double counted
+    :return:
+    """
+    snapshot = {
+        "counters": dict(_counters),
+        "timers": {name: {"count": count, "seconds": seconds} for name, (count, seconds) in _timers.items()}
+    }
+    if reset:
+        _counters.clear()
+        _timers.clear()
+    return snapshot
+
+
+def merge(snapshots: Iterable[Optional[Dict]]):
+    """
+    Add worker snapshots to this process's metrics
+    :param snapshots: None entries (tasks run with metrics disabled) are ignored
+    :return:
+    """
+    for snapshot in snapshots:
+        if not snapshot:
+            continue
+        for name, value in snapshot["counters"].items():
+            _counters[name] += value
+        for name, entry in snapshot["timers"].items():
+            _timers[name][0] += entry["count"]
+            _timers[name][1] += entry["seconds"]
+
+
+def summary() -> Dict:
+    """
+    Counters, timers, and derived ratios of this process
+    :return:
+    """
+    snapshot = collect(reset=False)
+    ratios = dict()
+    for name, (numerator, denominator) in RATIOS.items():
+        if numerator not in _counters:
+            continue
+        if denominator in _timers:
+            denominator_value = _timers[denominator][1]
+        else:
+            denominator_value = _counters.get(denominator, 0)
+        if denominator_value:
+            ratios[name] = _counters[numerator] / denominator_value
+    snapshot["ratios"] = ratios
+    return snapshot
+
+
+def _prometheus_name(name: str) -> str:
+    return f"{PROMETHEUS_PREFIX}_{''.join(c if c.isalnum() else '_' for c in name)}"
+
+
+def write_prometheus(prom_file: str, stage: str, metrics: Dict):
+    """
+    Write metrics in the Prometheus text exposition format (for the node exporter textfile collector)
+    :param prom_file:
+    :param stage: value of the stage label
+    :param metrics: output of summary()
+    :return:
+    """
+    lines = []
+    for name, value in sorted(metrics["counters"].items()):
+        metric = _prometheus_name(name) + '_total'
+        lines += [f'# TYPE {metric} counter', f'{metric}{{stage="{stage}"}} {value}']
+    for name, entry in sorted(metrics["timers"].items()):
+        metric = _prometheus_name(name) + '_seconds'
+        lines += [
+            f'# TYPE {metric} summary',
+            f'{metric}_sum{{stage="{stage}"}} {entry["seconds"]}',
+            f'{metric}_count{{stage="{stage}"}} {entry["count"]}'
+        ]
+    for name, value in sorted(metrics["ratios"].items()):
+        metric = _prometheus_name(name)
+        lines += [f'# TYPE {metric} gauge', f'{metric}{{stage="{stage}"}} {value}']
+
+    # write atomically so the collector never reads a partial file
+    with open(prom_file + '.tmp', 'w') as f:
+        f.write('\n'.join(lines) + '\n')
+    os.replace(prom_file + '.tmp', prom_file)
+
+
+def export(stage: str, output_dir: str, extra: Optional[Dict] = None) -> Optional[str]:
+    """
+    Write {output_dir}/{stage}.metrics.json (and a Prometheus textfile if SUPPAI_PROMETHEUS_DIR is set)
+    :param stage: e.g. preprocess, postprocess
+    :param output_dir:
+    :param extra: additional fields for the JSON file (e.g. run header)
+    :return: JSON metrics file, or None if metrics are disabled
+    """
+    if not ENABLED:
+        return None
+    metrics = summary()
+    os.makedirs(output_dir, exist_ok=True)
+    metrics_file = os.path.join(output_dir, f'{stage}.metrics.json')
+    with open(metrics_file, 'w') as f:
+        json.dump(dict(extra or dict(), stage=stage, **metrics), f, indent=4, sort_keys=True)
+
+    prometheus_dir = os.getenv(ENV_PROMETHEUS_DIR)
+    if prometheus_dir:
+        write_prometheus(os.path.join(prometheus_dir, f'{PROMETHEUS_PREFIX}_{stage}.prom'), stage, metrics)
+    return metrics_file
@@ -0,0 +1,265 @@
+"""
+Autocomplete index over CUI names (preferred names, synonyms, tradenames)
+Prefix matches come from a sorted array of normalized names and their word suffixes (binary search, with the top
+results of prefixes matching many keys precomputed); misspelled queries fall back to a trigram index, searched from
+the rarest query trigrams. Built at postprocess time from the CUI metadata dict and loaded fully into memory by
+NameIndex (see scripts/benchmark_name_index.py for search latency)
+
+"""
+
+import re
+import math
+import gzip
+import json
+import heapq
+import bisect
+import unicodedata
+from collections import Counter
+from typing import Dict, List, Mapping, Optional, Tuple, Set
+
+
+FORMAT_VERSION = 2
+
+NAME_TYPES = ["preferred_name", "tradename", "synonym"]
+# prefixes matching more keys than this have their top results precomputed
+DENSE_PREFIX_KEYS = 32
+DENSE_PREFIX_TOP = 20
+# fraction of the query trigrams a name must contain to be a fuzzy match
+FUZZY_MIN_CONTAINMENT = 0.5
+# trigram postings counted per fuzzy query (rarest trigrams first; at least one trigram is counted)
+FUZZY_MAX_POSTINGS = 2048
+# names compared with the whole query when common query trigrams are not counted
+FUZZY_MAX_CANDIDATES = 64
+
+NON_ALNUM_RE = re.compile(r'[^\w]+|_')
+
+
+def normalize_name(text: str) -> str:
+    """
+    Case, accent, punctuation, and whitespace insensitive form of a name or query
+    :param text:
+    :return:
+    """
+    text = ''.join(c for c in unicodedata.normalize('NFKD', text) if not unicodedata.combining(c))
+    return NON_ALNUM_RE.sub(' ', text.casefold()).strip()
+
+
+def name_trigrams(normalized: str, complete: bool = True) -> Set[str]:
+    """
+    Character trigrams of a normalized name, padded at the start (and at the end if the text is complete;
+    a typed query may stop mid-word)
+    :param normalized:
+    :param complete:
+    :return:
+    """
+    padded = f' {normalized} ' if complete else f' {normalized}'
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _word_suffixes(normalized: str) -> List[str]:
+    words = normalized.split(' ')
+    return [' '.join(words[i:]) for i in range(len(words))]
+
+
+def build_name_index(
+        cui_dict: Mapping[str, Dict],
+        weights: Optional[Mapping[str, int]] = None,
+        dense_prefix_keys: int = DENSE_PREFIX_KEYS
+) -> Dict:
+    """
+    Build the index from the CUI metadata dict (output JSON form)
+    :param cui_dict:
+    :param weights: CUI -> popularity (e.g. number of interactions) to rank otherwise equal matches
+    :param dense_prefix_keys: precompute the top results of prefixes matching more keys than this
+    :return: index in its serialized form
+    """
+    weights = weights or dict()
+    cuis = sorted(cui_dict)
+    names = []
+    seen = set()
+    for cui_index, cui in enumerate(cuis):
+        entry = cui_dict[cui]
+        typed_names = [(entry["preferred_name"], "preferred_name")] + \
+                      [(name, "tradename") for name in entry.get("tradenames", [])] + \
+                      [(name, "synonym") for name in entry.get("synonyms", [])]
+        for name, name_type in typed_names:
+            normalized = normalize_name(name or '')
+            # one entry per normalized name and CUI (the first, best typed one)
+            if normalized and (normalized, cui) not in seen:
+                seen.add((normalized, cui))
+                names.append([name, normalized, cui_index, NAME_TYPES.index(name_type)])
+
+    keys = sorted((key, name_id) for name_id, name in enumerate(names) for key in _word_suffixes(name[1]))
+
+    trigrams = dict()
+    for name_id, name in enumerate(names):
+        for trigram in name_trigrams(name[1]):
+            trigrams.setdefault(trigram, []).append(name_id)
+
+    index = {
+        "format_version": FORMAT_VERSION,
+        "cuis": cuis,
+        "weights": [weights.get(cui, 0) for cui in cuis],
+        "names": names,
+        "keys": keys,
+        "trigrams": trigrams,
+        "dense_prefixes": dict()
+    }
+
+    # precompute top results of prefixes with large key ranges (a prefix can only be dense if its parent is)
+    name_index = NameIndex(index)
+    dense_prefixes = dict()
+    prefixes = sorted(set(key[:1] for key in name_index.keys))
+    while prefixes:
+        prefix = prefixes.pop()
+        start, end = name_index._key_range(prefix)
+        if end - start <= dense_prefix_keys:
+            continue
+        top = name_index._prefix_matches(prefix, DENSE_PREFIX_TOP, precomputed=False)
+        dense_prefixes[prefix] = [name_id for name_id, _ in top]
+        prefixes += sorted(set(
+            name_index.keys[position][:len(prefix) + 1] for position in range(start, end)
+            if len(name_index.keys[position]) > len(prefix)
+        ))
+    index["dense_prefixes"] = dict(sorted(dense_prefixes.items()))
+    return index
+
+
+def write_name_index(
+        index_file: str,
+        cui_dict: Mapping[str, Dict],
+        weights: Optional[Mapping[str, int]] = None,
+        meta: Optional[Dict] = None
+):
+    index = build_name_index(cui_dict, weights)
+    index["meta"] = meta or dict()
+    with gzip.open(index_file, 'wt') as f:
+        json.dump(index, f, separators=(',', ':'))
+
+
+class NameIndex:
+    """
+    Ranked CUI lookup for a (partial or misspelled) name
+    Prefix matches rank first: whole-name before inner-word matches, then preferred names before tradenames before
+    synonyms, then by CUI weight and name length. Fuzzy matches fill the remaining results
+    """
+    def __init__(self, index: Dict):
+        """
+        :param index: as returned by build_name_index (use NameIndex.load for a file)
+        """
+        assert index["format_version"] == FORMAT_VERSION
+        self.meta = index.get("meta", dict())
+        self.cuis = index["cuis"]
+        self.weights = index["weights"]
+        self.names = index["names"]
+        self.keys = [key for key, _ in index["keys"]]
+        self.key_names = [name_id for _, name_id in index["keys"]]
+        self.trigrams = index["trigrams"]
+        self.dense_prefixes = index["dense_prefixes"]
+        self.trigram_counts = [len(name_trigrams(name[1])) for name in self.names]
+
+    @classmethod
+    def load(cls, index_file: str) -> 'NameIndex':
+        with gzip.open(index_file, 'rt') as f:
+            return cls(json.load(f))
+
+    def _rank(self, name_id: int, inner: bool) -> Tuple:
+        _, normalized, cui_index, type_index = self.names[name_id]
+        return inner, type_index, -self.weights[cui_index], len(normalized), name_id
+
+    def _top(self, ranked: List[Tuple[Tuple, int]], limit: int, exclude: Set[int] = frozenset()) -> List[Tuple[int, Tuple]]:
+        """
+        Best name per CUI, in rank order
+        :param ranked: (rank, name id)
+        :param limit:
+        :param exclude: CUI indices to leave out
+        :return: (name id, rank)
+        """
+        # partial sorts, widened only when names of the same (or excluded) CUIs crowd out the limit
+        num_best = 2 * limit + len(exclude)
+        while True:
+            results = []
+            seen = set(exclude)
+            best = heapq.nsmallest(num_best, ranked)
+            for rank, name_id in best:
+                cui_index = self.names[name_id][2]
+                if cui_index not in seen:
+                    seen.add(cui_index)
+                    results.append((name_id, rank))
+                    if len(results) >= limit:
+                        return results
+            if len(best) < num_best:
+                return results
+            num_best *= 4
+
+    def _key_range(self, prefix: str) -> Tuple[int, int]:
+        start = bisect.bisect_left(self.keys, prefix)
+        return start, bisect.bisect_left(self.keys, prefix + '\U0010ffff', start)
+
+    def _prefix_matches(self, prefix: str, limit: int, precomputed: bool = True) -> List[Tuple[int, Tuple]]:
+        if precomputed and prefix in self.dense_prefixes and limit <= DENSE_PREFIX_TOP:
+            return [(name_id, None) for name_id in self.dense_prefixes[prefix][:limit]]
+        start, end = self._key_range(prefix)
+        ranked = []
+        for position in range(start, end):
+            name_id = self.key_names[position]
+            exact = self.keys[position] == prefix and len(self.names[name_id][1]) == len(prefix)
+            inner = len(self.keys[position]) != len(self.names[name_id][1])
+            ranked.append(((not exact,) + self._rank(name_id, inner), name_id))
+        return self._top(ranked, limit)
+
+    def _fuzzy_matches(self, query: str, limit: int, exclude: Set[int]) -> List[Tuple[int, Tuple]]:
+        """
+        Names containing at least FUZZY_MIN_CONTAINMENT of the query trigrams, by number of shared trigrams
+        Postings are counted from the rarest query trigram on, up to FUZZY_MAX_POSTINGS; if common trigrams are left
+        out, the FUZZY_MAX_CANDIDATES names sharing the most counted trigrams are compared with the whole query
+        """
+        query_trigrams = name_trigrams(query, complete=False)
+        min_overlap = math.ceil(FUZZY_MIN_CONTAINMENT * len(query_trigrams))
+        overlaps = Counter()
+        num_counted = 0
+        num_postings = 0
+        for trigram in sorted(query_trigrams, key=lambda t: len(self.trigrams.get(t, ()))):
+            postings = self.trigrams.get(trigram, ())
+            if num_counted and num_postings + len(postings) > FUZZY_MAX_POSTINGS:
+                break
+            overlaps.update(postings[:FUZZY_MAX_POSTINGS])
+            num_counted += 1
+            num_postings += len(postings)
+
+        if num_counted < len(query_trigrams):
+            overlaps = {
+                name_id: len(query_trigrams & name_trigrams(self.names[name_id][1]))
+                for name_id, _ in overlaps.most_common(FUZZY_MAX_CANDIDATES)
+            }
+
+        ranked = []
+        for name_id, overlap in overlaps.items():
+            if overlap >= min_overlap:
+                dice = 2 * overlap / (len(query_trigrams) + self.trigram_counts[name_id])
+                ranked.append(((-overlap, -dice) + self._rank(name_id, False), name_id))
+        return self._top(ranked, limit, exclude)
+
+    def search(self, query: str, limit: int = 10, fuzzy: bool = True) -> List[Tuple[str, str, str]]:
+        """
+        CUIs matching a typed query
+        :param query: partial name (matched as a prefix of a name or of any of its words), possibly misspelled
+        :param limit:
+        :param fuzzy: fill remaining results with trigram matches
+        :return: (cui, matched name, name type), best match first, one entry per CUI
+        """
+        normalized = normalize_name(query)
+        if not normalized or limit <= 0:
+            return []
+        matches = self._prefix_matches(normalized, limit)
+        if fuzzy and len(matches) < limit:
+            found = set(self.names[name_id][2] for name_id, _ in matches)
+            matches += self._fuzzy_matches(normalized, limit - len(matches), found)
+        results = []
+        for name_id, _ in matches:
+            name, _, cui_index, type_index = self.names[name_id]
+            results.append((self.cuis[cui_index], name, NAME_TYPES[type_index]))
+        return results
+
+    def __len__(self):
+        return len(self.names)
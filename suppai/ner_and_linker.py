@@ -3,12 +3,16 @@ Classes and methods for running NER and linking over downloaded articles
 
 """
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 
 import spacy
+from spacy.tokens import Doc, Span
 from scispacy.umls_linking import UmlsEntityLinker
 from scispacy.abbreviation import AbbreviationDetector
 
+from suppai import metrics
+from suppai.exact_match import ExactMatchDictionary
+
 
 # only keep entities of the following types
 KEEP_TYPES = {
@@ -29,10 +33,17 @@ KEEP_TYPES = {
 # only keep checking if top matches are less than this threshold
 BETTER_SCORE_THRESHOLD = 0.95
 
+# with metrics enabled, also send every nth exact match to the ANN linker to measure agreement (0 disables)
+EXACT_MATCH_AUDIT_EVERY = 50
+
 
 # class for running scispacy NER and linking over abstracts and keeping matching linking results
 class DrugSupplementLinker:
-    def __init__(self):
+    def __init__(self, kb_dir: Optional[str] = None, exact_matcher: Optional[ExactMatchDictionary] = None):
+        """
+        :param kb_dir: link against a restricted KB built by scripts/build_restricted_kb.py instead of all of UMLS
+        :param exact_matcher: resolve exact name matches of CUI clusters before the UMLS linker
+        """
         print('loading scispacy (takes a moment)...')
 
         # remove unused pipes from scispacy
@@ -48,7 +59,21 @@ class DrugSupplementLinker:
         # resolve_abbreviations uses abbreviation detection results for linking
         # filter_for_definitions allows linker to link to entities without definitions in UMLS
         # threshold determines which results to return (set to more stringent to improve precision)
-        self.nlp.add_pipe("scispacy_linker", config={"resolve_abbreviations": True, "linker_name": "umls"})
+        linker_name = "umls"
+        if kb_dir:
+            from suppai.restricted_kb import register_restricted_linker
+            linker_name = register_restricted_linker(kb_dir)
+        self.nlp.add_pipe("scispacy_linker", config={"resolve_abbreviations": True, "linker_name": linker_name})
+
+        # only keep exact matches the linker could have returned (in the KB, with a kept semantic type)
+        self.exact_matcher = None
+        if exact_matcher is not None:
+            kb = self.nlp.get_pipe("scispacy_linker").kb
+            self.exact_matcher = exact_matcher.restrict(
+                lambda cui: cui in kb.cui_to_entity
+                and (not KEEP_TYPES or bool(set(kb.cui_to_entity[cui].types).intersection(KEEP_TYPES)))
+            )
+            print(f'{len(self.exact_matcher)} names for exact-match linking.')
 
     def get_linked_entities(self, text: str, top_k=1) -> List[Dict]:
         """
@@ -57,8 +82,56 @@ class DrugSupplementLinker:
         :param top_k:
         :return:
         """
-        doc = self.nlp(text)
+        with metrics.timer("ner.document"):
+            return self._get_linked_entities(text, top_k)
+
+    def _run_pipeline(self, text: str):
+        if not metrics.ENABLED and self.exact_matcher is None:
+            return self.nlp(text)
+        # time each pipe separately (same as nlp(text))
+        with metrics.timer("ner.pipe.tokenizer"):
+            doc = self.nlp.make_doc(text)
+        for name, proc in self.nlp.pipeline:
+            with metrics.timer(f"ner.pipe.{name}"):
+                if name == "scispacy_linker" and self.exact_matcher is not None:
+                    link_mentions(proc, list(doc.ents), self.exact_matcher)
+                else:
+                    doc = proc(doc)
+        return doc
+
+    def get_linked_entities_batch(self, texts: List[str], top_k=1) -> List[List[Dict]]:
+        """
+        Two-phase get_linked_entities over a batch of documents
+        NER and sentence segmentation run first; UMLS candidate generation and linking then run in one batched
+        call, only on mentions in sentences with at least two distinct mention strings (other sentences can never
+        yield an entity pair, so they are returned without linked entities)
+        :param texts:
+        :param top_k:
+        :return: entities by sentence for each text
+        """
         linker = self.nlp.get_pipe("scispacy_linker")
+        with metrics.timer("ner.batch"):
+            with self.nlp.select_pipes(disable=["scispacy_linker"]):
+                docs = list(self.nlp.pipe(texts))
+
+            mentions = []
+            for doc in docs:
+                for sent in doc.sents:
+                    if len(set(ent.text.strip() for ent in sent.ents)) >= 2:
+                        mentions += sent.ents
+            metrics.incr("ner.linked_mentions", len(mentions))
+            link_mentions(linker, mentions, self.exact_matcher)
+
+            return [self._entities_by_sentence(doc, linker, top_k) for doc in docs]
+
+    def _get_linked_entities(self, text: str, top_k: int) -> List[Dict]:
+        doc = self._run_pipeline(text)
+        linker = self.nlp.get_pipe("scispacy_linker")
+        return self._entities_by_sentence(doc, linker, top_k)
+
+    @staticmethod
+    def _entities_by_sentence(doc, linker, top_k: int) -> List[Dict]:
+        metrics.incr("ner.docs")
 
         # keep list of relevant entities (those with matching semantic types)
         entities_by_sentence = []
@@ -66,8 +139,11 @@ class DrugSupplementLinker:
         for sent_id, sent in enumerate(doc.sents):
 
             relevant_ents = []
+            metrics.incr("ner.sentences")
 
             for ent in sent.ents:
+                metrics.incr("ner.entities")
+                metrics.incr("ner.linker_candidates", len(ent._.kb_ents))
 
                 # list of linked entities from scispacy output
                 # linked_ents = [(linker.umls.cui_to_entity[cui], score) for cui, score in ent._.umls_ents[:top_k]]
@@ -98,10 +174,77 @@ class DrugSupplementLinker:
                     })
 
             if relevant_ents:
+                metrics.incr("ner.relevant_entities", len(relevant_ents))
                 entities_by_sentence.append({
                     "sent_num": sent_id,
                     "sentence": sent.text,
                     "entities": relevant_ents
                 })
 
-        return entities_by_sentence
\ No newline at end of file
+        return entities_by_sentence
+
+
+def link_mentions(linker, mentions: List, exact_matcher: Optional[ExactMatchDictionary] = None) -> None:
+    """
+    Set kb_ents of the given mentions with one batched candidate generation call
+    (same mention strings, scoring, and filtering as running the scispacy_linker pipe over their documents)
+    :param linker: scispacy EntityLinker pipe
+    :param mentions: entity spans
+    :param exact_matcher: resolve exact name matches of CUI clusters first, sending only the rest to the ANN index
+    :return:
+    """
+    if not mentions:
+        return
+    mention_strings = []
+    resolve_abbreviations = linker.resolve_abbreviations and Doc.has_extension("abbreviations")
+    for ent in mentions:
+        long_form = ent._.long_form if resolve_abbreviations else None
+        if isinstance(long_form, Span):
+            mention_strings.append(long_form.text)
+        elif isinstance(long_form, str):
+            mention_strings.append(long_form)
+        else:
+            mention_strings.append(ent.text)
+
+    to_search = list(range(len(mentions)))
+    # mention index -> exact match, for exact matches also sent to the ANN index to measure agreement
+    audited = dict()
+    if exact_matcher is not None:
+        to_search = []
+        for i, mention_string in enumerate(mention_strings):
+            metrics.incr("ner.exact_match.lookups")
+            cui = exact_matcher.lookup(mention_string)
+            if cui is None:
+                to_search.append(i)
+                continue
+            metrics.incr("ner.exact_match.resolved")
+            mentions[i]._.kb_ents = [(cui, 1.0)]
+            exact_matcher.num_resolved += 1
+            if metrics.ENABLED and EXACT_MATCH_AUDIT_EVERY and exact_matcher.num_resolved % EXACT_MATCH_AUDIT_EVERY == 0:
+                audited[i] = cui
+                to_search.append(i)
+    if not to_search:
+        return
+
+    batch_candidates = linker.candidate_generator([mention_strings[i] for i in to_search], linker.k)
+
+    for i, candidates in zip(to_search, batch_candidates):
+        predicted = []
+        for cand in candidates:
+            score = max(cand.similarities)
+            if (
+                linker.filter_for_definitions
+                and linker.kb.cui_to_entity[cand.concept_id].definition is None
+                and score < linker.no_definition_threshold
+            ):
+                continue
+            if score > linker.threshold:
+                predicted.append((cand.concept_id, score))
+        kb_ents = sorted(predicted, reverse=True, key=lambda x: x[1])[:linker.max_entities_per_mention]
+
+        if i in audited:
+            metrics.incr("ner.exact_match.audited")
+            if kb_ents and exact_matcher.cluster_of.get(kb_ents[0][0]) == audited[i]:
+                metrics.incr("ner.exact_match.agreed")
+            continue
+        mentions[i]._.kb_ents = kb_ents
@@ -0,0 +1,210 @@
+"""
+Sharded output bundle (format version 2)
+Each output dict is split into compact JSON shards by key prefix (CUIs, interaction ids) or
+key suffix (paper ids), with a top-level index, so consumers can load only the shards they need
+
+"""
+
+import os
+import json
+from collections import OrderedDict, defaultdict
+from typing import Dict, List, Mapping, Optional, Iterator, Tuple
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+FORMAT_VERSION = 2
+INDEX_FILE = 'index.json'
+
+# dataset name -> (shard by, key length)
+# CUIs are C + 7 digits and interaction ids start with a CUI, so their prefixes spread well;
+# paper ids are S2 corpus ids of varying length, so they are sharded by their last digits
+SHARD_SCHEMES = {
+    "cuis": ("prefix", 5),
+    "interactions": ("prefix", 5),
+    "sentences": ("prefix", 5),
+    "sentence_counts": ("prefix", 5),
+    "papers": ("suffix", 2)
+}
+
+ZSTD_LEVEL = 10
+
+
+def shard_key(key: str, shard_by: str, key_length: int) -> str:
+    """
+    Shard name for a dict key
+    :param key:
+    :param shard_by: "prefix" or "suffix"
+    :param key_length: number of leading/trailing characters used
+    :return:
+    """
+    if shard_by == "prefix":
+        return key[:key_length]
+    return key[-key_length:].rjust(key_length, '0')
+
+
+def _compress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == 'zstd':
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL).compress(data)
+    return data
+
+
+def _decompress(data: bytes, compression: Optional[str]) -> bytes:
+    if compression == 'zstd':
+        return zstandard.ZstdDecompressor().decompress(data)
+    return data
+
+
+def write_sharded_bundle(
+        output_dir: str,
+        datasets: Dict[str, Mapping],
+        meta: Dict,
+        compression: Optional[str] = None,
+        shard_schemes: Dict[str, Tuple[str, int]] = SHARD_SCHEMES
+) -> Dict:
+    """
+    Write output dicts as a sharded bundle
+    :param output_dir:
+    :param datasets: dataset name (cuis, interactions, sentences, papers) -> JSON-serializable mapping
+    :param meta: bundle metadata (e.g. last_updated_on)
+    :param compression: None or "zstd" (per shard)
+    :param shard_schemes: dataset name -> (shard by, key length)
+    :return: index dict
+    """
+    if compression == 'zstd' and zstandard is None:
+        raise ImportError("zstd compression requires the zstandard package")
+    extension = '.json.zst' if compression == 'zstd' else '.json'
+
+    index = {
+        "format_version": FORMAT_VERSION,
+        "compression": compression,
+        "meta": meta,
+        "datasets": dict()
+    }
+
+    for name, data in datasets.items():
+        shard_by, key_length = shard_schemes[name]
+        os.makedirs(os.path.join(output_dir, name), exist_ok=True)
+
+        # group keys by shard
+        shard_keys = defaultdict(list)
+        for key in data.keys():
+            shard_keys[shard_key(key, shard_by, key_length)].append(key)
+
+        shards = dict()
+        for shard, keys in sorted(shard_keys.items()):
+            shard_file = os.path.join(name, f'{shard}{extension}')
+            shard_data = {key: data[key] for key in sorted(keys)}
+            # sorted keys, so a release rebuilt from a delta (sorted JSON) has identical shards
+            serialized = json.dumps(shard_data, separators=(',', ':'), sort_keys=True).encode('utf-8')
+            with open(os.path.join(output_dir, shard_file), 'wb') as out_f:
+                out_f.write(_compress(serialized, compression))
+            shards[shard] = {
+                "file": shard_file,
+                "count": len(keys)
+            }
+
+        index["datasets"][name] = {
+            "shard_by": shard_by,
+            "key_length": key_length,
+            "count": sum(shard["count"] for shard in shards.values()),
+            "shards": shards
+        }
+
+    with open(os.path.join(output_dir, INDEX_FILE), 'w') as out_f:
+        json.dump(index, out_f, indent=4, sort_keys=True)
+
+    return index
+
+
+class ShardedBundle:
+    """
+    Lazy reader for a sharded bundle; shards are loaded on first access and kept in an LRU cache
+    """
+    def __init__(self, bundle_dir: str, max_cached_shards: int = 64):
+        self.bundle_dir = bundle_dir
+        with open(os.path.join(bundle_dir, INDEX_FILE), 'r') as f:
+            self.index = json.load(f)
+        assert self.index["format_version"] == FORMAT_VERSION
+        self.compression = self.index["compression"]
+        self.meta = self.index["meta"]
+        self.max_cached_shards = max_cached_shards
+        self._shard_cache = OrderedDict()
+
+    def _load_shard(self, name: str, shard: str) -> Dict:
+        cache_key = (name, shard)
+        if cache_key in self._shard_cache:
+            self._shard_cache.move_to_end(cache_key)
+            return self._shard_cache[cache_key]
+
+        shard_info = self.index["datasets"][name]["shards"].get(shard)
+        if shard_info is None:
+            shard_data = dict()
+        else:
+            with open(os.path.join(self.bundle_dir, shard_info["file"]), 'rb') as f:
+                shard_data = json.loads(_decompress(f.read(), self.compression))
+
+        self._shard_cache[cache_key] = shard_data
+        if len(self._shard_cache) > self.max_cached_shards:
+            self._shard_cache.popitem(last=False)
+        return shard_data
+
+    def get(self, name: str, key: str, default=None):
+        """
+        Look up one key of a dataset, loading only its shard
+        :param name: cuis, interactions, sentences, or papers
+        :param key:
+        :param default:
+        :return:
+        """
+        dataset = self.index["datasets"][name]
+        shard = shard_key(key, dataset["shard_by"], dataset["key_length"])
+        return self._load_shard(name, shard).get(key, default)
+
+    def get_cui(self, cui: str) -> Optional[Dict]:
+        return self.get("cuis", cui)
+
+    def get_interactions(self, cui: str) -> List[str]:
+        return self.get("interactions", cui, [])
+
+    def get_sentences(self, interaction_id: str) -> List[Dict]:
+        return self.get("sentences", interaction_id, [])
+
+    def get_sentence_count(self, interaction_id: str) -> int:
+        """
+        Number of evidence sentences for an interaction, including those cut from the top-k sentences
+        :param interaction_id:
+        :return:
+        """
+        if "sentence_counts" not in self.index["datasets"]:
+            return len(self.get_sentences(interaction_id))
+        return self.get("sentence_counts", interaction_id, 0)
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        return self.get("papers", paper_id)
+
+    def get_cui_evidence(self, cui: str) -> Dict[str, List[Dict]]:
+        """
+        All evidence sentences for a CUI, keyed by interaction id
+        :param cui:
+        :return:
+        """
+        return {interaction_id: self.get_sentences(interaction_id) for interaction_id in self.get_interactions(cui)}
+
+    def shards(self, name: str) -> List[str]:
+        return sorted(self.index["datasets"][name]["shards"].keys())
+
+    def items(self, name: str) -> Iterator[Tuple[str, object]]:
+        """
+        Iterate over all entries of a dataset, one shard at a time (bypasses the shard cache)
+        :param name:
+        :return:
+        """
+        for shard in self.shards(name):
+            shard_info = self.index["datasets"][name]["shards"][shard]
+            with open(os.path.join(self.bundle_dir, shard_info["file"]), 'rb') as f:
+                shard_data = json.loads(_decompress(f.read(), self.compression))
+            yield from shard_data.items()
@@ -0,0 +1,303 @@
+"""
+Incremental output patches between releases
+A delta holds, per output dict, the entries added or changed (upsert) and the keys removed (delete)
+relative to a previous release, and the output format of the new release; applying it to that release reproduces
+the new release tarball byte for byte
+
+"""
+
+import os
+import gzip
+import json
+import shutil
+import tarfile
+import tempfile
+from typing import Dict, Iterable, Mapping, Tuple, Optional
+
+from suppai.output_bundle import ShardedBundle, INDEX_FILE, write_sharded_bundle
+from suppai.packaging import write_archive, json_member, release_mtime
+from suppai.utils.file_utils import iter_json_items
+
+
+# version 2 adds the output format of the new release
+DELTA_FORMAT_VERSION = 2
+# output format of releases, and of deltas without one (version 1)
+LEGACY_OUTPUT = {"format": "legacy"}
+
+# dataset name -> file name in a legacy release tarball
+LEGACY_FILES = {
+    "interactions": "interaction_id_dict.json",
+    "sentences": "sentence_dict.json",
+    "sentence_counts": "sentence_counts.json",
+    "papers": "paper_metadata.json",
+    "cuis": "cui_metadata.json"
+}
+LEGACY_META_FILE = "meta.json"
+# directory of the bundle in a sharded release tarball
+SHARDED_RELEASE_DIR = "bundle"
+
+
+def load_release(tar_file: str) -> Tuple[Dict[str, Dict], Dict]:
+    """
+    Load all output dicts of a release tarball (legacy or sharded format)
+    :param tar_file:
+    :return: (dataset name -> dict, meta)
+    """
+    with tarfile.open(tar_file, 'r:*') as tar:
+        names = set(tar.getnames())
+        bundle_index = [name for name in names if os.path.basename(name) == INDEX_FILE]
+
+        if bundle_index:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                tar.extractall(temp_dir, filter='data')
+                bundle = ShardedBundle(os.path.join(temp_dir, os.path.dirname(bundle_index[0])))
+                datasets = {name: dict(bundle.items(name)) for name in bundle.index["datasets"]}
+                return datasets, bundle.meta
+
+        datasets = dict()
+        for name, file_name in LEGACY_FILES.items():
+            # releases before sentence counts lack some files
+            if file_name in names:
+                datasets[name] = json.load(tar.extractfile(file_name))
+        meta = json.load(tar.extractfile(LEGACY_META_FILE)) if LEGACY_META_FILE in names else dict()
+        return datasets, meta
+
+
+def write_legacy_release(
+        output_file: str,
+        datasets: Mapping[str, Mapping],
+        meta: Dict,
+        work_dir: Optional[str] = 'output/',
+        mtime: int = 0
+):
+    """
+    Stream output dicts as indented JSON into a legacy release tarball
+    :param output_file:
+    :param datasets: dataset name -> dict (keys of LEGACY_FILES)
+    :param meta:
+    :param work_dir: if given, loose copies of the JSON files are also written here
+    :param mtime: member modification time (see write_archive)
+    :return:
+    """
+    members = [
+        (file_name, json_member(datasets[name], indent=4, sort_keys=True))
+        for name, file_name in LEGACY_FILES.items() if name in datasets
+    ]
+    members.append((LEGACY_META_FILE, json_member(meta)))
+    write_archive(output_file, members, copy_dir=work_dir, mtime=mtime)
+
+
+def write_sharded_release(
+        output_file: str,
+        datasets: Mapping[str, Mapping],
+        meta: Dict,
+        bundle_dir: str,
+        compression: Optional[str] = None,
+        mtime: int = 0
+):
+    """
+    Write output dicts as a sharded bundle and tar the bundle directory
+    :param output_file:
+    :param datasets:
+    :param meta:
+    :param bundle_dir: bundle directory to write (replaced if it exists)
+    :param compression: shard compression (see write_sharded_bundle)
+    :param mtime: member modification time (see write_archive)
+    :return:
+    """
+    if os.path.exists(bundle_dir):
+        shutil.rmtree(bundle_dir)
+
+    index = write_sharded_bundle(bundle_dir, datasets, meta, compression=compression)
+    print(f'{sum(len(d["shards"]) for d in index["datasets"].values())} shards written to {bundle_dir}')
+
+    members = []
+    for root, dir_names, file_names in os.walk(bundle_dir):
+        # walk in sorted order, so the member order does not depend on the file system
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            members.append((os.path.join(SHARDED_RELEASE_DIR, os.path.relpath(file_path, bundle_dir)), file_path))
+    write_archive(output_file, members, mtime=mtime)
+
+
+def apply_release_delta(previous_release_file: str, delta_file: str, output_file: str, work_dir: str):
+    """
+    Rebuild a release tarball from the previous release and a delta, in the format of the new release and dated
+    with its timestamp, so the result is identical to the tarball postprocess wrote
+    :param previous_release_file:
+    :param delta_file:
+    :param output_file:
+    :param work_dir: scratch directory (the bundle of a sharded release is written here)
+    :return: delta
+    """
+    datasets, meta = load_release(previous_release_file)
+    delta = read_delta(delta_file)
+    datasets, meta = apply_delta(datasets, meta, delta)
+
+    output = delta.get("output", LEGACY_OUTPUT)
+    mtime = release_mtime(meta["last_updated_on"])
+    if output["format"] == 'sharded':
+        bundle_dir = os.path.join(work_dir, SHARDED_RELEASE_DIR)
+        write_sharded_release(output_file, datasets, meta, bundle_dir, output.get("compression"), mtime)
+        shutil.rmtree(bundle_dir)
+    elif output["format"] == 'legacy':
+        write_legacy_release(output_file, datasets, meta, work_dir=None, mtime=mtime)
+    else:
+        raise ValueError(f"Unknown output format {output['format']}")
+    return delta
+
+
+def compute_delta(
+        old_datasets: Mapping[str, Mapping],
+        new_datasets: Mapping[str, Mapping],
+        old_meta: Dict,
+        new_meta: Dict,
+        output: Optional[Dict] = None
+) -> Dict:
+    """
+    Compute the patch turning the old release into the new one
+    :param old_datasets:
+    :param new_datasets:
+    :param old_meta:
+    :param new_meta:
+    :param output: output format of the new release ({"format": "legacy"} or
+                   {"format": "sharded", "compression": shard compression}); default legacy
+    :return:
+    """
+    delta = {
+        "format_version": DELTA_FORMAT_VERSION,
+        "base": old_meta,
+        "meta": new_meta,
+        "output": output or LEGACY_OUTPUT,
+        "datasets": dict()
+    }
+    for name, new_data in new_datasets.items():
+        old_data = old_datasets.get(name, dict())
+        upsert = {k: v for k, v in new_data.items() if k not in old_data or old_data[k] != v}
+        # key set, since membership tests on views (JsonSentenceDict) build entries
+        new_keys = set(new_data)
+        delete = sorted(k for k in old_data.keys() if k not in new_keys)
+        delta["datasets"][name] = {
+            "upsert": upsert,
+            "delete": delete
+        }
+    return delta
+
+
+def _diff_items(old_items: Iterable[Tuple[str, object]], new_data: Mapping) -> Dict:
+    """
+    Patch of one output dict, comparing the old entries one at a time
+    Each new entry is read once (entries of views like JsonSentenceDict are built on access)
+    :param old_items: (key, value) of the old dict
+    :param new_data:
+    :return:
+    """
+    missing = object()
+    upsert = dict()
+    delete = []
+    old_keys = set()
+    for k, old_value in old_items:
+        old_keys.add(k)
+        new_value = new_data.get(k, missing)
+        if new_value is missing:
+            delete.append(k)
+        elif new_value != old_value:
+            upsert[k] = new_value
+    for k in new_data:
+        if k not in old_keys:
+            upsert[k] = new_data[k]
+    return {
+        "upsert": upsert,
+        "delete": sorted(delete)
+    }
+
+
+def compute_release_delta(
+        old_release_file: str,
+        new_datasets: Mapping[str, Mapping],
+        new_meta: Dict,
+        output: Optional[Dict] = None
+) -> Dict:
+    """
+    Same as compute_delta against load_release(old_release_file), streaming the old release instead of loading it:
+    only the keys of the old dicts are held in memory
+    :param old_release_file: release tarball (legacy or sharded format)
+    :param new_datasets:
+    :param new_meta:
+    :param output: output format of the new release (see compute_delta)
+    :return:
+    """
+    delta = {
+        "format_version": DELTA_FORMAT_VERSION,
+        "base": dict(),
+        "meta": new_meta,
+        "output": output or LEGACY_OUTPUT,
+        "datasets": dict()
+    }
+    with tarfile.open(old_release_file, 'r:*') as tar:
+        members = {member.name: member for member in tar.getmembers()}
+        bundle_index = [name for name in members if os.path.basename(name) == INDEX_FILE]
+
+        if bundle_index:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                tar.extractall(temp_dir, filter='data')
+                bundle = ShardedBundle(os.path.join(temp_dir, os.path.dirname(bundle_index[0])))
+                for name, new_data in new_datasets.items():
+                    old_items = bundle.items(name) if name in bundle.index["datasets"] else []
+                    delta["datasets"][name] = _diff_items(old_items, new_data)
+                delta["base"] = bundle.meta
+            return delta
+
+        for name, new_data in new_datasets.items():
+            file_name = LEGACY_FILES.get(name)
+            # releases before sentence counts lack some files
+            old_items = iter_json_items(tar.extractfile(members[file_name])) if file_name in members else []
+            delta["datasets"][name] = _diff_items(old_items, new_data)
+        if LEGACY_META_FILE in members:
+            delta["base"] = json.load(tar.extractfile(members[LEGACY_META_FILE]))
+    return delta
+
+
+def apply_delta(old_datasets: Mapping[str, Mapping], old_meta: Dict, delta: Dict) -> Tuple[Dict[str, Dict], Dict]:
+    """
+    Apply a patch to a release
+    :param old_datasets:
+    :param old_meta:
+    :param delta:
+    :return: (dataset name -> dict, meta) of the new release
+    """
+    if delta["base"] != old_meta:
+        raise ValueError(f"Delta is based on release {delta['base']}, not {old_meta}")
+
+    new_datasets = dict()
+    for name in list(old_datasets) + [name for name in delta["datasets"] if name not in old_datasets]:
+        changes = delta["datasets"].get(name, {"upsert": dict(), "delete": []})
+        new_data = dict(old_datasets.get(name, dict()))
+        for k in changes["delete"]:
+            del new_data[k]
+        new_data.update(changes["upsert"])
+        new_datasets[name] = new_data
+    return new_datasets, delta["meta"]
+
+
+def delta_summary(delta: Dict) -> Dict[str, Dict[str, int]]:
+    """
+    Number of upserted and deleted entries per dataset
+    :param delta:
+    :return:
+    """
+    return {
+        name: {"upsert": len(changes["upsert"]), "delete": len(changes["delete"])}
+        for name, changes in delta["datasets"].items()
+    }
+
+
+def write_delta(delta_file: str, delta: Dict):
+    with gzip.open(delta_file, 'wt') as f:
+        json.dump(delta, f, separators=(',', ':'), sort_keys=True)
+
+
+def read_delta(delta_file: str) -> Dict:
+    with gzip.open(delta_file, 'rt') as f:
+        return json.load(f)
@@ -0,0 +1,222 @@
+"""
+Streaming validator for release output (legacy JSON files, release tarballs, or sharded bundles)
+Each output dict is parsed once, entry by entry, into key sets and references; cross-dict invariants are then checked
+with set differences. Shards of a sharded bundle (and the files of a legacy output directory) are scanned in parallel
+
+"""
+
+import os
+import json
+import tarfile
+import tempfile
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Tuple, Optional, NamedTuple
+
+from suppai.output_bundle import ShardedBundle, INDEX_FILE, _decompress
+from suppai.output_delta import LEGACY_FILES
+from suppai.utils.file_utils import iter_json_items
+
+
+# violations reported with context per check (all are counted)
+MAX_EXAMPLES = 20
+ENT_TYPES = {"supplement", "drug"}
+# output dicts every release has (sentence counts are checked if present)
+REQUIRED_DATASETS = ["interactions", "sentences", "cuis", "papers"]
+
+# check name -> description (same invariants as tests/test_output_integrity.py)
+CHECKS = {
+    "datasets_found": "interaction, sentence, CUI, and paper dicts are found and not empty",
+    "cui_keys": "interaction dict CUIs have metadata",
+    "cui_keys_reverse": "CUIs with metadata have interaction entries",
+    "interaction_keys": "interactions have sentences",
+    "papers_in_dict": "papers of sentences have metadata",
+    "no_redundant_names": "preferred names are unique",
+    "sentence_cuis_valid": "sentence arguments match their interaction and have metadata",
+    "no_empty_entries": "sentences, CUI metadata, and paper metadata are not empty",
+    "all_supp_drugs": "all CUIs are supplements or drugs",
+    "sentence_counts": "interactions with sentences have sentence counts (if the release has them)"
+}
+
+
+class Violation(NamedTuple):
+    check: str
+    key: str
+    message: str
+
+
+class _Scan:
+    """
+    Key sets, references, and local violations of one output dict (or one shard of it)
+    """
+    def __init__(self, name: str):
+        self.name = name
+        self.keys = set()
+        # referenced key -> one referencing key (for context)
+        self.refs = defaultdict(dict)
+        self.violations = []
+        self.counts = defaultdict(int)
+        # preferred name -> CUIs (cuis only)
+        self.names = defaultdict(list)
+
+    def violation(self, check: str, key: str, message: str):
+        self.counts[check] += 1
+        if self.counts[check] <= MAX_EXAMPLES:
+            self.violations.append(Violation(check, key, message))
+
+    def add(self, key: str, value):
+        self.keys.add(key)
+        if self.name == "interactions":
+            for interaction_id in value:
+                self.refs["sentences"].setdefault(interaction_id, key)
+        elif self.name == "sentences":
+            if not value:
+                self.violation("no_empty_entries", key, "interaction has no sentences")
+            interaction_cuis = set(key.split('-'))
+            for sent in value:
+                self.refs["papers"].setdefault(sent["paper_id"], key)
+                arg_cuis = {sent["arg1"]["id"], sent["arg2"]["id"]}
+                if arg_cuis != interaction_cuis:
+                    self.violation("sentence_cuis_valid", key, f"sentence {sent.get('uid')} has arguments {sorted(arg_cuis)}")
+                for cui in arg_cuis:
+                    self.refs["cuis"].setdefault(cui, key)
+        elif self.name == "cuis":
+            if not value:
+                self.violation("no_empty_entries", key, "CUI has no metadata")
+                return
+            if value.get("ent_type") not in ENT_TYPES:
+                self.violation("all_supp_drugs", key, f"ent_type is {value.get('ent_type')!r}")
+            self.names[value.get("preferred_name")].append(key)
+        elif self.name == "papers":
+            if not value:
+                self.violation("no_empty_entries", key, "paper has no metadata")
+
+    def merge(self, other: '_Scan'):
+        self.keys |= other.keys
+        for name, refs in other.refs.items():
+            for ref, key in refs.items():
+                self.refs[name].setdefault(ref, key)
+        for violation in other.violations:
+            if sum(v.check == violation.check for v in self.violations) < MAX_EXAMPLES:
+                self.violations.append(violation)
+        for check, count in other.counts.items():
+            self.counts[check] += count
+        for pref_name, cuis in other.names.items():
+            self.names[pref_name] += cuis
+
+
+def _scan_file(name: str, path: str, compression: Optional[str] = None) -> _Scan:
+    scan = _Scan(name)
+    with open(path, 'rb') as f:
+        if compression:
+            items = json.loads(_decompress(f.read(), compression)).items()
+        else:
+            items = iter_json_items(f)
+        for key, value in items:
+            scan.add(key, value)
+    return scan
+
+
+def _scan_units(units: List[Tuple[str, str, Optional[str]]], workers: int) -> Dict[str, _Scan]:
+    scans = {name: _Scan(name) for name in LEGACY_FILES}
+    if workers > 1 and len(units) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            results = executor.map(_scan_file, *zip(*units))
+            for (name, _, _), scan in zip(units, results):
+                scans[name].merge(scan)
+    else:
+        for name, path, compression in units:
+            scans[name].merge(_scan_file(name, path, compression))
+    return scans
+
+
+def _join(scans: Dict[str, _Scan]) -> List[_Scan]:
+    """
+    Cross-dict checks (as violations of an extra scan)
+    :param scans:
+    :return:
+    """
+    joined = _Scan("joins")
+    interactions, sentences, cuis, papers = scans["interactions"], scans["sentences"], scans["cuis"], scans["papers"]
+
+    for name in REQUIRED_DATASETS:
+        if not scans[name].keys:
+            joined.violation("datasets_found", name, "output dict is missing or empty")
+
+    for cui in sorted(interactions.keys - cuis.keys):
+        joined.violation("cui_keys", cui, "CUI in interaction dict has no metadata")
+    for cui in sorted(cuis.keys - interactions.keys):
+        joined.violation("cui_keys_reverse", cui, "CUI with metadata has no interaction entry")
+    for interaction_id in sorted(interactions.refs["sentences"].keys() - sentences.keys):
+        joined.violation(
+            "interaction_keys", interaction_id,
+            f"interaction of {interactions.refs['sentences'][interaction_id]} has no sentences"
+        )
+    for paper_id in sorted(sentences.refs["papers"].keys() - papers.keys):
+        joined.violation(
+            "papers_in_dict", paper_id, f"paper in sentences of {sentences.refs['papers'][paper_id]} has no metadata"
+        )
+    for cui in sorted(sentences.refs["cuis"].keys() - cuis.keys):
+        joined.violation("sentence_cuis_valid", cui, f"argument in sentences of {sentences.refs['cuis'][cui]} has no metadata")
+    for pref_name, cui_list in sorted(cuis.names.items(), key=lambda x: str(x[0])):
+        if len(cui_list) > 1:
+            joined.violation("no_redundant_names", pref_name, f"preferred name of {sorted(cui_list)}")
+    # releases before sentence counts lack them
+    if scans["sentence_counts"].keys:
+        for interaction_id in sorted(sentences.keys - scans["sentence_counts"].keys):
+            joined.violation("sentence_counts", interaction_id, "interaction has no sentence count")
+    return [interactions, sentences, cuis, papers, joined]
+
+
+def _report(scans: List[_Scan]) -> Dict:
+    counts = defaultdict(int)
+    violations = []
+    for scan in scans:
+        for check, count in scan.counts.items():
+            counts[check] += count
+        violations += scan.violations
+    return {
+        "valid": not counts,
+        "entries": {scan.name: len(scan.keys) for scan in scans if scan.name != "joins"},
+        "violation_counts": {check: counts.get(check, 0) for check in CHECKS},
+        "violations": [violation._asdict() for violation in violations]
+    }
+
+
+def validate_output(path: str, workers: int = 4) -> Dict:
+    """
+    Validate release output
+    :param path: release tarball, sharded bundle directory, or directory with the legacy JSON files
+    :param workers: processes for scanning shards/files in parallel
+    :return: report with per-check violation counts and example violations
+    """
+    if os.path.isdir(path):
+        if os.path.exists(os.path.join(path, INDEX_FILE)):
+            bundle = ShardedBundle(path)
+            units = [
+                (name, os.path.join(path, info["file"]), bundle.compression)
+                for name in LEGACY_FILES if name in bundle.index["datasets"]
+                for info in bundle.index["datasets"][name]["shards"].values()
+            ]
+        else:
+            units = [
+                (name, os.path.join(path, file_name), None)
+                for name, file_name in LEGACY_FILES.items() if os.path.exists(os.path.join(path, file_name))
+            ]
+        return _report(_join(_scan_units(units, workers)))
+
+    with tarfile.open(path, 'r:*') as tar:
+        bundle_index = [name for name in tar.getnames() if os.path.basename(name) == INDEX_FILE]
+        if bundle_index:
+            with tempfile.TemporaryDirectory() as temp_dir:
+                tar.extractall(temp_dir, filter='data')
+                return validate_output(os.path.join(temp_dir, os.path.dirname(bundle_index[0])), workers)
+
+        # legacy tarball: stream each member once, in archive order
+        names = {file_name: name for name, file_name in LEGACY_FILES.items()}
+        scans = {name: _Scan(name) for name in LEGACY_FILES}
+        for member in tar:
+            if member.name in names:
+                for key, value in iter_json_items(tar.extractfile(member)):
+                    scans[names[member.name]].add(key, value)
+        return _report(_join(scans))
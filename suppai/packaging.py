@@ -0,0 +1,327 @@
+"""
+Streaming release packaging with multi-threaded compression
+Members are serialized straight into a tar stream; the stream is compressed in fixed-size blocks on a
+thread pool, each block written as an independent gzip member (as pigz --independent / bgzip do, readable
+by gzip, tar, and Python's tarfile), or with multi-threaded zstd when available
+
+"""
+
+import os
+import io
+import json
+import time
+import gzip
+import tarfile
+import hashlib
+import tempfile
+import concurrent.futures
+from contextlib import contextmanager
+from collections import deque
+from datetime import datetime, timezone
+from typing import Dict, List, Tuple, Union, Callable, BinaryIO, Optional, Iterator, Mapping
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+BLOCK_SIZE = 4 * 1024 * 1024
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 10
+
+# serialized members are spooled in memory up to this size (tar headers need the member size up front)
+SPOOL_MAX_SIZE = 512 * 1024 * 1024
+WRITE_BUFFER_SIZE = 1 << 16
+
+# format of release timestamps (meta "last_updated_on")
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.%fZ'
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_SUFFIX = '.manifest.json'
+
+# a member source is either a file path or a function that writes the member's bytes to a file object
+MemberSource = Union[str, Callable[[BinaryIO], None]]
+
+
+class ParallelGzipWriter(io.RawIOBase):
+    """
+    Write-only file object that gzip-compresses BLOCK_SIZE blocks on a thread pool (zlib releases the GIL)
+    and writes them to fileobj in order as independent gzip members
+    """
+    def __init__(self, fileobj: BinaryIO, threads: int, level: int = GZIP_LEVEL, block_size: int = BLOCK_SIZE):
+        super().__init__()
+        self.fileobj = fileobj
+        self.level = level
+        self.block_size = block_size
+        self.max_pending = 2 * threads
+        self.executor = concurrent.futures.ThreadPoolExecutor(max_workers=threads)
+        self.pending = deque()
+        self.buffer = bytearray()
+
+    def writable(self):
+        return True
+
+    def _submit(self, block: bytes):
+        self.pending.append(self.executor.submit(gzip.compress, block, self.level, mtime=0))
+        # write finished blocks in order, bounding memory to max_pending blocks in flight
+        while self.pending and (self.pending[0].done() or len(self.pending) > self.max_pending):
+            self.fileobj.write(self.pending.popleft().result())
+
+    def write(self, data) -> int:
+        self.buffer += data
+        while len(self.buffer) >= self.block_size:
+            self._submit(bytes(self.buffer[:self.block_size]))
+            del self.buffer[:self.block_size]
+        return len(data)
+
+    def close(self):
+        if self.closed:
+            return
+        if self.buffer:
+            self._submit(bytes(self.buffer))
+            self.buffer = bytearray()
+        while self.pending:
+            self.fileobj.write(self.pending.popleft().result())
+        self.executor.shutdown()
+        super().close()
+
+
+class _HashingWriter:
+    """
+    Writer that tracks size and sha256 of everything written through it
+    """
+    def __init__(self, *fileobjs: BinaryIO):
+        self.fileobjs = fileobjs
+        self.sha = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> int:
+        self.sha.update(data)
+        self.size += len(data)
+        for fileobj in self.fileobjs:
+            fileobj.write(data)
+        return len(data)
+
+    def flush(self):
+        for fileobj in self.fileobjs:
+            fileobj.flush()
+
+
+class _HashingReader:
+    """
+    Reader that tracks sha256 of everything read through it
+    """
+    def __init__(self, fileobj: BinaryIO):
+        self.fileobj = fileobj
+        self.sha = hashlib.sha256()
+
+    def read(self, size: int = -1) -> bytes:
+        data = self.fileobj.read(size)
+        self.sha.update(data)
+        return data
+
+
+def _iter_json(obj, indent: Optional[int], sort_keys: bool) -> Iterator[str]:
+    """
+    Encode obj as json.dump would; mappings that are not dicts (lazy views) are encoded one value at a time
+    """
+    separators = None if indent is not None else (',', ':')
+    encoder = json.JSONEncoder(indent=indent, sort_keys=sort_keys, separators=separators)
+    if isinstance(obj, dict) or not isinstance(obj, Mapping):
+        yield from encoder.iterencode(obj)
+        return
+
+    keys = sorted(obj) if sort_keys else list(obj)
+    if not keys:
+        yield '{}'
+        return
+    item_separator, key_separator = (',\n' + ' ' * indent, ': ') if indent is not None else (',', ':')
+    yield '{\n' + ' ' * indent if indent is not None else '{'
+    for key_index, key in enumerate(keys):
+        if key_index:
+            yield item_separator
+        value = encoder.encode(obj[key])
+        if indent is not None:
+            # nest the value one level deeper (JSON strings never contain raw newlines)
+            value = value.replace('\n', '\n' + ' ' * indent)
+        yield json.dumps(key) + key_separator + value
+    yield '\n}' if indent is not None else '}'
+
+
+def json_member(obj, indent: Optional[int] = None, sort_keys: bool = False) -> Callable[[BinaryIO], None]:
+    """
+    Member source that streams obj as JSON
+    :param obj: JSON-serializable object, or a Mapping view whose values are JSON-serializable
+    :param indent:
+    :param sort_keys:
+    :return:
+    """
+    def _write(fileobj: BinaryIO):
+        chunks = []
+        chunks_size = 0
+        for chunk in _iter_json(obj, indent, sort_keys):
+            chunks.append(chunk)
+            chunks_size += len(chunk)
+            if chunks_size >= WRITE_BUFFER_SIZE:
+                fileobj.write(''.join(chunks).encode('utf-8'))
+                chunks = []
+                chunks_size = 0
+        fileobj.write(''.join(chunks).encode('utf-8'))
+
+    return _write
+
+
+def release_mtime(timestr: str) -> int:
+    """
+    Archive member modification time of a release (see write_archive)
+    :param timestr: release timestamp (UTC, TIMESTAMP_FORMAT)
+    :return: seconds since the epoch
+    """
+    return int(datetime.strptime(timestr, TIMESTAMP_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+
+
+def _open_compressor(fileobj: BinaryIO, compression: str, threads: int):
+    if compression == 'gz':
+        return ParallelGzipWriter(fileobj, threads)
+    if compression == 'zst':
+        if zstandard is None:
+            raise ImportError("zst compression requires the zstandard package")
+        return zstandard.ZstdCompressor(level=ZSTD_LEVEL, threads=threads).stream_writer(fileobj, closefd=False)
+    raise ValueError(f"Unknown compression: {compression}")
+
+
+def write_archive(
+        output_file: str,
+        members: List[Tuple[str, MemberSource]],
+        compression: str = 'gz',
+        threads: Optional[int] = None,
+        copy_dir: Optional[str] = None,
+        mtime: int = 0
+) -> Dict:
+    """
+    Stream members into a compressed tar archive with a checksummed manifest
+    The manifest (size and sha256 of every member) is added as the last member and also written
+    to {output_file}.manifest.json together with the archive's own sha256
+    :param output_file:
+    :param members: (arcname, source) pairs; source is a file path or a function writing the member's bytes
+    :param compression: "gz" (parallel gzip blocks) or "zst" (multi-threaded zstd)
+    :param threads: compression threads (default: all CPUs)
+    :param copy_dir: if given, serialized members are written to copy_dir/arcname and archived from there
+    :param mtime: modification time of all members and creation time in the manifest (seconds since the epoch;
+                  pass the release timestamp so that rebuilding a release gives an identical archive)
+    :return: manifest dict
+    """
+    threads = threads or os.cpu_count() or 1
+    manifest = {
+        "compression": compression,
+        "created": time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(mtime)),
+        "members": dict()
+    }
+
+    with open(output_file, 'wb') as raw_f:
+        archive_writer = _HashingWriter(raw_f)
+        compressor = _open_compressor(archive_writer, compression, threads)
+        with tarfile.open(fileobj=compressor, mode='w|') as tar:
+
+            def _add(arcname: str, fileobj, size: int):
+                tarinfo = tarfile.TarInfo(arcname)
+                tarinfo.size = size
+                tarinfo.mtime = mtime
+                tarinfo.mode = 0o644
+                tar.addfile(tarinfo, fileobj)
+
+            for arcname, source in members:
+                if isinstance(source, str):
+                    with open(source, 'rb') as in_f:
+                        reader = _HashingReader(in_f)
+                        size = os.path.getsize(source)
+                        _add(arcname, reader, size)
+                    sha = reader.sha.hexdigest()
+                elif copy_dir:
+                    # serialize once to the copy and archive the copy
+                    copy_path = os.path.join(copy_dir, arcname)
+                    with open(copy_path, 'wb') as copy_f:
+                        writer = _HashingWriter(copy_f)
+                        source(writer)
+                    size = writer.size
+                    sha = writer.sha.hexdigest()
+                    with open(copy_path, 'rb') as copy_f:
+                        _add(arcname, copy_f, size)
+                else:
+                    with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE) as spool:
+                        writer = _HashingWriter(spool)
+                        source(writer)
+                        size = writer.size
+                        sha = writer.sha.hexdigest()
+                        spool.seek(0)
+                        _add(arcname, spool, size)
+                manifest["members"][arcname] = {"size": size, "sha256": sha}
+
+            manifest_bytes = json.dumps(manifest, indent=4).encode('utf-8')
+            _add(MANIFEST_NAME, io.BytesIO(manifest_bytes), len(manifest_bytes))
+        compressor.close()
+
+    manifest["archive_sha256"] = archive_writer.sha.hexdigest()
+    with open(output_file + MANIFEST_SUFFIX, 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+@contextmanager
+def _open_tar_stream(output_file: str, compression: str) -> Iterator[tarfile.TarFile]:
+    """
+    Read an archive written by write_archive as a tar stream, closing the file when done
+    :param output_file:
+    :param compression: "gz" or "zst"
+    :return:
+    """
+    if compression == 'zst':
+        if zstandard is None:
+            raise ImportError("zst compression requires the zstandard package")
+        with open(output_file, 'rb') as raw_f, \
+                zstandard.ZstdDecompressor().stream_reader(raw_f, closefd=True) as fileobj, \
+                tarfile.open(fileobj=fileobj, mode='r|') as tar:
+            yield tar
+    else:
+        with tarfile.open(output_file, mode='r|gz') as tar:
+            yield tar
+
+
+def verify_archive(output_file: str) -> List[str]:
+    """
+    Check an archive against its sidecar manifest
+    :param output_file:
+    :return: list of problems (empty if the archive is intact)
+    """
+    with open(output_file + MANIFEST_SUFFIX, 'r') as f:
+        manifest = json.load(f)
+
+    problems = []
+    archive_sha = hashlib.sha256()
+    with open(output_file, 'rb') as f:
+        for block in iter(lambda: f.read(BLOCK_SIZE), b''):
+            archive_sha.update(block)
+    if archive_sha.hexdigest() != manifest["archive_sha256"]:
+        problems.append("archive checksum mismatch")
+
+    seen = set()
+    with _open_tar_stream(output_file, manifest["compression"]) as tar:
+        for member in tar:
+            if member.name == MANIFEST_NAME:
+                continue
+            expected = manifest["members"].get(member.name)
+            if expected is None:
+                problems.append(f"unexpected member {member.name}")
+                continue
+            seen.add(member.name)
+            member_sha = hashlib.sha256()
+            member_f = tar.extractfile(member)
+            for block in iter(lambda: member_f.read(BLOCK_SIZE), b''):
+                member_sha.update(block)
+            if member_sha.hexdigest() != expected["sha256"]:
+                problems.append(f"checksum mismatch for {member.name}")
+
+    for name in set(manifest["members"]) - seen:
+        problems.append(f"missing member {name}")
+    return problems
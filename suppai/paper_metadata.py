@@ -0,0 +1,463 @@
+"""
+Paper metadata for postprocess (title, authors, year, venue, doi, pmid, fields of study)
+Metadata is captured from S2 papers dataset shards during ingestion into a sorted, offset-indexed store,
+or read into a persistent SQLite cache keyed by corpus id; papers missing from both can be fetched from
+the S2 Graph API with concurrent batched requests
+
+"""
+
+import os
+import glob
+import gzip
+import json
+import time
+import heapq
+import bisect
+import shutil
+import struct
+import sqlite3
+import threading
+import concurrent.futures
+from array import array
+from typing import List, Dict, Iterable, Iterator, Optional
+
+from suppai.data import PaperAuthor
+from suppai.utils.list_utils import chunk_iter
+
+
+S2_API_URL = 'https://api.semanticscholar.org/graph/v1'
+S2_API_FIELDS = 'title,authors,year,venue,externalIds,fieldsOfStudy'
+# maximum ids per paper/batch request
+S2_API_BATCH_SIZE = 500
+S2_API_WORKERS = 8
+S2_API_REQUESTS_PER_SECOND = 10.0
+S2_API_MAX_RETRIES = 5
+
+# number of keys per lookup / insert statement
+QUERY_BATCH_SIZE = 500
+
+# metadata index files
+INDEX_DATA_SUFFIX = '.tsv'
+INDEX_OFFSETS_SUFFIX = '.idx'
+INDEX_MAGIC = b'SPMI'
+INDEX_HEADER = '<4sQQ'
+INDEX_BUCKET_BITS = 8
+
+
+def split_author_name(name: str) -> PaperAuthor:
+    """
+    Split a full author name from S2 into first, middle, and last names
+    :param name:
+    :return:
+    """
+    tokens = name.split()
+    if not tokens:
+        return PaperAuthor(first=None, middle=None, last='', suffix=None)
+    if len(tokens) == 1:
+        return PaperAuthor(first=None, middle=None, last=tokens[0], suffix=None)
+    return PaperAuthor(
+        first=tokens[0],
+        middle=' '.join(tokens[1:-1]) or None,
+        last=tokens[-1],
+        suffix=None
+    )
+
+
+def _pmid(pubmed_id) -> Optional[int]:
+    try:
+        return int(pubmed_id)
+    except (TypeError, ValueError):
+        return None
+
+
+def _fields_of_study(values) -> List[str]:
+    fields = []
+    for value in values or []:
+        category = value.get("category") if isinstance(value, dict) else value
+        if category and category not in fields:
+            fields.append(category)
+    return fields
+
+
+def metadata_from_dataset_record(record: Dict) -> Dict:
+    """
+    Metadata entry from an S2 papers dataset record
+    :param record:
+    :return:
+    """
+    external_ids = record.get("externalids") or dict()
+    return {
+        "title": record.get("title") or '',
+        "authors": [author.get("name") or '' for author in record.get("authors") or []],
+        "year": record.get("year"),
+        "venue": record.get("venue"),
+        "doi": external_ids.get("DOI"),
+        "pmid": _pmid(external_ids.get("PubMed")),
+        "fields_of_study": _fields_of_study(record.get("s2fieldsofstudy"))
+    }
+
+
+def metadata_from_api_record(record: Dict) -> Dict:
+    """
+    Metadata entry from an S2 Graph API paper record
+    :param record:
+    :return:
+    """
+    external_ids = record.get("externalIds") or dict()
+    return {
+        "title": record.get("title") or '',
+        "authors": [author.get("name") or '' for author in record.get("authors") or []],
+        "year": record.get("year"),
+        "venue": record.get("venue"),
+        "doi": external_ids.get("DOI"),
+        "pmid": _pmid(external_ids.get("PubMed")),
+        "fields_of_study": _fields_of_study(record.get("fieldsOfStudy"))
+    }
+
+
+class PaperMetadataCache:
+    """
+    SQLite-backed metadata store (corpus id -> metadata entry)
+    Author names are stored as strings and returned as PaperAuthors
+    """
+    def __init__(self, cache_file: str):
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(cache_file, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS papers (corpus_id INTEGER PRIMARY KEY, metadata TEXT)")
+        self.conn.commit()
+
+    def get_many(self, corpus_ids: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Look up cached metadata; missing ids are absent from the output
+        :param corpus_ids:
+        :return:
+        """
+        found = dict()
+        for id_chunk in chunk_iter([int(corpus_id) for corpus_id in corpus_ids], QUERY_BATCH_SIZE):
+            rows = self.conn.execute(
+                f"SELECT corpus_id, metadata FROM papers WHERE corpus_id IN ({','.join('?' * len(id_chunk))})",
+                id_chunk
+            )
+            for corpus_id, metadata in rows:
+                entry = json.loads(metadata)
+                entry["authors"] = [split_author_name(name) for name in entry["authors"]]
+                found[str(corpus_id)] = entry
+        return found
+
+    def put_many(self, entries: Dict[str, Dict]):
+        """
+        Insert metadata entries (authors as name strings)
+        :param entries: corpus id -> metadata entry
+        :return:
+        """
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO papers (corpus_id, metadata) VALUES (?, ?)",
+            [(int(corpus_id), json.dumps(entry)) for corpus_id, entry in entries.items()]
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM papers").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def read_papers_shard(shard_file: str) -> Iterator[Dict]:
+    """
+    Iterate over records of an S2 papers dataset shard (.jsonl or .jsonl.gz)
+    :param shard_file:
+    :return:
+    """
+    open_fn = gzip.open if shard_file.endswith('.gz') else open
+    with open_fn(shard_file, 'rt') as f:
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+
+def cache_papers_shards(
+        cache: PaperMetadataCache,
+        shard_files: List[str],
+        corpus_ids: Optional[set] = None,
+        batch_size: int = 10000
+) -> int:
+    """
+    Add metadata of PubMed papers in S2 papers shards to the cache
+    :param cache:
+    :param shard_files:
+    :param corpus_ids: if given, only cache these corpus ids
+    :param batch_size: entries per insert transaction
+    :return: number of papers cached
+    """
+    num_cached = 0
+    batch = dict()
+    for shard_file in shard_files:
+        for record in read_papers_shard(shard_file):
+            corpus_id = str(record["corpusid"])
+            if corpus_ids is not None and corpus_id not in corpus_ids:
+                continue
+            if not (record.get("externalids") or dict()).get("PubMed"):
+                continue
+            batch[corpus_id] = metadata_from_dataset_record(record)
+            if len(batch) >= batch_size:
+                cache.put_many(batch)
+                num_cached += len(batch)
+                batch = dict()
+    if batch:
+        cache.put_many(batch)
+        num_cached += len(batch)
+    return num_cached
+
+
+class RateLimiter:
+    """
+    Thread-safe limiter spacing calls at least 1 / rate seconds apart
+    """
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            wait_time = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+
+class S2PaperClient:
+    """
+    Concurrent batched client for the S2 Graph API paper/batch endpoint
+    One pooled HTTP session is shared by all workers; requests are rate limited across workers
+    and retried with exponential backoff on 429 / 5xx responses
+    """
+    def __init__(
+            self,
+            base_url: str = S2_API_URL,
+            api_key: Optional[str] = None,
+            batch_size: int = S2_API_BATCH_SIZE,
+            max_workers: int = S2_API_WORKERS,
+            requests_per_second: float = S2_API_REQUESTS_PER_SECOND,
+            max_retries: int = S2_API_MAX_RETRIES
+    ):
+        import requests
+
+        self.base_url = base_url.rstrip('/')
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.rate_limiter = RateLimiter(requests_per_second)
+
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=max_workers)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        if api_key:
+            self.session.headers['x-api-key'] = api_key
+
+    def _fetch_batch(self, corpus_ids: List[str]) -> Dict[str, Dict]:
+        for attempt in range(self.max_retries):
+            self.rate_limiter.wait()
+            response = self.session.post(
+                f'{self.base_url}/paper/batch',
+                params={'fields': S2_API_FIELDS},
+                json={'ids': [f'CorpusId:{corpus_id}' for corpus_id in corpus_ids]},
+                timeout=60
+            )
+            if response.status_code == 429 or response.status_code >= 500:
+                time.sleep(2 ** attempt)
+                continue
+            response.raise_for_status()
+            # results are in request order, null for unknown ids
+            return {
+                corpus_id: metadata_from_api_record(record)
+                for corpus_id, record in zip(corpus_ids, response.json()) if record
+            }
+        raise RuntimeError(f'S2 API request failed after {self.max_retries} attempts')
+
+    def fetch(self, corpus_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Fetch metadata entries (authors as name strings) for corpus ids
+        :param corpus_ids:
+        :return: corpus id -> metadata entry; unknown ids are absent
+        """
+        results = dict()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch_results in executor.map(self._fetch_batch, chunk_iter(list(corpus_ids), self.batch_size)):
+                results.update(batch_results)
+        return results
+
+    def close(self):
+        self.session.close()
+
+
+class PaperMetadataIndexWriter:
+    """
+    Builds a PaperMetadataIndex from sorted runs, one run per S2 papers shard
+    Runs are merged with the existing index (newer entries win) by finalize
+    """
+    def __init__(self, index_prefix: str):
+        self.index_prefix = index_prefix
+        self.run_dir = f'{index_prefix}.runs'
+        os.makedirs(self.run_dir, exist_ok=True)
+
+    def add_run(self, run_name: str, entries: Dict[str, Dict]):
+        """
+        Write metadata entries of one shard as a run sorted by corpus id
+        :param run_name:
+        :param entries: corpus id -> metadata entry (authors as name strings)
+        :return:
+        """
+        run_file = os.path.join(self.run_dir, f'{run_name}{INDEX_DATA_SUFFIX}')
+        with open(run_file + '.tmp', 'w') as out_f:
+            for corpus_id in sorted(entries, key=int):
+                out_f.write(f'{int(corpus_id)}\t{json.dumps(entries[corpus_id])}\n')
+        os.replace(run_file + '.tmp', run_file)
+
+    def finalize(self) -> int:
+        """
+        Merge runs and the existing index into the index files and remove the runs
+        :return: number of papers in the index
+        """
+        data_file = self.index_prefix + INDEX_DATA_SUFFIX
+        run_files = sorted(glob.glob(os.path.join(self.run_dir, f'*{INDEX_DATA_SUFFIX}')))
+        # later runs take priority over earlier ones and over the existing index
+        sources = ([data_file] if os.path.exists(data_file) else []) + run_files
+
+        def _read(priority: int, file_name: str):
+            with open(file_name, 'r') as f:
+                for line in f:
+                    yield int(line[:line.index('\t')]), -priority, line
+
+        corpus_ids = array('Q')
+        offsets = array('Q')
+        with open(data_file + '.tmp', 'w') as out_f:
+            offset = 0
+            last_id = None
+            for corpus_id, _, line in heapq.merge(*[_read(p, f) for p, f in enumerate(sources)]):
+                if corpus_id == last_id:
+                    continue
+                last_id = corpus_id
+                corpus_ids.append(corpus_id)
+                offsets.append(offset)
+                out_f.write(line)
+                offset += len(line.encode('utf-8'))
+
+        # bucket table: position of the first id in each corpus_id >> INDEX_BUCKET_BITS bucket
+        num_buckets = (corpus_ids[-1] >> INDEX_BUCKET_BITS) + 1 if corpus_ids else 0
+        buckets = array('Q')
+        position = 0
+        for bucket in range(num_buckets + 1):
+            while position < len(corpus_ids) and corpus_ids[position] >> INDEX_BUCKET_BITS < bucket:
+                position += 1
+            buckets.append(position)
+
+        with open(self.index_prefix + INDEX_OFFSETS_SUFFIX + '.tmp', 'wb') as out_f:
+            out_f.write(struct.pack(INDEX_HEADER, INDEX_MAGIC, len(corpus_ids), num_buckets))
+            out_f.write(corpus_ids.tobytes())
+            out_f.write(offsets.tobytes())
+            out_f.write(buckets.tobytes())
+
+        os.replace(data_file + '.tmp', data_file)
+        os.replace(self.index_prefix + INDEX_OFFSETS_SUFFIX + '.tmp', self.index_prefix + INDEX_OFFSETS_SUFFIX)
+        shutil.rmtree(self.run_dir)
+        return len(corpus_ids)
+
+
+class PaperMetadataIndex:
+    """
+    Read-only metadata store written by PaperMetadataIndexWriter
+    {prefix}.tsv holds "corpus_id<TAB>metadata JSON" lines sorted by corpus id; {prefix}.idx holds the sorted
+    corpus ids, their line offsets, and a table of the first position of each corpus id bucket, so a lookup
+    is one bucket jump, a search within a bucket of at most 2 ** INDEX_BUCKET_BITS ids, and one read
+    """
+    def __init__(self, index_prefix: str):
+        with open(index_prefix + INDEX_OFFSETS_SUFFIX, 'rb') as f:
+            magic, num_papers, num_buckets = struct.unpack(INDEX_HEADER, f.read(struct.calcsize(INDEX_HEADER)))
+            if magic != INDEX_MAGIC:
+                raise ValueError(f'{index_prefix}{INDEX_OFFSETS_SUFFIX} is not a paper metadata index')
+            self.corpus_ids = array('Q')
+            self.corpus_ids.frombytes(f.read(8 * num_papers))
+            self.offsets = array('Q')
+            self.offsets.frombytes(f.read(8 * num_papers))
+            self.buckets = array('Q')
+            self.buckets.frombytes(f.read(8 * (num_buckets + 1)))
+        self.num_buckets = num_buckets
+        self.data_f = open(index_prefix + INDEX_DATA_SUFFIX, 'rb')
+
+    def __len__(self):
+        return len(self.corpus_ids)
+
+    def _position(self, corpus_id: int) -> Optional[int]:
+        bucket = corpus_id >> INDEX_BUCKET_BITS
+        if bucket >= self.num_buckets:
+            return None
+        lo, hi = self.buckets[bucket], self.buckets[bucket + 1]
+        position = bisect.bisect_left(self.corpus_ids, corpus_id, lo, hi)
+        if position < hi and self.corpus_ids[position] == corpus_id:
+            return position
+        return None
+
+    def get_many(self, corpus_ids: Iterable[str]) -> Dict[str, Dict]:
+        """
+        Look up metadata (same output as PaperMetadataCache.get_many); missing ids are absent from the output
+        :param corpus_ids:
+        :return:
+        """
+        positions = []
+        for corpus_id in corpus_ids:
+            position = self._position(int(corpus_id))
+            if position is not None:
+                positions.append((self.offsets[position], str(corpus_id)))
+
+        found = dict()
+        # read in file order
+        for offset, corpus_id in sorted(positions):
+            self.data_f.seek(offset)
+            line = self.data_f.readline().decode('utf-8')
+            entry = json.loads(line[line.index('\t') + 1:])
+            entry["authors"] = [split_author_name(name) for name in entry["authors"]]
+            found[corpus_id] = entry
+        return found
+
+    def close(self):
+        self.data_f.close()
+
+
+class PaperMetadataProvider:
+    """
+    Paper metadata lookups served from the ingestion index and the cache,
+    with misses fetched from the API (if a client is given) and cached
+    """
+    def __init__(
+            self,
+            cache: PaperMetadataCache,
+            client: Optional[S2PaperClient] = None,
+            index: Optional[PaperMetadataIndex] = None
+    ):
+        self.cache = cache
+        self.client = client
+        self.index = index
+
+    def get_metadata(self, corpus_ids: List[str]) -> Dict[str, Dict]:
+        """
+        Metadata entries in the format of get_paper_metadata_no_sha
+        :param corpus_ids:
+        :return: corpus id -> metadata entry; papers without metadata are absent
+        """
+        found = self.index.get_many(corpus_ids) if self.index is not None else dict()
+        missing = [corpus_id for corpus_id in corpus_ids if corpus_id not in found]
+        if missing:
+            found.update(self.cache.get_many(missing))
+            missing = [corpus_id for corpus_id in missing if corpus_id not in found]
+        if missing and self.client is not None:
+            fetched = self.client.fetch(missing)
+            self.cache.put_many(fetched)
+            found.update(self.cache.get_many(fetched.keys()))
+        return found
@@ -0,0 +1,128 @@
+"""
+NER and linking over paper entries (corpus_id, title, abstract)
+Turns DrugSupplementLinker output into sentence entries with linked entities, the input of candidate formation
+(see suppai.sentence_filter)
+
+"""
+
+from typing import Dict, List, Optional, Iterable, Iterator, Tuple
+
+from suppai import metrics
+from suppai.utils.list_utils import chunk_iter
+
+
+def document_text(entry: Dict) -> Optional[str]:
+    """
+    Text to run NER over for one paper
+    :param entry: paper entry (corpus_id, title, abstract)
+    :return: title and abstract, or None if the paper is skipped
+    """
+    # skip if no title
+    if not entry['title']:
+        metrics.incr("ner.skipped.no_title")
+        return None
+
+    # skip if no abstract
+    if not entry['abstract']:
+        metrics.incr("ner.skipped.no_abstract")
+        return None
+
+    # form doc text
+    return entry['title'] + '. ' + entry['abstract']
+
+
+def link_document(ds_linker, entry: Dict) -> Optional[List[Dict]]:
+    """
+    Run NER and linking over one paper
+    :param ds_linker: DrugSupplementLinker
+    :param entry: paper entry (corpus_id, title, abstract)
+    :return: sentence entries with linked entities, or None if the paper is skipped
+    """
+    doc_text = document_text(entry)
+    if doc_text is None:
+        return None
+    try:
+        ents_per_sentence = ds_linker.get_linked_entities(
+            doc_text,
+            top_k=3
+        )
+    except Exception as e:
+        metrics.incr("ner.skipped.linker_error")
+        return None
+    return sentence_entries(entry, ents_per_sentence)
+
+
+def link_documents(ds_linker, entries: List[Dict], two_phase: bool = True) -> List[Optional[List[Dict]]]:
+    """
+    Run NER and linking over a batch of papers
+    With two_phase, only mentions in sentences that can yield an entity pair are linked (in one batched
+    linker call), so sentences that filter_sentence would drop anyway come back without entities
+    :param ds_linker: DrugSupplementLinker
+    :param entries: paper entries
+    :param two_phase:
+    :return: link_document output for each entry
+    """
+    if not two_phase:
+        return [link_document(ds_linker, entry) for entry in entries]
+
+    doc_texts = [document_text(entry) for entry in entries]
+    to_link = [i for i, doc_text in enumerate(doc_texts) if doc_text is not None]
+    try:
+        ents_per_doc = ds_linker.get_linked_entities_batch([doc_texts[i] for i in to_link], top_k=3)
+    except Exception:
+        # retry one paper at a time so only the failing paper is skipped
+        ents_per_doc = []
+        for i in to_link:
+            try:
+                ents_per_doc.append(ds_linker.get_linked_entities_batch([doc_texts[i]], top_k=3)[0])
+            except Exception:
+                metrics.incr("ner.skipped.linker_error")
+                ents_per_doc.append(None)
+
+    results = [None] * len(entries)
+    for i, ents_per_sentence in zip(to_link, ents_per_doc):
+        if ents_per_sentence is not None:
+            results[i] = sentence_entries(entries[i], ents_per_sentence)
+    return results
+
+
+def iter_linked_papers(
+        ds_linker,
+        entries: Iterable[Dict],
+        batch_size: int,
+        two_phase: bool = True
+) -> Iterator[Tuple[Dict, Optional[List[Dict]]]]:
+    """
+    Link papers in batches of batch_size
+    :param ds_linker: DrugSupplementLinker
+    :param entries: paper entries
+    :param batch_size:
+    :param two_phase: see link_documents
+    :return: (paper entry, its sentence entries or None if the paper is skipped), in input order
+    """
+    for batch in chunk_iter(entries, batch_size):
+        batch = list(batch)
+        yield from zip(batch, link_documents(ds_linker, batch, two_phase))
+
+
+def sentence_entries(entry: Dict, ents_per_sentence: List[Dict]) -> List[Dict]:
+    """
+    Sentence entries of one paper from linker output
+    :param entry: paper entry
+    :param ents_per_sentence: output of DrugSupplementLinker.get_linked_entities
+    :return:
+    """
+    # iterate through sentences
+    sentences = []
+    for sent in ents_per_sentence:
+        if not sent["sentence"].strip():
+            continue
+        entities = sent["entities"]
+        if entities and len(entities) > 0:
+            sentences.append({
+                "id": entry["corpus_id"],
+                "sentence_id": sent["sent_num"],
+                "sentence": sent["sentence"].strip(),
+                "entities": entities
+            })
+    return sentences
@@ -0,0 +1,246 @@
+"""
+DAG runner for the pipeline scripts
+Each stage is a command with declared inputs, outputs, and dependencies; a stage is skipped when the content
+hash of its inputs (and of its dependencies' outputs) matches its last successful run and its outputs are
+intact, so rerunning after a failure resumes at the failed stage. Independent stages run concurrently
+
+"""
+
+import os
+import json
+import time
+import asyncio
+import hashlib
+from typing import List, Dict, NamedTuple, Callable, Optional, Iterable
+
+
+STAGE_SUCCEEDED = 'succeeded'
+STAGE_SKIPPED = 'skipped'
+STAGE_FAILED = 'failed'
+# not run because a dependency failed
+STAGE_BLOCKED = 'blocked'
+
+HASH_BLOCK_SIZE = 1 << 20
+MISSING_HASH = 'missing'
+
+
+class _Context(dict):
+    """
+    Template fields missing from the context are left in place (the path then hashes as missing)
+    """
+    def __missing__(self, key):
+        return '{' + key + '}'
+
+
+class Stage(NamedTuple):
+    """
+    Pipeline stage
+    Input and output paths (files or directories) may contain {key} fields, filled from the pipeline context
+    (e.g. config/log.json) when the stage is about to run; the context values named in keys are hashed with the
+    inputs (e.g. a date, to rerun a stage whose real inputs are remote at most once a day)
+    """
+    name: str
+    command: List[str]
+    inputs: List[str] = []
+    outputs: List[str] = []
+    depends_on: List[str] = []
+    keys: List[str] = []
+
+
+class StageResult(NamedTuple):
+    name: str
+    status: str
+    elapsed: float
+
+
+def topological_order(stages: List[Stage]) -> List[str]:
+    """
+    Stage names in dependency order
+    :param stages:
+    :return:
+    """
+    by_name = {stage.name: stage for stage in stages}
+    order = []
+    state = dict()
+
+    def _visit(name: str, path: List[str]):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'visiting':
+            raise ValueError(f"Dependency cycle: {' -> '.join(path + [name])}")
+        if name not in by_name:
+            raise ValueError(f"Unknown stage {name} (required by {path[-1]})")
+        state[name] = 'visiting'
+        for dependency in by_name[name].depends_on:
+            _visit(dependency, path + [name])
+        state[name] = 'done'
+        order.append(name)
+
+    for stage in stages:
+        _visit(stage.name, [])
+    return order
+
+
+class PathHasher:
+    """
+    Content hashes of files and directories; file hashes are reused while size and mtime are unchanged
+    """
+    def __init__(self, file_hashes: Optional[Dict[str, List]] = None):
+        self.file_hashes = file_hashes if file_hashes is not None else dict()
+
+    def hash_file(self, file_path: str) -> str:
+        stat = os.stat(file_path)
+        cached = self.file_hashes.get(file_path)
+        if cached and cached[0] == stat.st_size and cached[1] == stat.st_mtime_ns:
+            return cached[2]
+        sha = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                sha.update(block)
+        self.file_hashes[file_path] = [stat.st_size, stat.st_mtime_ns, sha.hexdigest()]
+        return sha.hexdigest()
+
+    def hash_path(self, path: str) -> str:
+        if os.path.isfile(path):
+            return self.hash_file(path)
+        if not os.path.isdir(path):
+            return MISSING_HASH
+        sha = hashlib.sha256()
+        for root, dir_names, file_names in os.walk(path):
+            dir_names.sort()
+            for file_name in sorted(file_names):
+                file_path = os.path.join(root, file_name)
+                sha.update(f'{os.path.relpath(file_path, path)}\t{self.hash_file(file_path)}\n'.encode('utf-8'))
+        return sha.hexdigest()
+
+    def hash_paths(self, paths: Iterable[str], *extra: str) -> str:
+        sha = hashlib.sha256()
+        for value in extra:
+            sha.update(f'{value}\n'.encode('utf-8'))
+        for path in paths:
+            sha.update(f'{path}\t{self.hash_path(path)}\n'.encode('utf-8'))
+        return sha.hexdigest()
+
+
+class Pipeline:
+    """
+    Runs stages in dependency order, recording per-stage status, hashes, and timing in a state file
+    """
+    def __init__(
+            self,
+            stages: List[Stage],
+            state_file: str,
+            context_fn: Optional[Callable[[], Dict]] = None,
+            max_concurrent: int = 4
+    ):
+        self.stages = {stage.name: stage for stage in stages}
+        self.order = topological_order(stages)
+        self.state_file = state_file
+        self.context_fn = context_fn or dict
+        self.max_concurrent = max_concurrent
+
+        self.state = {"stages": dict(), "file_hashes": dict()}
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                self.state = json.load(f)
+        self.hasher = PathHasher(self.state["file_hashes"])
+
+    def _save_state(self):
+        state_dir = os.path.dirname(self.state_file)
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+        with open(self.state_file + '.tmp', 'w') as f:
+            json.dump(self.state, f, indent=4)
+        os.replace(self.state_file + '.tmp', self.state_file)
+
+    def _resolve(self, paths: List[str]) -> List[str]:
+        context = _Context(self.context_fn())
+        return [path.format_map(context) for path in paths]
+
+    def _input_hash(self, stage: Stage) -> str:
+        dependency_hashes = [
+            f"{dependency}:{self.state['stages'].get(dependency, dict()).get('output_hash')}"
+            for dependency in stage.depends_on
+        ]
+        context = self.context_fn() if stage.keys else dict()
+        key_values = [f"{key}={context.get(key)}" for key in stage.keys]
+        return self.hasher.hash_paths(
+            self._resolve(stage.inputs), ' '.join(stage.command), *dependency_hashes, *key_values
+        )
+
+    def _output_hash(self, stage: Stage) -> str:
+        return self.hasher.hash_paths(self._resolve(stage.outputs))
+
+    def is_up_to_date(self, stage: Stage) -> bool:
+        """
+        Whether the last run of a stage succeeded with the same inputs and its outputs are unchanged
+        :param stage:
+        :return:
+        """
+        last_run = self.state["stages"].get(stage.name)
+        if not last_run or last_run["status"] != STAGE_SUCCEEDED:
+            return False
+        outputs = self._resolve(stage.outputs)
+        if any(not os.path.exists(path) for path in outputs):
+            return False
+        return last_run["input_hash"] == self._input_hash(stage) and last_run["output_hash"] == self._output_hash(stage)
+
+    async def _run_stage(self, stage: Stage, force: bool) -> StageResult:
+        # hashing runs on the event loop thread (stages already running are separate processes)
+        if not force and self.is_up_to_date(stage):
+            print(f'[{stage.name}] up to date, skipping')
+            return StageResult(stage.name, STAGE_SKIPPED, 0.0)
+
+        print(f'[{stage.name}] running {" ".join(stage.command)}')
+        input_hash = self._input_hash(stage)
+        start_time = time.time()
+        proc = await asyncio.create_subprocess_exec(*stage.command)
+        returncode = await proc.wait()
+        elapsed = time.time() - start_time
+
+        status = STAGE_SUCCEEDED if returncode == 0 else STAGE_FAILED
+        self.state["stages"][stage.name] = {
+            "status": status,
+            "input_hash": input_hash,
+            "output_hash": self._output_hash(stage) if returncode == 0 else None,
+            "started": time.strftime('%Y-%m-%dT%H:%M:%S', time.localtime(start_time)),
+            "elapsed": elapsed
+        }
+        self._save_state()
+        print(f'[{stage.name}] {status} in {elapsed:.1f}s')
+        return StageResult(stage.name, status, elapsed)
+
+    async def run_async(self, force: Iterable[str] = ()) -> Dict[str, StageResult]:
+        """
+        Run all stages that are not up to date
+        :param force: names of stages to run even if up to date
+        :return: stage name -> result
+        """
+        force = set(force)
+        results = dict()
+        running = dict()
+
+        while len(results) < len(self.order):
+            for name in self.order:
+                if name in results or name in running.values() or len(running) >= self.max_concurrent:
+                    continue
+                stage = self.stages[name]
+                dependency_status = [results[d].status if d in results else None for d in stage.depends_on]
+                if any(status in (STAGE_FAILED, STAGE_BLOCKED) for status in dependency_status):
+                    results[name] = StageResult(name, STAGE_BLOCKED, 0.0)
+                    print(f'[{name}] blocked by a failed dependency')
+                elif all(status is not None for status in dependency_status):
+                    running[asyncio.ensure_future(self._run_stage(stage, name in force))] = name
+
+            if not running:
+                continue
+            done, _ = await asyncio.wait(running.keys(), return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                del running[task]
+                result = task.result()
+                results[result.name] = result
+
+        return results
+
+    def run(self, force: Iterable[str] = ()) -> Dict[str, StageResult]:
+        return asyncio.run(self.run_async(force))
@@ -0,0 +1,206 @@
+"""
+Content-addressed cache of BERT-DDI predictions
+Candidates are keyed by the entity-marked sentence and the model id, so identical candidates
+(across papers and across historical runs) are classified once per model
+
+"""
+
+import os
+import json
+import sqlite3
+import hashlib
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple
+
+from suppai.bert_ddi import mark_entities
+from suppai.utils.list_utils import chunk_iter
+
+
+# number of keys per lookup / insert statement
+QUERY_BATCH_SIZE = 500
+# file in a local model export holding the id of the Beaker model it was exported from
+MODEL_ID_FILE = 'bert_ddi_model.txt'
+HASH_BLOCK_SIZE = 1 << 20
+
+
+def candidate_key(entry: Dict, model_id: str) -> str:
+    """
+    Hash of the entity-marked candidate sentence and model id
+    :param entry: candidate sentence entry from batch_filter_sentences
+    :param model_id: e.g. bert_ddi_model from the config file
+    :return:
+    """
+    return hashlib.sha1(f'{model_id}\t{mark_entities(entry)}'.encode('utf-8')).hexdigest()
+
+
+def local_model_id(model_dir: str) -> str:
+    """
+    Cache model id of a local model export
+    If the export records the Beaker model it was exported from (MODEL_ID_FILE), that id is used, so local and Beaker
+    runs share predictions; otherwise the id is a hash of all files of the export (weights, config, and vocabulary)
+    :param model_dir:
+    :return:
+    """
+    model_id_file = os.path.join(model_dir, MODEL_ID_FILE)
+    if os.path.exists(model_id_file):
+        with open(model_id_file, 'r') as f:
+            return f.read().strip()
+
+    sha = hashlib.sha1()
+    for root, dir_names, file_names in os.walk(model_dir):
+        dir_names.sort()
+        for file_name in sorted(file_names):
+            file_path = os.path.join(root, file_name)
+            sha.update(os.path.relpath(file_path, model_dir).encode('utf-8') + b'\0')
+            with open(file_path, 'rb') as f:
+                for block in iter(lambda: f.read(HASH_BLOCK_SIZE), b''):
+                    sha.update(block)
+    return f'sha1:{sha.hexdigest()}'
+
+
+class PredictionCache:
+    """
+    SQLite-backed prediction store (key -> label, logits, probs)
+    """
+    def __init__(self, cache_file: str, model_id: str):
+        cache_dir = os.path.dirname(cache_file)
+        if cache_dir:
+            os.makedirs(cache_dir, exist_ok=True)
+
+        self.model_id = model_id
+        self.conn = sqlite3.connect(cache_file)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            "key TEXT PRIMARY KEY, label INTEGER, logits TEXT, probs TEXT)"
+        )
+        self.conn.commit()
+
+    def key(self, entry: Dict) -> str:
+        return candidate_key(entry, self.model_id)
+
+    def get_many(self, keys: Iterable[str]) -> Dict[str, Tuple[int, List[float], List[float]]]:
+        """
+        Look up cached predictions for keys; missing keys are absent from the output
+        :param keys:
+        :return:
+        """
+        found = dict()
+        for key_chunk in chunk_iter(keys, QUERY_BATCH_SIZE):
+            rows = self.conn.execute(
+                f"SELECT key, label, logits, probs FROM predictions WHERE key IN ({','.join('?' * len(key_chunk))})",
+                key_chunk
+            )
+            for key, label, logits, probs in rows:
+                found[key] = (label, json.loads(logits), json.loads(probs))
+        return found
+
+    def put_many(self, entries: Iterable[Tuple[str, int, Optional[List[float]], Optional[List[float]]]]):
+        """
+        Insert (key, label, logits, probs) predictions
+        :param entries:
+        :return:
+        """
+        for entry_chunk in chunk_iter(entries, QUERY_BATCH_SIZE):
+            self.conn.executemany(
+                "INSERT OR REPLACE INTO predictions (key, label, logits, probs) VALUES (?, ?, ?, ?)",
+                [(key, label, json.dumps(logits), json.dumps(probs)) for key, label, logits, probs in entry_chunk]
+            )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+
+def _read_lines(input_files: List[str]) -> Iterator[str]:
+    for input_file in input_files:
+        with open(input_file, 'r') as in_f:
+            for line in in_f:
+                yield line
+
+
+def partition_candidates(
+        cache: PredictionCache,
+        input_files: List[str],
+        miss_file: str,
+        hit_label_file: str
+) -> Dict[str, List[str]]:
+    """
+    Split candidate files into cache hits and unique cache misses
+    Labels for hits are written straight to hit_label_file; one candidate per unseen key is written to miss_file
+    :param cache:
+    :param input_files:
+    :param miss_file:
+    :param hit_label_file:
+    :return: pending keys -> candidate ids (first id is the one submitted, the rest reuse its label)
+    """
+    pending = dict()
+    num_hits = 0
+    num_total = 0
+
+    with open(miss_file, 'w') as miss_f, open(hit_label_file, 'w') as hit_f:
+        for lines in chunk_iter(_read_lines(input_files), QUERY_BATCH_SIZE):
+            entries = [json.loads(line) for line in lines]
+            keys = [cache.key(entry) for entry in entries]
+            cached = cache.get_many(set(keys))
+
+            for line, entry, key in zip(lines, entries, keys):
+                num_total += 1
+                if key in cached:
+                    label, logits, probs = cached[key]
+                    json.dump({
+                        "id": entry["id"],
+                        "sentence": entry["sentence"],
+                        "logits": logits,
+                        "probs": probs,
+                        "label-model": label
+                    }, hit_f)
+                    hit_f.write('\n')
+                    num_hits += 1
+                elif key in pending:
+                    pending[key].append(entry["id"])
+                else:
+                    pending[key] = [entry["id"]]
+                    miss_f.write(line)
+
+    num_dups = num_total - num_hits - len(pending)
+    print(f'{num_total} candidates: {num_hits} cached, {num_dups} duplicates, {len(pending)} to classify.')
+    return pending
+
+
+def complete_labels(cache: PredictionCache, label_file: str, pending: Dict[str, List[str]]) -> int:
+    """
+    Store new predictions in the cache and append labels for duplicate candidates to label_file
+    :param cache:
+    :param label_file: aggregated label file containing predictions for the submitted candidates
+    :param pending: output of partition_candidates
+    :return: number of new predictions cached
+    """
+    submitted = {ids[0]: key for key, ids in pending.items()}
+    new_predictions = []
+    dup_entries = []
+
+    with open(label_file, 'r') as f:
+        for line in f:
+            entry = json.loads(line)
+            key = submitted.get(entry["id"])
+            if key is None:
+                continue
+            new_predictions.append((key, int(entry["label-model"]), entry.get("logits"), entry.get("probs")))
+            for dup_id in pending[key][1:]:
+                dup_entry = dict(entry)
+                dup_entry["id"] = dup_id
+                dup_entries.append(dup_entry)
+
+    cache.put_many(new_predictions)
+
+    with open(label_file, 'a') as f:
+        for entry in dup_entries:
+            json.dump(entry, f)
+            f.write('\n')
+
+    missing = len(submitted) - len(new_predictions)
+    if missing:
+        print(f'{missing} submitted candidates have no predictions!')
+    return len(new_predictions)
@@ -0,0 +1,302 @@
+"""
+Embedded SQLite query index over the postprocess output
+Tables: cuis, interactions, sentences, papers, plus an FTS5 table over CUI names
+
+"""
+
+import os
+import re
+import json
+import sqlite3
+from typing import Dict, List, Mapping, Optional, Iterable, Tuple
+
+
+SCHEMA = """
+CREATE TABLE meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE cuis (
+    cui TEXT PRIMARY KEY,
+    ent_type TEXT,
+    preferred_name TEXT,
+    synonyms TEXT,
+    tradenames TEXT,
+    definition TEXT
+);
+CREATE TABLE interactions (
+    interaction_id TEXT PRIMARY KEY,
+    cui1 TEXT,
+    cui2 TEXT,
+    num_sentences INTEGER
+);
+CREATE TABLE sentences (
+    uid INTEGER PRIMARY KEY,
+    interaction_id TEXT,
+    paper_id TEXT,
+    sentence_id INTEGER,
+    sentence TEXT,
+    confidence REAL,
+    arg1_id TEXT,
+    arg1_start INTEGER,
+    arg1_end INTEGER,
+    arg2_id TEXT,
+    arg2_start INTEGER,
+    arg2_end INTEGER
+);
+CREATE TABLE papers (
+    paper_id TEXT PRIMARY KEY,
+    pmid INTEGER,
+    title TEXT,
+    authors TEXT,
+    year INTEGER,
+    venue TEXT,
+    doi TEXT,
+    fields_of_study TEXT,
+    retraction INTEGER,
+    clinical_study INTEGER,
+    human_study INTEGER,
+    animal_study INTEGER
+);
+CREATE VIRTUAL TABLE cui_names USING fts5(
+    name,
+    cui UNINDEXED,
+    name_type UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2',
+    prefix = '2 3'
+);
+"""
+
+INDEXES = """
+CREATE INDEX interactions_cui1 ON interactions (cui1);
+CREATE INDEX interactions_cui2 ON interactions (cui2);
+CREATE INDEX sentences_interaction_id ON sentences (interaction_id, confidence DESC, uid);
+CREATE INDEX sentences_paper_id ON sentences (paper_id);
+CREATE INDEX papers_pmid ON papers (pmid);
+"""
+
+INSERT_BATCH_SIZE = 10000
+
+
+def _insert_rows(conn: sqlite3.Connection, statement: str, rows: Iterable[Tuple]):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= INSERT_BATCH_SIZE:
+            conn.executemany(statement, batch)
+            batch = []
+    if batch:
+        conn.executemany(statement, batch)
+
+
+def build_query_index(
+        db_file: str,
+        interaction_dict: Mapping[str, List[str]],
+        sentence_dict: Mapping[str, List[Dict]],
+        cui_dict: Mapping[str, Dict],
+        paper_dict: Mapping[str, Dict],
+        meta: Dict,
+        sentence_counts: Optional[Mapping[str, int]] = None
+):
+    """
+    Build the SQLite index from the JSON-form output dicts (as written by form_dicts)
+    :param db_file: existing file is replaced
+    :param interaction_dict:
+    :param sentence_dict:
+    :param cui_dict:
+    :param paper_dict:
+    :param meta:
+    :param sentence_counts: sentences per interaction before the top-k cut (default: sentences in sentence_dict)
+    :return:
+    """
+    if os.path.exists(db_file):
+        os.remove(db_file)
+
+    conn = sqlite3.connect(db_file)
+    conn.execute("PRAGMA journal_mode = OFF")
+    conn.execute("PRAGMA synchronous = OFF")
+    conn.executescript(SCHEMA)
+
+    _insert_rows(conn, "INSERT INTO meta VALUES (?, ?)", ((k, json.dumps(v)) for k, v in meta.items()))
+
+    _insert_rows(conn, "INSERT INTO cuis VALUES (?, ?, ?, ?, ?, ?)", (
+        (cui, entry["ent_type"], entry["preferred_name"], json.dumps(entry["synonyms"]),
+         json.dumps(entry["tradenames"]), entry["definition"])
+        for cui, entry in cui_dict.items()
+    ))
+
+    def _names():
+        for cui, entry in cui_dict.items():
+            yield entry["preferred_name"], cui, "preferred_name"
+            for name in entry["synonyms"]:
+                yield name, cui, "synonym"
+            for name in entry["tradenames"]:
+                yield name, cui, "tradename"
+
+    _insert_rows(conn, "INSERT INTO cui_names (name, cui, name_type) VALUES (?, ?, ?)", _names())
+
+    interaction_ids = set()
+    for interactions in interaction_dict.values():
+        interaction_ids.update(interactions)
+
+    def _interactions():
+        for interaction_id in sorted(interaction_ids):
+            cui1, cui2 = interaction_id.split('-')
+            if sentence_counts is not None:
+                num_sentences = sentence_counts.get(interaction_id, 0)
+            else:
+                num_sentences = len(sentence_dict.get(interaction_id, []))
+            yield interaction_id, cui1, cui2, num_sentences
+
+    _insert_rows(conn, "INSERT INTO interactions VALUES (?, ?, ?, ?)", _interactions())
+
+    def _sentences():
+        for interaction_id, sentences in sentence_dict.items():
+            for sent in sentences:
+                yield (
+                    sent["uid"], interaction_id, sent["paper_id"], sent["sentence_id"], sent["sentence"],
+                    sent["confidence"],
+                    sent["arg1"]["id"], sent["arg1"]["span"][0], sent["arg1"]["span"][1],
+                    sent["arg2"]["id"], sent["arg2"]["span"][0], sent["arg2"]["span"][1]
+                )
+
+    _insert_rows(conn, "INSERT INTO sentences VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", _sentences())
+
+    _insert_rows(conn, "INSERT INTO papers VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", (
+        (paper_id, entry["pmid"], entry["title"], json.dumps(entry["authors"]), entry["year"], entry["venue"],
+         entry["doi"], json.dumps(entry["fields_of_study"]), entry["retraction"], entry["clinical_study"],
+         entry["human_study"], entry["animal_study"])
+        for paper_id, entry in paper_dict.items()
+    ))
+
+    # build indexes after bulk insert
+    conn.executescript(INDEXES)
+    conn.commit()
+    conn.execute("ANALYZE")
+    conn.close()
+
+
+class SuppAIIndex:
+    """
+    Read-only point queries over an index built by build_query_index
+    Results use the same JSON structure as the output dicts
+    """
+    def __init__(self, db_file: str):
+        assert os.path.exists(db_file)
+        self.conn = sqlite3.connect(f'file:{db_file}?mode=ro', uri=True, check_same_thread=False)
+
+    def meta(self) -> Dict:
+        return {k: json.loads(v) for k, v in self.conn.execute("SELECT key, value FROM meta")}
+
+    def get_cui(self, cui: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT ent_type, preferred_name, synonyms, tradenames, definition FROM cuis WHERE cui = ?", (cui,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "ent_type": row[0],
+            "preferred_name": row[1],
+            "synonyms": json.loads(row[2]),
+            "tradenames": json.loads(row[3]),
+            "definition": row[4]
+        }
+
+    def get_interactions(self, cui: str) -> List[str]:
+        rows = self.conn.execute(
+            "SELECT interaction_id FROM interactions WHERE cui1 = ? "
+            "UNION SELECT interaction_id FROM interactions WHERE cui2 = ?",
+            (cui, cui)
+        )
+        return sorted(row[0] for row in rows)
+
+    def get_sentence_count(self, interaction_id: str) -> int:
+        row = self.conn.execute(
+            "SELECT num_sentences FROM interactions WHERE interaction_id = ?", (interaction_id,)
+        ).fetchone()
+        return row[0] if row else 0
+
+    def count_sentences(self, interaction_id: str) -> int:
+        """
+        Evidence sentences of an interaction kept in the release (get_sentence_count counts all sentences found)
+        :param interaction_id:
+        :return:
+        """
+        return self.conn.execute(
+            "SELECT COUNT(*) FROM sentences WHERE interaction_id = ?", (interaction_id,)
+        ).fetchone()[0]
+
+    def get_sentences(self, interaction_id: str, limit: int = -1, offset: int = 0) -> List[Dict]:
+        """
+        Evidence sentences of an interaction, most confident first
+        :param interaction_id:
+        :param limit:
+        :param offset:
+        :return:
+        """
+        rows = self.conn.execute(
+            "SELECT uid, paper_id, sentence_id, sentence, confidence, "
+            "arg1_id, arg1_start, arg1_end, arg2_id, arg2_start, arg2_end "
+            "FROM sentences WHERE interaction_id = ? ORDER BY confidence DESC, uid LIMIT ? OFFSET ?",
+            (interaction_id, limit, offset)
+        )
+        return [{
+            "uid": row[0],
+            "paper_id": row[1],
+            "sentence_id": row[2],
+            "sentence": row[3],
+            "confidence": row[4],
+            "arg1": {"id": row[5], "span": [row[6], row[7]]},
+            "arg2": {"id": row[8], "span": [row[9], row[10]]}
+        } for row in rows]
+
+    def _paper_entry(self, row: Tuple) -> Dict:
+        return {
+            "title": row[2],
+            "authors": json.loads(row[3]),
+            "year": row[4],
+            "venue": row[5],
+            "doi": row[6],
+            "pmid": row[1],
+            "fields_of_study": json.loads(row[7]),
+            "retraction": bool(row[8]),
+            "clinical_study": bool(row[9]),
+            "human_study": bool(row[10]),
+            "animal_study": bool(row[11])
+        }
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        row = self.conn.execute("SELECT * FROM papers WHERE paper_id = ?", (paper_id,)).fetchone()
+        return self._paper_entry(row) if row else None
+
+    def get_paper_by_pmid(self, pmid: int) -> Optional[Tuple[str, Dict]]:
+        row = self.conn.execute("SELECT * FROM papers WHERE pmid = ?", (pmid,)).fetchone()
+        return (row[0], self._paper_entry(row)) if row else None
+
+    def search_names(self, query: str, limit: int = 10) -> List[Tuple[str, str, str]]:
+        """
+        Full-text name lookup over preferred names, synonyms, and tradenames (last token matched as a prefix)
+        :param query:
+        :param limit:
+        :return: (cui, matched name, name type), best match first, one entry per CUI
+        """
+        tokens = re.findall(r'\w+', query.lower())
+        if not tokens:
+            return []
+        fts_query = ' '.join(f'"{token}"' for token in tokens[:-1]) + f' "{tokens[-1]}"*'
+        rows = self.conn.execute(
+            "SELECT cui, name, name_type FROM cui_names WHERE cui_names MATCH ? ORDER BY rank LIMIT ?",
+            (fts_query, limit * 5)
+        )
+        results = []
+        seen = set()
+        for cui, name, name_type in rows:
+            if cui not in seen:
+                seen.add(cui)
+                results.append((cui, name, name_type))
+            if len(results) >= limit:
+                break
+        return results
+
+    def close(self):
+        self.conn.close()
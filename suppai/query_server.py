@@ -0,0 +1,455 @@
+"""
+Read-only asyncio HTTP server over the latest release in output/
+Data is read lazily from the release artifacts: the SQLite query index next to the tarball if there is one, else the
+sharded bundle in the tarball (extracted once), else the legacy JSON files (each loaded on first use). Hot entries are
+kept in an LRU cache, and a newer complete tarball is picked up and swapped in atomically while serving; the replaced
+release is closed once the requests still using it finish
+
+Endpoints (GET, JSON responses):
+    /meta
+    /cui/<cui>
+    /cui/<cui>/interactions
+    /interaction/<interaction_id>/sentences?offset=0&limit=20
+    /paper/<paper_id>
+
+"""
+
+import os
+import re
+import glob
+import json
+import time
+import shutil
+import asyncio
+import tarfile
+from http import HTTPStatus
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs, unquote
+from typing import Dict, List, Optional, Tuple, Iterator, Callable
+
+from suppai.output_bundle import ShardedBundle, INDEX_FILE
+from suppai.output_delta import LEGACY_FILES, LEGACY_META_FILE
+from suppai.packaging import MANIFEST_SUFFIX
+from suppai.query_index import SuppAIIndex
+
+
+OUTPUT_DIR = 'output/'
+WORK_DIR = 'output/server/'
+CACHE_SIZE = 10000
+# seconds between checks for a new release
+RELOAD_INTERVAL = 30
+# tarballs without a manifest (written last by write_archive) are used once unmodified for this long
+RELOAD_SETTLE_SECONDS = 60
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+class LegacyReleaseReader:
+    """
+    Reader over a legacy release tarball; each JSON dict is loaded on first use
+    """
+    def __init__(self, tar_file: str):
+        self.tar_file = tar_file
+        with tarfile.open(tar_file, 'r:*') as tar:
+            self.members = set(tar.getnames())
+            self.meta = json.load(tar.extractfile(LEGACY_META_FILE)) if LEGACY_META_FILE in self.members else dict()
+        self._datasets = dict()
+
+    def _dataset(self, name: str) -> Dict:
+        if name not in self._datasets:
+            if LEGACY_FILES[name] not in self.members:
+                self._datasets[name] = None
+            else:
+                with tarfile.open(self.tar_file, 'r:*') as tar:
+                    self._datasets[name] = json.load(tar.extractfile(LEGACY_FILES[name]))
+        return self._datasets[name]
+
+    def get_cui(self, cui: str) -> Optional[Dict]:
+        return self._dataset("cuis").get(cui)
+
+    def get_interactions(self, cui: str) -> List[str]:
+        return self._dataset("interactions").get(cui, [])
+
+    def get_sentences(self, interaction_id: str) -> List[Dict]:
+        return self._dataset("sentences").get(interaction_id, [])
+
+    def get_sentence_count(self, interaction_id: str) -> int:
+        # releases before sentence counts lack them
+        if self._dataset("sentence_counts") is None:
+            return len(self.get_sentences(interaction_id))
+        return self._dataset("sentence_counts").get(interaction_id, 0)
+
+    def get_paper(self, paper_id: str) -> Optional[Dict]:
+        return self._dataset("papers").get(paper_id)
+
+    def keys(self, name: str) -> Iterator[str]:
+        return iter(self._dataset(name))
+
+    def close(self):
+        self._datasets = dict()
+
+
+class Release:
+    """
+    One loaded release: a reader, the thread its blocking reads run on, and an LRU cache of hot entries
+    """
+    def __init__(self, tar_file: str, work_dir: str = WORK_DIR, cache_size: int = CACHE_SIZE):
+        self.tar_file = tar_file
+        self.name = os.path.basename(tar_file)[:-len('.tar.gz')]
+        self.mtime = os.path.getmtime(tar_file)
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        self.cache_hits = 0
+        self.cache_misses = 0
+        # one read thread per release: readers are not thread-safe, and a replaced release finishes its queued
+        # reads before it is closed
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.extract_dir = None
+        # requests using the release; a retired release is closed when the last one finishes
+        self.in_flight = 0
+        self.retired = False
+        self.closed = False
+
+        index_file = tar_file[:-len('.tar.gz')] + '.sqlite'
+        if os.path.exists(index_file):
+            self.kind = 'index'
+            self.reader = SuppAIIndex(index_file)
+            self.meta = self.reader.meta()
+            return
+
+        with tarfile.open(tar_file, 'r:*') as tar:
+            bundle_index = [name for name in tar.getnames() if os.path.basename(name) == INDEX_FILE]
+            if bundle_index:
+                self.kind = 'bundle'
+                self.extract_dir = os.path.join(work_dir, self.name)
+                if os.path.exists(self.extract_dir):
+                    shutil.rmtree(self.extract_dir)
+                tar.extractall(self.extract_dir, filter='data')
+                self.reader = ShardedBundle(os.path.join(self.extract_dir, os.path.dirname(bundle_index[0])))
+                self.meta = self.reader.meta
+                return
+
+        self.kind = 'legacy'
+        self.reader = LegacyReleaseReader(tar_file)
+        self.meta = self.reader.meta
+
+    def get_sentence_page(self, interaction_id: str, offset: int, limit: int) -> Tuple[int, List[Dict]]:
+        """
+        One page of the evidence sentences of an interaction (paged in SQL for the query index)
+        :param interaction_id:
+        :param offset:
+        :param limit:
+        :return: (sentences in the release, sentences of the page)
+        """
+        if self.kind == 'index':
+            return (self.reader.count_sentences(interaction_id),
+                    self.reader.get_sentences(interaction_id, limit=limit, offset=offset))
+        sentences = self.reader.get_sentences(interaction_id)
+        return len(sentences), sentences[offset:offset + limit]
+
+    def get_interaction_counts(self, cui: str) -> Optional[List[Dict]]:
+        if self.reader.get_cui(cui) is None:
+            return None
+        return [
+            {"interaction_id": interaction_id, "sentence_count": self.reader.get_sentence_count(interaction_id)}
+            for interaction_id in self.reader.get_interactions(cui)
+        ]
+
+    def keys(self, name: str) -> Iterator[str]:
+        """
+        Keys of a dataset (cuis, interactions, sentences, or papers), e.g. to sample load test requests
+        :param name:
+        :return:
+        """
+        if self.kind == 'index':
+            table, column = {"cuis": ("cuis", "cui"), "interactions": ("cuis", "cui"),
+                             "sentences": ("interactions", "interaction_id"), "papers": ("papers", "paper_id")}[name]
+            return (row[0] for row in self.reader.conn.execute(f"SELECT {column} FROM {table}"))
+        if self.kind == 'bundle':
+            return (key for key, _ in self.reader.items(name))
+        return self.reader.keys(name)
+
+    async def cached(self, key: Tuple, fn: Callable, *args):
+        """
+        Result of a blocking read, from the LRU cache or run on the release's read thread
+        :param key:
+        :param fn:
+        :param args:
+        :return:
+        """
+        if key in self._cache:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+            return self._cache[key]
+        self.cache_misses += 1
+        value = await asyncio.get_running_loop().run_in_executor(self.executor, fn, *args)
+        self._cache[key] = value
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return value
+
+    @contextmanager
+    def in_use(self):
+        """
+        Count a request using the release for its duration (a retired release stays open until it finishes)
+        :return:
+        """
+        self.in_flight += 1
+        try:
+            yield self
+        finally:
+            self.in_flight -= 1
+            if self.retired and not self.in_flight:
+                self.close()
+
+    def retire(self):
+        """
+        Close the release now, or when the requests still using it finish
+        :return:
+        """
+        self.retired = True
+        if not self.in_flight:
+            self.close()
+
+    def _close_reader(self):
+        # sharded bundles hold no open files
+        if self.kind != 'bundle':
+            self.reader.close()
+        if self.extract_dir and os.path.exists(self.extract_dir):
+            shutil.rmtree(self.extract_dir)
+
+    def close(self, wait: bool = False):
+        if self.closed:
+            return
+        self.closed = True
+        # runs after reads already queued on the release's thread
+        self.executor.submit(self._close_reader)
+        self.executor.shutdown(wait=wait)
+
+
+def latest_release(output_dir: str = OUTPUT_DIR) -> Optional[str]:
+    """
+    Newest complete release tarball (names sort by date)
+    :param output_dir:
+    :return:
+    """
+    for tar_file in sorted(glob.glob(os.path.join(output_dir, '*.tar.gz')), reverse=True):
+        if os.path.exists(tar_file + MANIFEST_SUFFIX) or time.time() - os.path.getmtime(tar_file) > RELOAD_SETTLE_SECONDS:
+            return tar_file
+    return None
+
+
+class HTTPError(Exception):
+    def __init__(self, status: HTTPStatus, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+class QueryServer:
+    """
+    Serves the latest release in output_dir; see the module docstring for endpoints
+    """
+    ROUTES = [
+        (re.compile(r'^/meta$'), '_meta'),
+        (re.compile(r'^/cui/(?P<cui>[^/]+)$'), '_cui'),
+        (re.compile(r'^/cui/(?P<cui>[^/]+)/interactions$'), '_interactions'),
+        (re.compile(r'^/interaction/(?P<interaction_id>[^/]+)/sentences$'), '_sentences'),
+        (re.compile(r'^/paper/(?P<paper_id>[^/]+)$'), '_paper')
+    ]
+
+    def __init__(
+            self,
+            output_dir: str = OUTPUT_DIR,
+            work_dir: str = WORK_DIR,
+            cache_size: int = CACHE_SIZE,
+            reload_interval: float = RELOAD_INTERVAL
+    ):
+        self.output_dir = output_dir
+        self.work_dir = work_dir
+        self.cache_size = cache_size
+        self.reload_interval = reload_interval
+        self.release: Optional[Release] = None
+        self._reload_lock = asyncio.Lock()
+
+    async def reload(self) -> bool:
+        """
+        Load the latest release if it differs from the one being served, then swap it in
+        :return: whether a new release was loaded
+        """
+        async with self._reload_lock:
+            tar_file = latest_release(self.output_dir)
+            current = self.release
+            if tar_file is None or (current and current.tar_file == tar_file and
+                                    current.mtime == os.path.getmtime(tar_file)):
+                return False
+            release = await asyncio.get_running_loop().run_in_executor(
+                None, Release, tar_file, self.work_dir, self.cache_size
+            )
+            # requests already holding the old release finish on it
+            self.release = release
+            if current:
+                current.retire()
+            print(f'Serving {tar_file} ({release.kind})')
+            return True
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            try:
+                await self.reload()
+            except Exception as e:
+                print(f'Reload failed, still serving the previous release: {e!r}')
+
+    async def _meta(self, release: Release, query: Dict) -> Dict:
+        return {"release": release.name, **release.meta}
+
+    async def _cui(self, release: Release, query: Dict, cui: str) -> Dict:
+        entry = await release.cached(("cui", cui), release.reader.get_cui, cui)
+        if entry is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown CUI {cui}")
+        return entry
+
+    async def _interactions(self, release: Release, query: Dict, cui: str) -> Dict:
+        interactions = await release.cached(("interactions", cui), release.get_interaction_counts, cui)
+        if interactions is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown CUI {cui}")
+        return {"cui": cui, "interactions": interactions}
+
+    async def _sentences(self, release: Release, query: Dict, interaction_id: str) -> Dict:
+        try:
+            offset = int(query.get("offset", [0])[0])
+            limit = int(query.get("limit", [DEFAULT_PAGE_SIZE])[0])
+        except ValueError:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, "offset and limit must be integers")
+        if offset < 0 or not 0 < limit <= MAX_PAGE_SIZE:
+            raise HTTPError(HTTPStatus.BAD_REQUEST, f"offset must be >= 0 and limit in 1..{MAX_PAGE_SIZE}")
+
+        # pages are cached, not whole sentence lists, so cache entries hold at most MAX_PAGE_SIZE sentences
+        num_sentences, page = await release.cached(
+            ("sentences", interaction_id, offset, limit), release.get_sentence_page, interaction_id, offset, limit
+        )
+        if not num_sentences:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown interaction {interaction_id}")
+        sentence_count = await release.cached(
+            ("sentence_count", interaction_id), release.reader.get_sentence_count, interaction_id
+        )
+        return {
+            "interaction_id": interaction_id,
+            # sentences found, including those not kept in the release
+            "sentence_count": sentence_count,
+            "num_sentences": num_sentences,
+            "offset": offset,
+            "limit": limit,
+            "sentences": page
+        }
+
+    async def _paper(self, release: Release, query: Dict, paper_id: str) -> Dict:
+        entry = await release.cached(("paper", paper_id), release.reader.get_paper, paper_id)
+        if entry is None:
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"Unknown paper {paper_id}")
+        return entry
+
+    async def handle(self, method: str, target: str) -> Tuple[HTTPStatus, Dict]:
+        """
+        Response to one request
+        :param method:
+        :param target: path and query string
+        :return: (status, JSON body)
+        """
+        try:
+            if method not in ('GET', 'HEAD'):
+                raise HTTPError(HTTPStatus.METHOD_NOT_ALLOWED, "Only GET is supported")
+            release = self.release
+            if release is None:
+                raise HTTPError(HTTPStatus.SERVICE_UNAVAILABLE, "No release loaded")
+            url = urlsplit(target)
+            for pattern, handler in self.ROUTES:
+                match = pattern.match(url.path)
+                if match:
+                    params = {k: unquote(v) for k, v in match.groupdict().items()}
+                    with release.in_use():
+                        return HTTPStatus.OK, await getattr(self, handler)(release, parse_qs(url.query), **params)
+            raise HTTPError(HTTPStatus.NOT_FOUND, f"No route for {url.path}")
+        except HTTPError as e:
+            return e.status, {"error": str(e)}
+        except Exception as e:
+            print(f'Error handling {method} {target}: {e!r}')
+            return HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}
+
+    @staticmethod
+    def _response(status: HTTPStatus, body: Dict, keep_alive: bool, head: bool = False) -> bytes:
+        data = json.dumps(body).encode('utf-8')
+        return (
+            f'HTTP/1.1 {status.value} {status.phrase}\r\n'
+            f'Content-Type: application/json\r\n'
+            f'Content-Length: {len(data)}\r\n'
+            f'Connection: {"keep-alive" if keep_alive else "close"}\r\n\r\n'
+        ).encode('latin-1') + (data if not head else b'')
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                if int(headers.get('content-length') or 0):
+                    await reader.readexactly(int(headers['content-length']))
+
+                parts = request_line.decode('latin-1').split()
+                if len(parts) == 3:
+                    method, target, version = parts
+                    status, body = await self.handle(method, target)
+                else:
+                    method, version = 'GET', 'HTTP/1.0'
+                    status, body = HTTPStatus.BAD_REQUEST, {"error": "Malformed request line"}
+
+                connection = headers.get('connection', '').lower()
+                keep_alive = connection == 'keep-alive' or (version == 'HTTP/1.1' and connection != 'close')
+                writer.write(self._response(status, body, keep_alive, head=method == 'HEAD'))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        except Exception as e:
+            print(f'Error on connection: {e!r}')
+            try:
+                writer.write(self._response(HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"}, False))
+                await writer.drain()
+            except ConnectionError:
+                pass
+        finally:
+            writer.close()
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.AbstractServer:
+        """
+        Load the latest release, start watching for new ones, and start accepting connections
+        :param host:
+        :param port: 0 picks a free port
+        :return:
+        """
+        await self.reload()
+        self._watch_task = asyncio.create_task(self._watch())
+        return await asyncio.start_server(self._handle_connection, host, port)
+
+    async def serve_forever(self, host: str = '127.0.0.1', port: int = 8000):
+        server = await self.start(host, port)
+        print(f'Listening on {", ".join(str(s.getsockname()) for s in server.sockets)}')
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        if getattr(self, '_watch_task', None):
+            self._watch_task.cancel()
+        if self.release:
+            self.release.close()
+            self.release = None
@@ -0,0 +1,258 @@
+"""
+Restricted UMLS knowledge base and ANN index for the scispacy linker
+Only concepts of KEEP_TYPES (or only CUI cluster members) are kept, plus "distractor" concepts: concepts outside the
+restriction that score above BETTER_SCORE_THRESHOLD in the full index against a kept alias or a sample corpus mention.
+Distractors keep the rejection of general text spans that match a different entity better (see DrugSupplementLinker);
+from kept aliases alone they miss spans unlike any kept alias (e.g. "vitamin" when only "vitamin c" is kept), which
+the restricted linker then links, so corpus mentions are also searched when given
+
+"""
+
+import os
+import json
+import functools
+from typing import Dict, List, Set, Optional, Iterable
+
+import tqdm
+from scispacy.candidate_generation import (
+    CandidateGenerator, LinkerPaths, DEFAULT_PATHS, DEFAULT_KNOWLEDGE_BASES, create_tfidf_ann_index
+)
+from scispacy.linking_utils import KnowledgeBase
+
+from suppai.ner_and_linker import KEEP_TYPES, BETTER_SCORE_THRESHOLD
+from suppai.utils.list_utils import chunk_iter
+
+
+RESTRICTED_KB_DIR = 'data/restricted_kb/'
+RESTRICTED_LINKER_NAME = 'suppai_restricted'
+KB_FILE = 'kb.jsonl'
+MANIFEST_FILE = 'restricted_kb.json'
+
+# nearest neighbours checked per kept alias when looking for distractors
+DISTRACTOR_K = 10
+DISTRACTOR_BATCH_SIZE = 10000
+# scispacy linker defaults used by DrugSupplementLinker (candidates at or below LINKER_THRESHOLD are dropped)
+LINKER_THRESHOLD = 0.7
+LINKER_TOP_K = 3
+
+
+def select_concepts(
+        cui_to_entity: Dict,
+        keep_types: Optional[Set[str]] = KEEP_TYPES,
+        keep_cuis: Optional[Set[str]] = None
+) -> Set[str]:
+    """
+    CUIs that can survive linking (semantic type in keep_types) and, if given, filtering (in keep_cuis)
+    :param cui_to_entity: concept_id -> scispacy Entity
+    :param keep_types:
+    :param keep_cuis: e.g. CUIHandler.valid_cuis
+    :return:
+    """
+    keep = set()
+    for cui, entity in cui_to_entity.items():
+        if keep_cuis is not None and cui not in keep_cuis:
+            continue
+        if keep_types and not set(entity.types).intersection(keep_types):
+            continue
+        keep.add(cui)
+    return keep
+
+
+def find_distractors(
+        candidate_generator: CandidateGenerator,
+        keep: Set[str],
+        threshold: float = BETTER_SCORE_THRESHOLD,
+        k: int = DISTRACTOR_K,
+        mentions: Optional[Iterable[str]] = None
+) -> Set[str]:
+    """
+    Concepts outside keep that match an alias of a kept concept (or a corpus mention) above threshold in the full index
+    :param candidate_generator: candidate generator over the full KB
+    :param keep:
+    :param threshold:
+    :param k:
+    :param mentions: mention strings from the corpus (e.g. NER output over a sample of abstracts)
+    :return:
+    """
+    cui_to_entity = candidate_generator.kb.cui_to_entity
+    aliases = set(
+        alias for cui in keep for alias in [cui_to_entity[cui].canonical_name] + list(cui_to_entity[cui].aliases)
+    )
+    queries = sorted(aliases | set(mentions or []))
+
+    distractors = set()
+    for query_batch in tqdm.tqdm(chunk_iter(queries, DISTRACTOR_BATCH_SIZE), desc='finding distractors'):
+        for candidates in candidate_generator(list(query_batch), k):
+            for candidate in candidates:
+                if candidate.concept_id not in keep and max(candidate.similarities) > threshold:
+                    distractors.add(candidate.concept_id)
+    return distractors
+
+
+def link_decisions(
+        candidate_generator: CandidateGenerator,
+        mentions: Iterable[str],
+        keep_types: Optional[Set[str]] = KEEP_TYPES,
+        threshold: float = BETTER_SCORE_THRESHOLD,
+        k: int = DISTRACTOR_K
+) -> Dict[str, List[str]]:
+    """
+    CUIs DrugSupplementLinker keeps for each mention string: of the top LINKER_TOP_K candidates above
+    LINKER_THRESHOLD, those of keep_types up to the first candidate of another type scoring above threshold
+    (definition filtering is left out)
+    :param candidate_generator:
+    :param mentions:
+    :param keep_types:
+    :param threshold:
+    :param k:
+    :return: mention -> kept CUIs (empty if the mention is rejected)
+    """
+    cui_to_entity = candidate_generator.kb.cui_to_entity
+    decisions = dict()
+    for mention_batch in chunk_iter(sorted(set(mentions)), DISTRACTOR_BATCH_SIZE):
+        for mention, candidates in zip(mention_batch, candidate_generator(list(mention_batch), k)):
+            scored = sorted(
+                ((max(c.similarities), c.concept_id) for c in candidates if max(c.similarities) > LINKER_THRESHOLD),
+                reverse=True
+            )
+            kept = []
+            for score, cui in scored[:LINKER_TOP_K]:
+                types = cui_to_entity[cui].types
+                if not keep_types or set(types).intersection(keep_types):
+                    kept.append(cui)
+                elif types and score > threshold:
+                    break
+            decisions[mention] = kept
+    return decisions
+
+
+def compare_link_decisions(full: Dict[str, List[str]], restricted: Dict[str, List[str]]) -> Dict[str, int]:
+    """
+    Count how the restricted linker's decisions differ from the full linker's on the same mentions
+    :param full: link_decisions against the full KB
+    :param restricted: link_decisions against the restricted KB
+    :return:
+    """
+    counts = {"mentions": len(full), "agree": 0, "rejected_by_full_only": 0, "rejected_by_restricted_only": 0,
+              "linked_differently": 0}
+    for mention, full_cuis in full.items():
+        restricted_cuis = restricted.get(mention, [])
+        if full_cuis == restricted_cuis:
+            counts["agree"] += 1
+        elif not full_cuis:
+            counts["rejected_by_full_only"] += 1
+        elif not restricted_cuis:
+            counts["rejected_by_restricted_only"] += 1
+        else:
+            counts["linked_differently"] += 1
+    return counts
+
+
+def write_kb(kb_file: str, cui_to_entity: Dict, cuis: Iterable[str]) -> int:
+    """
+    Write concepts in the jsonl format read by scispacy KnowledgeBase
+    :param kb_file:
+    :param cui_to_entity:
+    :param cuis:
+    :return: number of concepts written
+    """
+    num_concepts = 0
+    with open(kb_file, 'w') as f:
+        for cui in sorted(cuis):
+            entity = cui_to_entity[cui]
+            json.dump({
+                "concept_id": entity.concept_id,
+                "canonical_name": entity.canonical_name,
+                "aliases": list(entity.aliases),
+                "types": list(entity.types),
+                "definition": entity.definition
+            }, f)
+            f.write('\n')
+            num_concepts += 1
+    return num_concepts
+
+
+def build_restricted_kb(
+        output_dir: str = RESTRICTED_KB_DIR,
+        keep_types: Optional[Set[str]] = KEEP_TYPES,
+        keep_cuis: Optional[Set[str]] = None,
+        distractors: bool = True,
+        threshold: float = BETTER_SCORE_THRESHOLD,
+        mentions: Optional[List[str]] = None
+) -> Dict:
+    """
+    Build a restricted KB and its TF-IDF vectorizer and ANN index from the full scispacy UMLS linker
+    :param output_dir:
+    :param keep_types:
+    :param keep_cuis: also restrict to these CUIs (e.g. CUI cluster members)
+    :param distractors: add distractor concepts
+    :param threshold: distractor similarity threshold
+    :param mentions: corpus mention strings, also searched for distractors; the full and restricted linkers'
+                     decisions on them are compared in the manifest ("mention_agreement")
+    :return: manifest
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    print('loading full UMLS KB and index...')
+    candidate_generator = CandidateGenerator(name='umls')
+    cui_to_entity = candidate_generator.kb.cui_to_entity
+
+    keep = select_concepts(cui_to_entity, keep_types, keep_cuis)
+    print(f'{len(keep)} of {len(cui_to_entity)} concepts kept.')
+    distractor_cuis = find_distractors(candidate_generator, keep, threshold, mentions=mentions) if distractors else set()
+    print(f'{len(distractor_cuis)} distractor concepts.')
+    full_decisions = link_decisions(candidate_generator, mentions, keep_types, threshold) if mentions else None
+
+    kb_file = os.path.join(output_dir, KB_FILE)
+    num_concepts = write_kb(kb_file, cui_to_entity, keep | distractor_cuis)
+
+    # release the full index before building the restricted one
+    del candidate_generator, cui_to_entity
+
+    print('building TF-IDF vectors and ANN index...')
+    concept_aliases, tfidf_vectorizer, ann_index = create_tfidf_ann_index(output_dir.rstrip('/'), KnowledgeBase(kb_file))
+
+    manifest = {
+        "num_concepts": num_concepts,
+        "num_kept": len(keep),
+        "num_distractors": len(distractor_cuis),
+        "keep_types": sorted(keep_types) if keep_types else None,
+        "restricted_to_cuis": keep_cuis is not None,
+        "distractor_threshold": threshold if distractors else None
+    }
+    if full_decisions is not None:
+        restricted_generator = CandidateGenerator(
+            ann_index=ann_index, tfidf_vectorizer=tfidf_vectorizer, ann_concept_aliases_list=concept_aliases,
+            kb=KnowledgeBase(kb_file)
+        )
+        restricted_decisions = link_decisions(restricted_generator, mentions, keep_types, threshold)
+        manifest["mention_agreement"] = compare_link_decisions(full_decisions, restricted_decisions)
+        print(f'Linking of {len(mentions)} mentions: {manifest["mention_agreement"]}')
+    with open(os.path.join(output_dir, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f, indent=4)
+    return manifest
+
+
+def has_restricted_kb(kb_dir: str) -> bool:
+    return os.path.exists(os.path.join(kb_dir, MANIFEST_FILE))
+
+
+def register_restricted_linker(kb_dir: str = RESTRICTED_KB_DIR) -> str:
+    """
+    Register a restricted KB with scispacy, to load it with
+    nlp.add_pipe("scispacy_linker", config={"linker_name": <returned name>})
+    :param kb_dir: output directory of build_restricted_kb
+    :return: linker name
+    """
+    if not has_restricted_kb(kb_dir):
+        raise FileNotFoundError(f"No restricted KB in {kb_dir}; build one with scripts/build_restricted_kb.py")
+    DEFAULT_PATHS[RESTRICTED_LINKER_NAME] = LinkerPaths(
+        ann_index=os.path.join(kb_dir, 'nmslib_index.bin'),
+        tfidf_vectorizer=os.path.join(kb_dir, 'tfidf_vectorizer.joblib'),
+        tfidf_vectors=os.path.join(kb_dir, 'tfidf_vectors_sparse.npz'),
+        concept_aliases_list=os.path.join(kb_dir, 'concept_aliases.json')
+    )
+    DEFAULT_KNOWLEDGE_BASES[RESTRICTED_LINKER_NAME] = functools.partial(
+        KnowledgeBase, file_path=os.path.join(kb_dir, KB_FILE)
+    )
+    return RESTRICTED_LINKER_NAME
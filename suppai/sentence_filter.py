@@ -0,0 +1,96 @@
+"""
+Candidate formation: supp/drug entity pairs from sentences with linked entities
+
+"""
+
+import itertools
+from typing import Dict, List, Iterable, Iterator
+
+from suppai import metrics
+from suppai.cui_handler import CUIHandler
+
+
+def clean_ent(ent: Dict) -> Dict:
+    """
+    Get top cui from scispacy entity linking output
+    Return entity dictionary
+    :param ent:
+    :return:
+    """
+    return {
+        "span": [[ent['start'], ent['end']]],
+        "string": ent['string'],
+        "umls_types": ent['linked_cuis'][0][1],
+        "id": ent['linked_cuis'][0][0]
+    }
+
+
+def filter_sentence(sent: Dict, handler: CUIHandler, counter: int) -> List[Dict]:
+    """
+    Form candidate entries for supp/drug entity pairs of one sentence
+    :param sent: sentence entry with linked entities
+    :param handler:
+    :param counter: number of candidates already formed from this batch (for candidate ids)
+    :return:
+    """
+    entities = sent["entities"]
+    metrics.incr("filter.sentences")
+
+    # skip sentence if only one detected entity
+    if len(entities) < 2:
+        metrics.incr("filter.skipped.single_entity")
+        return []
+
+    # skip sentence if all entity strings are the same
+    if len(set([ent["string"].strip() for ent in entities])) < 2:
+        metrics.incr("filter.skipped.same_strings")
+        return []
+
+    # clean entities and construct dicts
+    keep_ents = [clean_ent(ent) for ent in entities]
+
+    # generate sentence entry for each pair of entities
+    candidates = []
+    for ent1, ent2 in itertools.combinations(keep_ents, 2):
+
+        # skip if same id
+        if ent1['id'] == ent2['id']:
+            metrics.incr("filter.pairs_skipped.same_id")
+            continue
+
+        # skip if same entity
+        if ent1['string'].strip() == ent2['string'].strip():
+            metrics.incr("filter.pairs_skipped.same_string")
+            continue
+
+        # skip if not supp-drug or supp-supp
+        if not (handler.is_supp_drug(ent1['id'], ent2['id']) or handler.is_supp_supp(ent1['id'], ent2['id'])):
+            metrics.incr("filter.pairs_skipped.no_supps")
+            continue
+
+        # create sentence entry for DDI model
+        candidates.append({
+            "id": str(sent["id"]) + '-' + str(counter + len(candidates)),
+            "sentence_id": sent["sentence_id"],
+            "sentence": sent["sentence"],
+            "arg1": ent1,
+            "arg2": ent2
+        })
+    metrics.incr("filter.candidates", len(candidates))
+    return candidates
+
+
+def filter_sentences(sents: Iterable[Dict], handler: CUIHandler, counter: int = 0) -> Iterator[Dict]:
+    """
+    Candidate entries of a stream of sentence entries, with candidate ids numbered on from counter
+    (the same whether sentences come straight from NER or are read back from an entity file)
+    :param sents: sentence entries with linked entities
+    :param handler:
+    :param counter:
+    :return:
+    """
+    for sent in sents:
+        with metrics.timer("filter.sentence"):
+            candidates = filter_sentence(sent, handler, counter)
+        counter += len(candidates)
+        yield from candidates
@@ -0,0 +1,113 @@
+"""
+Indexed local store of English UMLS names and definitions
+Built once from MRCONSO.RRF and MRDEF.RRF (scripts/build_umls_store.py) so CUI metadata can be looked up by CUI
+instead of rescanning the RRF files
+
+"""
+
+import os
+import sqlite3
+from collections import defaultdict
+from typing import Dict, List, Tuple, Iterable, Iterator
+
+from suppai.utils.list_utils import chunk_iter
+
+
+UMLS_STORE_FILE = 'data/umls.sqlite'
+
+QUERY_BATCH_SIZE = 500
+INSERT_BATCH_SIZE = 100000
+
+
+def read_rrf(rrf_file: str) -> Iterator[List[str]]:
+    with open(rrf_file, 'r') as f:
+        for line in f:
+            yield line.rstrip('\n').split('|')
+
+
+class UMLSStore:
+    """
+    SQLite-backed UMLS store: English names (with term type) and definitions, indexed by CUI
+    Rows keep the order of the RRF files
+    """
+    def __init__(self, store_file: str = UMLS_STORE_FILE):
+        store_dir = os.path.dirname(store_file)
+        if store_dir:
+            os.makedirs(store_dir, exist_ok=True)
+
+        self.conn = sqlite3.connect(store_file)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS names (cui TEXT, tty TEXT, name TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS definitions (cui TEXT, definition TEXT)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.conn.commit()
+
+    def build(self, mrconso_file: str, mrdef_file: str):
+        """
+        Replace the store contents with the English names in MRCONSO.RRF and the definitions in MRDEF.RRF
+        :param mrconso_file:
+        :param mrdef_file:
+        :return:
+        """
+        self.conn.execute("DROP INDEX IF EXISTS names_cui")
+        self.conn.execute("DROP INDEX IF EXISTS definitions_cui")
+        self.conn.execute("DELETE FROM names")
+        self.conn.execute("DELETE FROM definitions")
+
+        # MRCONSO columns: CUI|LAT|TS|LUI|STT|SUI|ISPREF|AUI|SAUI|SCUI|SDUI|SAB|TTY|CODE|STR|...
+        names = ((splits[0], splits[12], splits[14]) for splits in read_rrf(mrconso_file) if splits[1] == 'ENG')
+        for rows in chunk_iter(names, INSERT_BATCH_SIZE):
+            self.conn.executemany("INSERT INTO names (cui, tty, name) VALUES (?, ?, ?)", rows)
+        print(f'{self.conn.execute("SELECT COUNT(*) FROM names").fetchone()[0]} English names read from {mrconso_file}')
+
+        # MRDEF columns: CUI|AUI|ATUI|SATUI|SAB|DEF|...
+        definitions = ((splits[0], splits[5]) for splits in read_rrf(mrdef_file) if splits[5])
+        for rows in chunk_iter(definitions, INSERT_BATCH_SIZE):
+            self.conn.executemany("INSERT INTO definitions (cui, definition) VALUES (?, ?)", rows)
+        print(f'{self.conn.execute("SELECT COUNT(*) FROM definitions").fetchone()[0]} definitions read from {mrdef_file}')
+
+        # index after loading (much faster than maintaining the index during inserts)
+        self.conn.execute("CREATE INDEX names_cui ON names (cui)")
+        self.conn.execute("CREATE INDEX definitions_cui ON definitions (cui)")
+        self.conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?), (?, ?)",
+            ('mrconso_file', mrconso_file, 'mrdef_file', mrdef_file)
+        )
+        self.conn.commit()
+
+    def get_names(self, cuis: Iterable[str]) -> Dict[str, List[Tuple[str, str]]]:
+        """
+        English names of CUIs
+        :param cuis:
+        :return: cui -> [(tty, name)] in MRCONSO order; CUIs without names are absent
+        """
+        names = defaultdict(list)
+        for cui_chunk in chunk_iter(sorted(set(cuis)), QUERY_BATCH_SIZE):
+            rows = self.conn.execute(
+                f"SELECT cui, tty, name FROM names WHERE cui IN ({','.join('?' * len(cui_chunk))}) ORDER BY rowid",
+                cui_chunk
+            )
+            for cui, tty, name in rows:
+                names[cui].append((tty, name))
+        return dict(names)
+
+    def get_definitions(self, cuis: Iterable[str]) -> Dict[str, str]:
+        """
+        First definition of CUIs
+        :param cuis:
+        :return: cui -> definition; CUIs without definitions are absent
+        """
+        definitions = dict()
+        for cui_chunk in chunk_iter(sorted(set(cuis)), QUERY_BATCH_SIZE):
+            rows = self.conn.execute(
+                f"SELECT cui, definition FROM definitions WHERE cui IN ({','.join('?' * len(cui_chunk))}) ORDER BY rowid",
+                cui_chunk
+            )
+            for cui, definition in rows:
+                definitions.setdefault(cui, definition)
+        return definitions
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(DISTINCT cui) FROM names").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
@@ -1,25 +1,35 @@
-from collections import defaultdict
-from typing import List, Dict
+import os
+from typing import List, Dict, Optional
 
-from suppai.data import PaperAuthor
+from suppai.paper_metadata import (
+    PaperMetadataCache, PaperMetadataIndex, PaperMetadataProvider, S2PaperClient, INDEX_OFFSETS_SUFFIX
+)
+
+
+# written by DataGetterAPI.get_s2ids during S2 ingestion
+PAPER_METADATA_INDEX = 'data/paper_metadata'
+PAPER_METADATA_CACHE = 'data/paper_metadata.sqlite'
+# fetch papers missing from the cache from the S2 API (requires S2_API_KEY)
+USE_S2_API = True
+
+_provider: Optional[PaperMetadataProvider] = None
+
+
+def get_paper_metadata_provider() -> PaperMetadataProvider:
+    global _provider
+    if _provider is None:
+        api_key = os.getenv("S2_API_KEY")
+        client = S2PaperClient(api_key=api_key) if USE_S2_API and api_key else None
+        index = None
+        if os.path.exists(PAPER_METADATA_INDEX + INDEX_OFFSETS_SUFFIX):
+            index = PaperMetadataIndex(PAPER_METADATA_INDEX)
+        _provider = PaperMetadataProvider(PaperMetadataCache(PAPER_METADATA_CACHE), client, index)
+    return _provider
 
 
 def get_paper_metadata_no_sha(pids: List[str]) -> Dict[str, Dict]:
     """
-    Get metadata entries from papers table without SHA
+    Get metadata entries for S2 corpus ids from the ingestion index and local metadata cache
+    (and the S2 API for papers missing from both)
     """
-
-    raise NotImplementedError("This function is not implemented yet.")
-    # reimplement with API
-    # s2_id_to_metadata = dict()
-    # for pid, title, year, venue, doi, pmid, fos in db_entries:
-    #     s2_id_to_metadata[str(pid)] = {
-    #         "title": title,
-    #         "authors": [],
-    #         "year": year,
-    #         "venue": venue,
-    #         "doi": doi,
-    #         "pmid": pmid,
-    #         "fields_of_study": fos
-    #     }
-    # return s2_id_to_metadata
\ No newline at end of file
+    return get_paper_metadata_provider().get_metadata(pids)
@@ -0,0 +1,294 @@
+"""
+Streaming helpers for splitting, verifying, and re-joining large jsonl files, and for reading large JSON objects
+
+"""
+
+import os
+import json
+import math
+import hashlib
+from typing import List, Dict, Optional, NamedTuple, Iterator, Tuple, IO
+
+
+MANIFEST_SUFFIX = '.manifest.json'
+COPY_BUFFER_SIZE = 1 << 20
+JSON_READ_BLOCK_SIZE = 1 << 20
+
+
+class ByteRange(NamedTuple):
+    """
+    Slice [start, end) of a jsonl file, aligned to line boundaries
+    range_id orders ranges by (file, offset) so per-range outputs can be merged deterministically
+    """
+    range_id: int
+    file: str
+    start: int
+    end: int
+
+    @property
+    def num_bytes(self) -> int:
+        return self.end - self.start
+
+
+def manifest_file(chunk_file: str) -> str:
+    return chunk_file + MANIFEST_SUFFIX
+
+
+def _line_id(line: str) -> Optional[str]:
+    try:
+        return json.loads(line).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+
+def split_jsonl(
+        input_files: List[str],
+        output_prefix: str,
+        num_chunks: Optional[int] = None,
+        chunk_bytes: Optional[int] = None
+) -> List[str]:
+    """
+    Split jsonl files into byte-balanced chunk files in one streaming pass
+    Each chunk gets a sidecar manifest with line count, byte count, id range, and sha256
+    :param input_files:
+    :param output_prefix: chunk files are written to {output_prefix}.00, {output_prefix}.01, ...
+    :param num_chunks: number of chunks (computed from chunk_bytes if not given)
+    :param chunk_bytes: target chunk size in bytes
+    :return: chunk file names
+    """
+    total_bytes = sum(os.path.getsize(f) for f in input_files)
+    if total_bytes == 0:
+        return []
+    if not num_chunks:
+        assert chunk_bytes, "Specify num_chunks or chunk_bytes"
+        num_chunks = max(math.ceil(total_bytes / chunk_bytes), 1)
+    bytes_per_chunk = total_bytes / num_chunks
+
+    chunk_files = []
+    out_f = None
+    manifest = None
+    sha = None
+    last_line = None
+    bytes_read = 0
+
+    def _close_chunk():
+        out_f.close()
+        manifest["last_id"] = _line_id(last_line)
+        manifest["sha256"] = sha.hexdigest()
+        with open(manifest_file(chunk_files[-1]), 'w') as man_f:
+            json.dump(manifest, man_f, indent=4)
+
+    for input_file in input_files:
+        with open(input_file, 'rb') as in_f:
+            for line in in_f:
+                if not line.endswith(b'\n'):
+                    line += b'\n'
+                # start a new chunk at the first line past the current chunk's byte budget
+                if out_f is None or (bytes_read >= bytes_per_chunk * len(chunk_files) and len(chunk_files) < num_chunks):
+                    if out_f is not None:
+                        _close_chunk()
+                    chunk_files.append(f'{output_prefix}.{len(chunk_files):02d}')
+                    out_f = open(chunk_files[-1], 'wb')
+                    sha = hashlib.sha256()
+                    manifest = {
+                        "file": os.path.basename(chunk_files[-1]),
+                        "num_lines": 0,
+                        "num_bytes": 0,
+                        "first_id": _line_id(line.decode('utf-8')),
+                        "last_id": None,
+                        "sha256": None
+                    }
+                out_f.write(line)
+                sha.update(line)
+                manifest["num_lines"] += 1
+                manifest["num_bytes"] += len(line)
+                bytes_read += len(line)
+                last_line = line.decode('utf-8')
+
+    if out_f is not None:
+        _close_chunk()
+
+    return chunk_files
+
+
+def read_manifest(chunk_file: str) -> Dict:
+    with open(manifest_file(chunk_file), 'r') as f:
+        return json.load(f)
+
+
+def file_stats(file_name: str) -> Dict:
+    """
+    Stream a file and compute its line count, byte count, and sha256
+    :param file_name:
+    :return:
+    """
+    sha = hashlib.sha256()
+    num_lines = 0
+    num_bytes = 0
+    with open(file_name, 'rb') as f:
+        while True:
+            buffer = f.read(COPY_BUFFER_SIZE)
+            if not buffer:
+                break
+            sha.update(buffer)
+            num_lines += buffer.count(b'\n')
+            num_bytes += len(buffer)
+    return {
+        "num_lines": num_lines,
+        "num_bytes": num_bytes,
+        "sha256": sha.hexdigest()
+    }
+
+
+def verify_chunk(chunk_file: str) -> bool:
+    """
+    Check a chunk file against its manifest
+    :param chunk_file:
+    :return:
+    """
+    manifest = read_manifest(chunk_file)
+    stats = file_stats(chunk_file)
+    return all(stats[k] == manifest[k] for k in ("num_lines", "num_bytes", "sha256"))
+
+
+def join_chunks(chunk_files: List[str], output_file: str, verify: bool = True) -> int:
+    """
+    Concatenate chunk files into one file, checking each against its manifest while copying
+    :param chunk_files:
+    :param output_file:
+    :param verify:
+    :return: number of lines written
+    """
+    total_lines = 0
+    with open(output_file, 'wb') as out_f:
+        for chunk_file in chunk_files:
+            sha = hashlib.sha256()
+            num_lines = 0
+            with open(chunk_file, 'rb') as in_f:
+                while True:
+                    buffer = in_f.read(COPY_BUFFER_SIZE)
+                    if not buffer:
+                        break
+                    out_f.write(buffer)
+                    sha.update(buffer)
+                    num_lines += buffer.count(b'\n')
+            if verify:
+                manifest = read_manifest(chunk_file)
+                if num_lines != manifest["num_lines"] or sha.hexdigest() != manifest["sha256"]:
+                    raise ValueError(f"Chunk {chunk_file} does not match its manifest!")
+            total_lines += num_lines
+    return total_lines
+
+
+def count_lines(file_name: str) -> int:
+    return file_stats(file_name)["num_lines"]
+
+
+def plan_byte_ranges(input_files: List[str], range_bytes: int) -> List[ByteRange]:
+    """
+    Split files into line-aligned byte ranges of about range_bytes each (without reading the files)
+    :param input_files:
+    :param range_bytes:
+    :return: ranges in (file, offset) order
+    """
+    ranges = []
+    for input_file in input_files:
+        file_size = os.path.getsize(input_file)
+        with open(input_file, 'rb') as f:
+            start = 0
+            while start < file_size:
+                end = start + range_bytes
+                if end < file_size:
+                    # extend to the end of the line containing byte end - 1
+                    f.seek(end - 1)
+                    f.readline()
+                    end = f.tell()
+                end = min(end, file_size)
+                ranges.append(ByteRange(len(ranges), input_file, start, end))
+                start = end
+    return ranges
+
+
+def iter_byte_range(byte_range: ByteRange) -> Iterator[str]:
+    """
+    Lines of a byte range
+    :param byte_range:
+    :return:
+    """
+    with open(byte_range.file, 'rb') as f:
+        f.seek(byte_range.start)
+        position = byte_range.start
+        while position < byte_range.end:
+            line = f.readline()
+            if not line:
+                break
+            position += len(line)
+            yield line.decode('utf-8')
+
+
+def iter_json_items(f: IO[bytes]) -> Iterator[Tuple[str, object]]:
+    """
+    Iterate over the entries of a JSON object without loading the whole document
+    :param f: binary file object positioned at the object
+    :return: (key, value) pairs
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    eof = False
+
+    def _fill() -> bool:
+        nonlocal buffer, position, eof
+        block = f.read(JSON_READ_BLOCK_SIZE)
+        if not block:
+            eof = True
+            return False
+        # a multi-byte character may be split across blocks
+        while True:
+            try:
+                text = block.decode('utf-8')
+                break
+            except UnicodeDecodeError as e:
+                if e.start < len(block) - 3:
+                    raise
+                next_byte = f.read(1)
+                if not next_byte:
+                    raise
+                block += next_byte
+        buffer = buffer[position:] + text
+        position = 0
+        return True
+
+    def _skip(chars: str):
+        nonlocal position
+        while True:
+            while position < len(buffer) and buffer[position] in chars:
+                position += 1
+            if position < len(buffer) or not _fill():
+                return
+
+    def _decode():
+        nonlocal position
+        while True:
+            try:
+                value, end = decoder.raw_decode(buffer, position)
+                # a number at the end of the buffer may continue in the next block
+                if end == len(buffer) and not eof and _fill():
+                    continue
+                position = end
+                return value
+            except json.JSONDecodeError:
+                if eof or not _fill():
+                    raise
+
+    _skip(' \t\r\n')
+    if buffer[position:position + 1] != '{':
+        raise ValueError("Expected a JSON object")
+    position += 1
+    while True:
+        _skip(' \t\r\n,')
+        if buffer[position:position + 1] == '}':
+            return
+        key = _decode()
+        _skip(' \t\r\n:')
+        yield key, _decode()
@@ -0,0 +1,53 @@
+import unittest
+
+from suppai.bert_ddi import mark_entities, length_batches, form_label_entry
+
+
+class TestBertDdi(unittest.TestCase):
+
+    def test_mark_entities(self):
+        """
+        Assert markers are inserted around both spans regardless of order
+        :return:
+        """
+        entry = {
+            "sentence": "warfarin and vitamin K interact",
+            "arg1": {"span": [[13, 22]]},
+            "arg2": {"span": [[0, 8]]}
+        }
+        assert mark_entities(entry) == "[[ warfarin ]] and << vitamin K >> interact"
+
+    def test_mark_adjacent_entities(self):
+        """
+        Assert markers stay well-formed when one span ends where the other starts
+        :return:
+        """
+        entry = {
+            "sentence": "fish oilwarfarin",
+            "arg1": {"span": [[0, 8]]},
+            "arg2": {"span": [[8, 16]]}
+        }
+        assert mark_entities(entry) == "<< fish oil >>[[ warfarin ]]"
+        entry["arg1"]["span"], entry["arg2"]["span"] = entry["arg2"]["span"], entry["arg1"]["span"]
+        assert mark_entities(entry) == "[[ fish oil ]]<< warfarin >>"
+
+    def test_length_batches_cover_all(self):
+        """
+        Assert every item is batched exactly once and batches respect the token cap
+        :return:
+        """
+        lengths = [5, 60, 12, 7, 64, 30, 3, 45]
+        batches = list(length_batches(lengths, max_tokens=128, max_batch_size=3))
+        assert sorted(i for batch in batches for i in batch) == list(range(len(lengths)))
+        for batch in batches:
+            assert len(batch) <= 3
+            assert max(lengths[i] for i in batch) * len(batch) <= 128
+
+    def test_label_entry(self):
+        """
+        Assert label entries use the predicted class as label-model
+        :return:
+        """
+        entry = form_label_entry({"id": "123-0", "sentence": "s"}, [0.1, 2.0], [0.13, 0.87])
+        assert entry["label-model"] == 1
+        assert entry["id"] == "123-0"
@@ -0,0 +1,90 @@
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.cui_handler import CUIHandler
+from suppai.cluster_impact import (
+    RawCuiIndex, diff_clusters, find_new_candidates, candidate_key, ENTITY_RECORD, CANDIDATE_RECORD
+)
+from suppai.sentence_filter import filter_sentence
+
+
+def cluster(*members):
+    return {"preferred_name": members[0], "synonyms": [], "tradenames": [], "definition": "", "members": list(members)}
+
+
+OLD_CLUSTERS = {
+    "supplements": {"S1": cluster("S1"), "S2": cluster("S2", "S2b")},
+    "drugs": {"D1": cluster("D1")}
+}
+# S3 is a new supplement cluster, S2b moves to S1
+NEW_CLUSTERS = {
+    "supplements": {"S1": cluster("S1", "S2b"), "S2": cluster("S2"), "S3": cluster("S3")},
+    "drugs": {"D1": cluster("D1")}
+}
+
+
+def entity(string, start, cui):
+    return {"string": string, "start": start, "end": start + len(string), "linked_cuis": [[cui, ["T109"], 0.9, 0]]}
+
+
+SENTENCES = [
+    {"id": 1, "sentence_id": 0, "sentence": "s1 with d1", "entities": [entity("s1", 0, "S1"), entity("d1", 8, "D1")]},
+    {"id": 2, "sentence_id": 3, "sentence": "s3 with d1 and s1",
+     "entities": [entity("s3", 0, "S3"), entity("d1", 8, "D1"), entity("s1", 15, "S1")]},
+    {"id": 3, "sentence_id": 1, "sentence": "s2b alone", "entities": [entity("s2b", 0, "S2b")]}
+]
+
+
+class TestClusterImpact(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.handlers = []
+        for name, clusters in [('old', OLD_CLUSTERS), ('new', NEW_CLUSTERS)]:
+            cluster_file = os.path.join(self.temp_dir.name, f'{name}.json')
+            with open(cluster_file, 'w') as f:
+                json.dump(clusters, f)
+            self.handlers.append(CUIHandler(cluster_file))
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_new_candidates(self):
+        """
+        Assert only sentences with type-changed CUIs are re-filtered and existing candidates are not repeated
+        :return:
+        """
+        old_handler, new_handler = self.handlers
+        diff = diff_clusters(old_handler, new_handler)
+        assert diff.type_changed == {"S3"}
+        assert diff.cluster_changed == {"S2b"}
+        assert diff.added_clusters == {"S3"}
+
+        entity_file = os.path.join(self.temp_dir.name, 'entities.jsonl.000000')
+        candidate_file = os.path.join(self.temp_dir.name, 'supp_sentences_x.jsonl')
+        with open(entity_file, 'w') as ent_f, open(candidate_file, 'w') as cand_f:
+            counter = 0
+            for sent in SENTENCES:
+                ent_f.write(json.dumps(sent) + '\n')
+                for candidate in filter_sentence(sent, old_handler, counter):
+                    cand_f.write(json.dumps(candidate) + '\n')
+                    counter += 1
+
+        index = RawCuiIndex(os.path.join(self.temp_dir.name, 'index.sqlite'))
+        assert index.add_files([entity_file], ENTITY_RECORD) == 1
+        assert index.add_files([candidate_file], CANDIDATE_RECORD) == 1
+        assert index.add_files([entity_file], ENTITY_RECORD) == 0
+        assert [sent["id"] for sent in index.records(["D1"], ENTITY_RECORD)] == [1, 2]
+
+        new_candidates = find_new_candidates(index, diff, new_handler)
+        index.close()
+        pairs = sorted((c["arg1"]["id"], c["arg2"]["id"]) for c in new_candidates)
+        # S3-D1 and S3-S1 are new; S1-D1 of sentence 2 was already a candidate
+        assert pairs == [("S3", "D1"), ("S3", "S1")]
+        assert len(set(c["id"] for c in new_candidates)) == 2
+
+        refiltered = filter_sentence(SENTENCES[1], new_handler, 0)
+        assert len(refiltered) == 3
+        assert candidate_key(refiltered[1]) == candidate_key(dict(refiltered[1], id="2-99"))
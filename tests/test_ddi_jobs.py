@@ -0,0 +1,81 @@
+import os
+import json
+import asyncio
+import tempfile
+import unittest
+
+from suppai.ddi_jobs import FakeBackend, run_jobs
+from suppai.utils.file_utils import split_jsonl
+
+
+class TestDdiJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        input_file = os.path.join(self.temp_dir.name, 'sentences.jsonl')
+        with open(input_file, 'w') as f:
+            for i in range(40):
+                f.write(json.dumps({"id": f"{i}-0", "sentence": "s" * 20}) + '\n')
+        self.chunk_files = split_jsonl([input_file], os.path.join(self.temp_dir.name, 'chunk'), num_chunks=4)
+        self.output_root = os.path.join(self.temp_dir.name, 'ddi_output')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _run(self, backend, **kwargs):
+        return asyncio.run(run_jobs(
+            backend, self.chunk_files, self.output_root, poll_interval=0.01, max_poll_interval=0.02, **kwargs
+        ))
+
+    def test_all_chunks_fetched(self):
+        """
+        Assert every chunk is labeled and jobs run concurrently
+        :return:
+        """
+        backend = FakeBackend(label_fn=lambda entry: int(entry["id"].startswith('1')), run_time=0.05)
+        results = self._run(backend)
+
+        assert all(result.succeeded for result in results)
+        assert backend.max_running == len(self.chunk_files)
+
+        labels = dict()
+        for result in results:
+            with open(result.output_file, 'r') as f:
+                for line in f:
+                    entry = json.loads(line)
+                    labels[entry["id"]] = entry["label-model"]
+        assert len(labels) == 40
+        assert labels["1-0"] == 1 and labels["2-0"] == 0
+
+    def test_only_failed_chunks_retried(self):
+        """
+        Assert a failed chunk is resubmitted and the others are submitted once
+        :return:
+        """
+        backend = FakeBackend(label_fn=lambda entry: 0, fail_once=[self.chunk_files[2]])
+        results = self._run(backend)
+        assert all(result.succeeded for result in results)
+        assert results[2].attempts == 2
+        assert backend.submissions.count(self.chunk_files[2]) == 2
+        assert len(backend.submissions) == len(self.chunk_files) + 1
+
+    def test_gives_up_after_max_attempts(self):
+        """
+        Assert a chunk that keeps failing is reported as failed
+        :return:
+        """
+        backend = FakeBackend(label_fn=lambda entry: 0, fail_once=[self.chunk_files[0]])
+        results = self._run(backend, max_attempts=1)
+        assert not results[0].succeeded
+        assert all(result.succeeded for result in results[1:])
+
+    def test_unexpected_errors_retried(self):
+        """
+        Assert an unexpected backend error is retried for its chunk without aborting the other chunks
+        :return:
+        """
+        backend = FakeBackend(label_fn=lambda entry: 0, run_time=0.05, error_once=[self.chunk_files[1]])
+        results = self._run(backend)
+        assert all(result.succeeded for result in results)
+        assert results[1].attempts == 2
+        assert backend.submissions.count(self.chunk_files[1]) == 2
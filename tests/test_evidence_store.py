@@ -0,0 +1,79 @@
+import io
+import json
+import unittest
+
+from suppai.data import EvidenceSentence, LabeledSpan
+from suppai.evidence_store import EvidenceStore, EvidenceList, JsonSentenceDict, select_top_evidence
+from suppai.packaging import json_member
+
+
+def make_evidence(uid, paper_id, sentence, confidence=None):
+    return EvidenceSentence(
+        uid=uid,
+        paper_id=paper_id,
+        sentence_id=uid + 1,
+        sentence=sentence,
+        confidence=confidence,
+        arg1=LabeledSpan(id="C0042878", span=[0, 7]),
+        arg2=LabeledSpan(id="C0043031", span=[12, 20])
+    )
+
+
+class TestEvidenceStore(unittest.TestCase):
+
+    def setUp(self):
+        self.evidence = [
+            make_evidence(0, "11", "Vitamin K and warfarin"),
+            make_evidence(1, "12", "Vitamin K — warfarin (ß)", confidence=0.75),
+            make_evidence(2, "11", "")
+        ]
+        self.store = EvidenceStore()
+        for evidence in self.evidence:
+            self.store.append(evidence)
+
+    def test_rows_roundtrip(self):
+        """
+        Assert rows read back as the sentences appended, with strings interned
+        :return:
+        """
+        assert len(self.store) == 3
+        assert list(self.store) == self.evidence
+        assert [self.store.as_json(row) for row in range(3)] == [e.as_json() for e in self.evidence]
+        assert len(self.store.paper_ids) == 2
+        assert len(self.store.cuis) == 2
+
+    def test_evidence_list(self):
+        """
+        Assert row lists iterate, filter, and serialize like lists of EvidenceSentence
+        :return:
+        """
+        rows = EvidenceList(self.store, [0, 1])
+        rows.append(2)
+        assert list(rows) == self.evidence
+        assert list(rows.paper_ids()) == ["11", "12", "11"]
+        kept = rows.filter(lambda store, row: store.paper_id(row) != "12")
+        assert [e.uid for e in kept] == [0, 2]
+
+        sentence_dict = JsonSentenceDict({"C0042878-C0043031": rows})
+        out_f = io.BytesIO()
+        json_member(sentence_dict, indent=4, sort_keys=True)(out_f)
+        expected = {"C0042878-C0043031": [e.as_json() for e in self.evidence]}
+        assert out_f.getvalue().decode('utf-8') == json.dumps(expected, indent=4, sort_keys=True)
+
+    def test_select_top_evidence(self):
+        """
+        Assert the most confident sentences are kept, ranked, with counts before the cut
+        :return:
+        """
+        store = EvidenceStore()
+        for uid, confidence in enumerate([0.5, None, 0.9, 0.5, 0.7]):
+            store.append(make_evidence(uid, "11", "s", confidence=confidence))
+        sentence_dict = {"C0042878-C0043031": EvidenceList(store, range(5)), "C1-C2": EvidenceList(store, [1])}
+
+        top, counts = select_top_evidence(sentence_dict, 3)
+        assert [e.uid for e in top["C0042878-C0043031"]] == [2, 4, 0]
+        assert [e.uid for e in top["C1-C2"]] == [1]
+        assert counts == {"C0042878-C0043031": 5, "C1-C2": 1}
+
+        top, _ = select_top_evidence(sentence_dict, 0)
+        assert [e.uid for e in top["C0042878-C0043031"]] == [2, 4, 0, 3, 1]
@@ -0,0 +1,52 @@
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.cui_handler import CUIHandler
+from suppai.exact_match import ExactMatchDictionary, normalize_mention
+
+
+CLUSTERS = {
+    "supplements": {
+        "C001": {"preferred_name": "Vitamin K", "synonyms": ["phylloquinone", "Iron"], "definition": "",
+                 "members": ["C001", "C011"]},
+        "C002": {"preferred_name": "Iron", "synonyms": ["Ferrum"], "definition": "", "members": ["C002"]}
+    },
+    "drugs": {
+        "C003": {"preferred_name": "Warfarin", "synonyms": [], "tradenames": ["Coumadin"], "definition": "",
+                 "members": ["C003", "C033"]}
+    }
+}
+
+
+class TestExactMatch(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        cluster_file = os.path.join(self.temp_dir.name, 'cui_clusters.json')
+        with open(cluster_file, 'w') as f:
+            json.dump(CLUSTERS, f)
+        self.handler = CUIHandler(cluster_file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_lookup(self):
+        """
+        Assert names resolve to cluster CUIs after normalization, and names of several clusters are left out
+        :return:
+        """
+        matcher = ExactMatchDictionary.from_handler(self.handler, preferred_names={"C033": "Warfarin sodium"})
+        assert normalize_mention("  Vitamin \n K ") == "vitamin k"
+        assert matcher.lookup("VITAMIN  K") == "C001"
+        assert matcher.lookup("coumadin") == "C003"
+        assert matcher.lookup("Warfarin Sodium") == "C003"
+        assert matcher.lookup("iron") is None
+        assert matcher.lookup("ferrum") == "C002"
+        assert matcher.lookup("aspirin") is None
+        assert matcher.cluster_of["C011"] == "C001"
+
+        restricted = matcher.restrict(lambda cui: cui != "C003")
+        assert restricted.lookup("coumadin") is None
+        assert restricted.lookup("phylloquinone") == "C001"
@@ -0,0 +1,92 @@
+import io
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.utils import file_utils
+from suppai.utils.file_utils import (
+    split_jsonl, verify_chunk, join_chunks, read_manifest, plan_byte_ranges, iter_byte_range, iter_json_items
+)
+
+
+class TestFileUtils(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.input_files = []
+        for file_num in range(2):
+            input_file = os.path.join(self.temp_dir.name, f'sentences_{file_num}.jsonl')
+            with open(input_file, 'w') as f:
+                for i in range(50):
+                    f.write(json.dumps({"id": f"{file_num}-{i}", "sentence": "x" * (i % 7) * 10}) + '\n')
+            self.input_files.append(input_file)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_split_and_join(self):
+        """
+        Assert chunks are balanced, match their manifests, and re-join to the original lines
+        :return:
+        """
+        prefix = os.path.join(self.temp_dir.name, 'chunk')
+        chunk_files = split_jsonl(self.input_files, prefix, num_chunks=4)
+        assert len(chunk_files) == 4
+
+        manifests = [read_manifest(chunk_file) for chunk_file in chunk_files]
+        assert sum(m["num_lines"] for m in manifests) == 100
+        assert manifests[0]["first_id"] == "0-0"
+        assert manifests[-1]["last_id"] == "1-49"
+        sizes = [m["num_bytes"] for m in manifests]
+        assert max(sizes) < 2 * min(sizes)
+        assert all(verify_chunk(chunk_file) for chunk_file in chunk_files)
+
+        joined_file = os.path.join(self.temp_dir.name, 'joined.jsonl')
+        assert join_chunks(chunk_files, joined_file) == 100
+        original = b''.join(open(f, 'rb').read() for f in self.input_files)
+        with open(joined_file, 'rb') as f:
+            assert f.read() == original
+
+    def test_join_detects_corruption(self):
+        """
+        Assert a modified chunk fails verification
+        :return:
+        """
+        prefix = os.path.join(self.temp_dir.name, 'chunk')
+        chunk_files = split_jsonl(self.input_files, prefix, num_chunks=2)
+        with open(chunk_files[1], 'a') as f:
+            f.write('{"id": "extra"}\n')
+        assert not verify_chunk(chunk_files[1])
+        with self.assertRaises(ValueError):
+            join_chunks(chunk_files, os.path.join(self.temp_dir.name, 'joined.jsonl'))
+
+    def test_byte_ranges(self):
+        """
+        Assert byte ranges are line-aligned and together cover every line exactly once, in order
+        :return:
+        """
+        for range_bytes in [1, 100, 1000, 1 << 20]:
+            byte_ranges = plan_byte_ranges(self.input_files, range_bytes)
+            assert [r.range_id for r in byte_ranges] == list(range(len(byte_ranges)))
+            lines = [line for byte_range in byte_ranges for line in iter_byte_range(byte_range)]
+            original = [line for f in self.input_files for line in open(f, 'r')]
+            assert lines == original
+            if range_bytes == 1000:
+                assert len(byte_ranges) > 2 * len(self.input_files)
+
+    def test_iter_json_items(self):
+        """
+        Assert streamed entries match json.load across block boundaries and multi-byte characters
+        :return:
+        """
+        data = {"a": [1, 2.5, {"x": "é€😀"}], "b\"c": -12345678901234, "n": None, "e": {}, "num": 1e10}
+        block_size = file_utils.JSON_READ_BLOCK_SIZE
+        file_utils.JSON_READ_BLOCK_SIZE = 7
+        try:
+            for indent in [None, 4]:
+                encoded = json.dumps(data, indent=indent, ensure_ascii=False).encode('utf-8')
+                assert dict(iter_json_items(io.BytesIO(encoded))) == data
+            assert list(iter_json_items(io.BytesIO(b' {} '))) == []
+        finally:
+            file_utils.JSON_READ_BLOCK_SIZE = block_size
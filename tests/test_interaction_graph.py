@@ -0,0 +1,73 @@
+import os
+import tempfile
+import unittest
+
+from suppai.interaction_graph import interaction_aggregates, write_interaction_graph, InteractionGraph
+
+
+def make_paper(clinical_study=False, human_study=False, animal_study=False, retraction=False):
+    return {"title": "t", "clinical_study": clinical_study, "human_study": human_study,
+            "animal_study": animal_study, "retraction": retraction}
+
+
+class TestInteractionGraph(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.graph_file = os.path.join(self.temp_dir.name, 'release.graph.bin')
+        paper_dict = {
+            "1": make_paper(clinical_study=True, human_study=True),
+            "2": make_paper(animal_study=True),
+            "3": make_paper(human_study=True, retraction=True)
+        }
+        sentence_counts = {"C0042878-C0043031": 5, "C0016157-C0043031": 2, "C0016157-C0042878": 7}
+        interaction_papers = {
+            "C0042878-C0043031": ["1", "2", "2", "9"],
+            "C0016157-C0043031": ["3"],
+            "C0016157-C0042878": ["1"]
+        }
+        aggregates = interaction_aggregates(sentence_counts, sentence_counts, interaction_papers, paper_dict)
+        write_interaction_graph(self.graph_file, aggregates, {"last_updated_on": "now"})
+        self.graph = InteractionGraph(self.graph_file)
+
+    def tearDown(self):
+        self.graph.close()
+        self.temp_dir.cleanup()
+
+    def test_aggregates(self):
+        """
+        Assert per-interaction counts deduplicate papers and skip papers without metadata
+        :return:
+        """
+        edge = self.graph.interaction("C0043031", "C0042878")
+        assert edge == {"interaction_id": "C0042878-C0043031", "cui": "C0042878", "sentence_count": 5,
+                        "paper_count": 2, "clinical_study": 1, "human_study": 1, "animal_study": 1, "retraction": 0}
+        assert self.graph.interaction("C0016157", "C0043031")["retraction"] == 1
+        assert self.graph.interaction("C0016157", "C9999999") is None
+        assert self.graph.num_nodes == 3
+        assert self.graph.num_edges == 3
+        assert self.graph.meta == {"last_updated_on": "now"}
+
+    def test_rows(self):
+        """
+        Assert rows are array slices ordered by sentence count, with original interaction ids
+        :return:
+        """
+        assert self.graph.neighbor_cuis("C0042878") == ["C0016157", "C0043031"]
+        top = self.graph.top_interactions("C0042878", limit=1)
+        assert [e["interaction_id"] for e in top] == ["C0016157-C0042878"]
+        start, end = self.graph.row("C0043031")
+        assert list(self.graph.edge_array("sentence_count")[start:end]) == [5, 2]
+        assert self.graph.degree("C9999999") == 0
+        assert self.graph.top_interactions("C9999999") == []
+
+    def test_empty_graph(self):
+        """
+        Assert a graph without interactions can be written and read
+        :return:
+        """
+        empty_file = os.path.join(self.temp_dir.name, 'empty.graph.bin')
+        write_interaction_graph(empty_file, dict())
+        with InteractionGraph(empty_file) as graph:
+            assert graph.num_nodes == 0
+            assert graph.node("C0042878") is None
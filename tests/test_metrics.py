@@ -0,0 +1,81 @@
+import os
+import json
+import tempfile
+import unittest
+import unittest.mock
+
+from suppai import metrics
+
+
+class TestMetrics(unittest.TestCase):
+
+    def setUp(self):
+        metrics.collect(reset=True)
+        self.was_enabled = metrics.ENABLED
+
+    def tearDown(self):
+        metrics.collect(reset=True)
+        metrics.ENABLED = self.was_enabled
+
+    def test_disabled(self):
+        """
+        Assert nothing is recorded or exported while metrics are disabled
+        :return:
+        """
+        metrics.ENABLED = False
+        metrics.incr("ner.docs")
+        with metrics.timer("ner.document"):
+            pass
+        assert metrics.collect() == {"counters": {}, "timers": {}}
+        with tempfile.TemporaryDirectory() as temp_dir:
+            assert metrics.export('preprocess', temp_dir) is None
+            assert os.listdir(temp_dir) == []
+
+    def test_merge_and_ratios(self):
+        """
+        Assert worker snapshots merge into the parent and derived ratios are computed
+        :return:
+        """
+        metrics.ENABLED = True
+        worker_snapshots = []
+        for docs in [3, 5]:
+            metrics.incr("ner.docs", docs)
+            metrics.incr("ner.entities", 2 * docs)
+            with metrics.timer("ner.document"):
+                pass
+            worker_snapshots.append(metrics.collect())
+        assert metrics.collect() == {"counters": {}, "timers": {}}
+
+        metrics.merge(worker_snapshots + [None])
+        summary = metrics.summary()
+        assert summary["counters"] == {"ner.docs": 8, "ner.entities": 16}
+        assert summary["timers"]["ner.document"]["count"] == 2
+        assert summary["ratios"]["ner.entities_per_doc"] == 2
+        assert "postprocess.positive_rate" not in summary["ratios"]
+
+    def test_export(self):
+        """
+        Assert metrics are written as JSON and as a Prometheus textfile
+        :return:
+        """
+        metrics.ENABLED = True
+        metrics.incr("filter.sentences", 4)
+        metrics.incr("filter.skipped.single_entity", 1)
+        with metrics.timer("filter.sentence"):
+            pass
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with unittest.mock.patch.dict(os.environ, {metrics.ENV_PROMETHEUS_DIR: temp_dir}):
+                metrics_file = metrics.export('preprocess', os.path.join(temp_dir, 'run'), extra={"header_str": "x"})
+
+            with open(metrics_file, 'r') as f:
+                exported = json.load(f)
+            assert exported["stage"] == "preprocess"
+            assert exported["header_str"] == "x"
+            assert exported["counters"]["filter.sentences"] == 4
+            assert "filter.sentences_per_second" in exported["ratios"]
+
+            with open(os.path.join(temp_dir, 'suppai_preprocess.prom'), 'r') as f:
+                lines = f.read().splitlines()
+            assert 'suppai_filter_skipped_single_entity_total{stage="preprocess"} 1' in lines
+            assert 'suppai_filter_sentence_seconds_count{stage="preprocess"} 1' in lines
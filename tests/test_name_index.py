@@ -0,0 +1,81 @@
+import os
+import tempfile
+import unittest
+
+from suppai.name_index import normalize_name, build_name_index, write_name_index, NameIndex
+
+
+def make_cui(ent_type, preferred_name, synonyms=(), tradenames=()):
+    return {"ent_type": ent_type, "preferred_name": preferred_name, "synonyms": list(synonyms),
+            "tradenames": list(tradenames), "definition": ""}
+
+
+class TestNameIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.cui_dict = {
+            "C0042878": make_cui("supplement", "Vitamin K", synonyms=["phytonadione", "Vitamin-K"]),
+            "C0043031": make_cui("drug", "Warfarin", synonyms=["warfarin sodium"], tradenames=["Coumadin"]),
+            "C0042890": make_cui("supplement", "Vitamin D", synonyms=["calciferol"]),
+            "C0016157": make_cui("supplement", "Fish Oils", synonyms=["omega-3 fish oil"]),
+            "C0006675": make_cui("supplement", "Calcium", synonyms=["Calcïum"])
+        }
+        self.weights = {"C0042890": 10, "C0042878": 3}
+        self.index = NameIndex(build_name_index(self.cui_dict, self.weights))
+
+    def test_normalize_name(self):
+        """
+        Assert names are compared without case, accents, and punctuation
+        :return:
+        """
+        assert normalize_name("  Omega-3  Fish_Oil ") == "omega 3 fish oil"
+        assert normalize_name("Calcïum") == "calcium"
+
+    def test_prefix_search(self):
+        """
+        Assert prefix matches are ranked by match kind, name type, and weight, one per CUI
+        :return:
+        """
+        assert [r[0] for r in self.index.search("vitamin")] == ["C0042890", "C0042878"]
+        assert self.index.search("vitamin k", limit=1) == [("C0042878", "Vitamin K", "preferred_name")]
+        assert self.index.search("coum")[0] == ("C0043031", "Coumadin", "tradename")
+        # inner-word prefix
+        assert self.index.search("oil", fuzzy=False) == [("C0016157", "Fish Oils", "preferred_name")]
+        assert self.index.search("CALCÏUM", fuzzy=False) == [("C0006675", "Calcium", "preferred_name")]
+        assert self.index.search("   ") == []
+
+    def test_dense_prefixes(self):
+        """
+        Assert precomputed dense prefix results match the full computation
+        :return:
+        """
+        index = NameIndex(build_name_index(self.cui_dict, self.weights, dense_prefix_keys=1))
+        assert {"v", "vi", "vitamin", "c", "ca"} <= set(index.dense_prefixes)
+        assert "co" not in index.dense_prefixes
+        for prefix in ["v", "vi", "vitamin", "c", "ca", "co", "wa"]:
+            expected = index._prefix_matches(prefix, 5, precomputed=False)
+            assert [n for n, _ in index._prefix_matches(prefix, 5)] == [n for n, _ in expected]
+            assert [n for n, _ in self.index._prefix_matches(prefix, 5)] == [n for n, _ in expected]
+
+    def test_fuzzy_search(self):
+        """
+        Assert misspelled queries are matched by trigrams
+        :return:
+        """
+        assert self.index.search("warfrin")[0][0] == "C0043031"
+        assert self.index.search("phytonadoine")[0][0] == "C0042878"
+        assert self.index.search("warfrin", fuzzy=False) == []
+
+    def test_file_round_trip(self):
+        """
+        Assert a written index loads with the same results
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            index_file = os.path.join(temp_dir, 'names.json.gz')
+            write_name_index(index_file, self.cui_dict, self.weights, {"last_updated_on": "now"})
+            loaded = NameIndex.load(index_file)
+        assert loaded.meta == {"last_updated_on": "now"}
+        assert len(loaded) == len(self.index)
+        for query in ["vit", "fish", "calciferl"]:
+            assert loaded.search(query) == self.index.search(query)
@@ -0,0 +1,178 @@
+import unittest
+
+from suppai.exact_match import ExactMatchDictionary
+from suppai.sentence_filter import filter_sentences
+
+try:
+    import spacy
+    from spacy.language import Language
+    from spacy.tokens import Doc, Span
+    from scispacy.candidate_generation import MentionCandidate
+    from scispacy.linking import EntityLinker
+    from scispacy.linking_utils import Entity
+    from suppai.ner_and_linker import DrugSupplementLinker, link_mentions
+except ImportError:
+    spacy = None
+
+
+# cui -> (name, types, definition)
+KB_ENTITIES = {
+    "S1": ("fish oil", ["T109"], "oil from fish"),
+    "S2": ("ginkgo", ["T002"], None),
+    "D1": ("warfarin", ["T121"], "anticoagulant"),
+    "X1": ("oil", ["T073"], "manufactured object")
+}
+
+# mention text -> ANN candidates (cui, similarity)
+CANDIDATES = {
+    "fish oil": [("S1", 0.99), ("X1", 0.8)],
+    "ginkgo": [("S2", 0.9)],
+    "gb": [("S2", 0.75)],
+    "ginkgo biloba": [("S2", 0.97)],
+    "warfarin": [("D1", 1.0)],
+    "oil": [("X1", 0.98), ("S1", 0.9)]
+}
+
+
+class StubKB:
+    def __init__(self):
+        self.cui_to_entity = {
+            cui: Entity(cui, name, [name], types, definition) for cui, (name, types, definition) in KB_ENTITIES.items()
+        }
+
+
+class StubCandidateGenerator:
+    """
+    Candidate generator with fixed candidates per mention text, counting the mention texts it was asked about
+    """
+    def __init__(self):
+        self.kb = StubKB()
+        self.queries = []
+
+    def __call__(self, mention_texts, k):
+        self.queries += mention_texts
+        return [
+            [MentionCandidate(cui, [KB_ENTITIES[cui][0]], [score]) for cui, score in CANDIDATES.get(text.lower(), [])][:k]
+            for text in mention_texts
+        ]
+
+
+class StubHandler:
+    """
+    CUIHandler stand-in: S* CUIs are supplements, D* CUIs are drugs
+    """
+    def is_supp_drug(self, cui1, cui2):
+        return {cui1[0], cui2[0]} == {"S", "D"}
+
+    def is_supp_supp(self, cui1, cui2):
+        return cui1[0] == cui2[0] == "S"
+
+
+def make_linker():
+    return EntityLinker(candidate_generator=StubCandidateGenerator(), resolve_abbreviations=True, k=5, threshold=0.7)
+
+
+if spacy is not None:
+    @Language.factory("stub_scispacy_linker")
+    def stub_scispacy_linker(nlp, name):
+        return make_linker()
+
+
+TEXTS = [
+    "Ginkgo biloba (GB) and warfarin. GB alone. Fish oil with oil",
+    "Warfarin and fish oil. Warfarin",
+    "Nothing here"
+]
+
+
+@unittest.skipIf(spacy is None, "spacy and scispacy are not installed")
+class TestNerAndLinker(unittest.TestCase):
+
+    def setUp(self):
+        Doc.set_extension("abbreviations", default=[], force=True)
+        Span.set_extension("long_form", default=None, force=True)
+
+        self.nlp = spacy.blank("en")
+        self.nlp.add_pipe("sentencizer")
+        ruler = self.nlp.add_pipe("entity_ruler")
+        ruler.add_patterns([
+            {"label": "ENTITY", "pattern": [{"LOWER": word} for word in name.split()]}
+            for name in ["ginkgo biloba", "gb", "warfarin", "fish oil", "oil"]
+        ])
+
+    def make_docs(self):
+        docs = list(self.nlp.pipe(TEXTS))
+        # abbreviation detection result: the GB defined in the first sentence is short for ginkgo biloba
+        docs[0].ents[1]._.long_form = docs[0].ents[0]
+        return docs
+
+    def test_link_mentions_matches_pipe(self):
+        """
+        Assert batched linking of mentions from several documents gives the scispacy linker pipe's results,
+        including abbreviation long forms and the filter for entities without definitions
+        :return:
+        """
+        linker = make_linker()
+        single_docs = [linker(doc) for doc in self.make_docs()]
+        expected = [[(ent.text, ent._.kb_ents) for ent in doc.ents] for doc in single_docs]
+
+        batch_linker = make_linker()
+        docs = self.make_docs()
+        link_mentions(batch_linker, [ent for doc in docs for ent in doc.ents])
+        assert [[(ent.text, ent._.kb_ents) for ent in doc.ents] for doc in docs] == expected
+
+        # the long form is looked up for the abbreviation; ginkgo has no definition, so a GB without its long form
+        # scores below the no-definition threshold
+        assert batch_linker.candidate_generator.queries.count("Ginkgo biloba") == 2
+        assert expected[0][1] == ("GB", [("S2", 0.97)])
+        assert expected[0][3] == ("GB", [])
+
+    def test_link_mentions_exact_match(self):
+        """
+        Assert exact matches skip candidate generation and other mentions are linked as by the pipe
+        :return:
+        """
+        linker = make_linker()
+        expected = [[ent._.kb_ents for ent in linker(doc).ents] for doc in self.make_docs()]
+
+        exact_matcher = ExactMatchDictionary({"warfarin": "D1"}, {"D1": "D1"})
+        batch_linker = make_linker()
+        docs = self.make_docs()
+        link_mentions(batch_linker, [ent for doc in docs for ent in doc.ents], exact_matcher)
+        assert "Warfarin" not in batch_linker.candidate_generator.queries
+        assert "warfarin" not in batch_linker.candidate_generator.queries
+        for doc, doc_expected in zip(docs, expected):
+            for ent, kb_ents in zip(doc.ents, doc_expected):
+                assert ent._.kb_ents == ([("D1", 1.0)] if ent.text.lower() == "warfarin" else kb_ents)
+        assert exact_matcher.num_resolved == 3
+
+    def test_two_phase_candidates(self):
+        """
+        Assert two-phase batch linking links only sentences with two distinct mentions and yields the same
+        candidates as linking each document with the full pipeline
+        :return:
+        """
+        ds_linker = DrugSupplementLinker.__new__(DrugSupplementLinker)
+        ds_linker.nlp = self.nlp
+        ds_linker.nlp.add_pipe("stub_scispacy_linker", name="scispacy_linker")
+        ds_linker.exact_matcher = None
+
+        single = [ds_linker.get_linked_entities(text, top_k=3) for text in TEXTS]
+        batch = ds_linker.get_linked_entities_batch(TEXTS, top_k=3)
+
+        # "Warfarin" alone is only linked in a single pass; oil is a manufactured object (dropped, score > 0.95)
+        assert [[s["sent_num"] for s in doc] for doc in single] == [[0, 2], [0, 1], []]
+        assert [[s["sent_num"] for s in doc] for doc in batch] == [[0, 2], [0], []]
+        assert [e["string"] for e in batch[0][1]["entities"]] == ["Fish oil"]
+        for doc_single, doc_batch in zip(single, batch):
+            assert [s for s in doc_single if s["sent_num"] in {b["sent_num"] for b in doc_batch}] == doc_batch
+
+        handler = StubHandler()
+        sentences = lambda docs: [
+            {"id": doc_id, "sentence_id": s["sent_num"], "sentence": s["sentence"], "entities": s["entities"]}
+            for doc_id, doc in enumerate(docs) for s in doc
+        ]
+        candidates = list(filter_sentences(sentences(batch), handler))
+        assert candidates == list(filter_sentences(sentences(single), handler))
+        assert [(c["arg1"]["id"], c["arg2"]["id"]) for c in candidates] == [("S2", "D1"), ("D1", "S1")]
+
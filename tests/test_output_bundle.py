@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+
+from suppai.output_bundle import write_sharded_bundle, ShardedBundle
+
+
+class TestOutputBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.datasets = {
+            "cuis": {
+                "C0042878": {"preferred_name": "Vitamin K", "ent_type": "supplement"},
+                "C0043031": {"preferred_name": "Warfarin", "ent_type": "drug"},
+                "C0016157": {"preferred_name": "Fish Oils", "ent_type": "supplement"}
+            },
+            "interactions": {
+                "C0042878": ["C0042878-C0043031"],
+                "C0043031": ["C0042878-C0043031"],
+                "C0016157": []
+            },
+            "sentences": {
+                "C0042878-C0043031": [{"uid": 0, "paper_id": "1234", "sentence": "warfarin and vitamin K"}]
+            },
+            "papers": {
+                "1234": {"title": "A paper", "pmid": 1},
+                "7": {"title": "Another paper", "pmid": 2}
+            }
+        }
+        write_sharded_bundle(self.temp_dir.name, self.datasets, meta={"last_updated_on": "now"})
+        self.bundle = ShardedBundle(self.temp_dir.name, max_cached_shards=2)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_point_lookups(self):
+        """
+        Assert single keys are read back from their shards
+        :return:
+        """
+        assert self.bundle.get_cui("C0043031")["preferred_name"] == "Warfarin"
+        assert self.bundle.get_interactions("C0016157") == []
+        assert self.bundle.get_interactions("C9999999") == []
+        assert self.bundle.get_paper("7")["pmid"] == 2
+        evidence = self.bundle.get_cui_evidence("C0043031")
+        assert evidence["C0042878-C0043031"][0]["paper_id"] == "1234"
+        assert len(self.bundle._shard_cache) <= 2
+
+    def test_items_round_trip(self):
+        """
+        Assert iterating all shards reproduces the input dicts
+        :return:
+        """
+        for name, data in self.datasets.items():
+            assert dict(self.bundle.items(name)) == data
+            assert self.bundle.index["datasets"][name]["count"] == len(data)
+        assert self.bundle.meta == {"last_updated_on": "now"}
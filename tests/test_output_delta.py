@@ -0,0 +1,171 @@
+import os
+import hashlib
+import tarfile
+import tempfile
+import unittest
+from collections import Counter
+from collections.abc import Mapping
+
+from suppai.output_bundle import write_sharded_bundle
+from suppai.output_delta import (
+    compute_delta, compute_release_delta, apply_delta, write_delta, read_delta, write_legacy_release, load_release,
+    delta_summary, write_sharded_release, apply_release_delta
+)
+from suppai.packaging import release_mtime
+
+
+class CountingView(Mapping):
+    """
+    Mapping view counting reads of its entries (as JsonSentenceDict builds entries on access)
+    """
+    def __init__(self, data):
+        self.data = data
+        self.reads = Counter()
+
+    def __getitem__(self, key):
+        value = self.data[key]
+        self.reads[key] += 1
+        return value
+
+    def __iter__(self):
+        return iter(self.data)
+
+    def __len__(self):
+        return len(self.data)
+
+
+def file_sha256(file_name):
+    with open(file_name, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+
+class TestOutputDelta(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.old = {
+            "interactions": {"C1": ["C1-C2"], "C2": ["C1-C2"], "C3": []},
+            "sentences": {"C1-C2": [{"uid": 0, "paper_id": "10"}]},
+            "papers": {"10": {"title": "a"}, "11": {"title": "b"}},
+            "cuis": {"C1": {"preferred_name": "one"}, "C2": {"preferred_name": "two"}, "C3": {"preferred_name": "3"}}
+        }
+        self.new = {
+            "interactions": {"C1": ["C1-C2", "C1-C4"], "C2": ["C1-C2"], "C4": ["C1-C4"]},
+            "sentences": {"C1-C2": [{"uid": 0, "paper_id": "10"}], "C1-C4": [{"uid": 1, "paper_id": "12"}]},
+            "papers": {"10": {"title": "a"}, "12": {"title": "c"}},
+            "cuis": {"C1": {"preferred_name": "One"}, "C2": {"preferred_name": "two"}, "C4": {"preferred_name": "4"}}
+        }
+        self.old_meta = {"last_updated_on": "1"}
+        self.new_meta = {"last_updated_on": "2"}
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_delta_contains_only_changes(self):
+        """
+        Assert unchanged entries are not in the delta
+        :return:
+        """
+        delta = compute_delta(self.old, self.new, self.old_meta, self.new_meta)
+        assert set(delta["datasets"]["interactions"]["upsert"]) == {"C1", "C4"}
+        assert delta["datasets"]["interactions"]["delete"] == ["C3"]
+        assert set(delta["datasets"]["sentences"]["upsert"]) == {"C1-C4"}
+        assert delta_summary(delta)["papers"] == {"upsert": 1, "delete": 1}
+
+    def test_apply_reproduces_release(self):
+        """
+        Assert applying a delta read from disk to the old release gives the new release
+        :return:
+        """
+        delta_file = os.path.join(self.temp_dir.name, 'delta.json.gz')
+        write_delta(delta_file, compute_delta(self.old, self.new, self.old_meta, self.new_meta))
+        datasets, meta = apply_delta(self.old, self.old_meta, read_delta(delta_file))
+        assert datasets == self.new
+        assert meta == self.new_meta
+        with self.assertRaises(ValueError):
+            apply_delta(self.new, self.new_meta, read_delta(delta_file))
+
+    def test_legacy_release_round_trip(self):
+        """
+        Assert a legacy release tarball loads back to the same dicts
+        :return:
+        """
+        release_file = os.path.join(self.temp_dir.name, 'release.tar.gz')
+        write_legacy_release(release_file, self.new, self.new_meta, work_dir=self.temp_dir.name)
+        datasets, meta = load_release(release_file)
+        assert datasets == self.new
+        assert meta == self.new_meta
+
+    def test_new_dataset(self):
+        """
+        Assert a dataset missing from the old release (e.g. sentence counts) is added by the delta
+        :return:
+        """
+        new = dict(self.new, sentence_counts={"C1-C2": 3, "C1-C4": 1})
+        delta = compute_delta(self.old, new, self.old_meta, self.new_meta)
+        datasets, _ = apply_delta(self.old, self.old_meta, delta)
+        assert datasets == new
+
+        release_file = os.path.join(self.temp_dir.name, 'release.tar.gz')
+        write_legacy_release(release_file, self.old, self.old_meta, work_dir=None)
+        datasets, _ = load_release(release_file)
+        assert "sentence_counts" not in datasets
+
+    def test_release_delta(self):
+        """
+        Assert the delta streamed from a release file (legacy or sharded) matches the in-memory delta
+        :return:
+        """
+        new = dict(self.new, sentence_counts={"C1-C2": 3, "C1-C4": 1})
+        expected = compute_delta(self.old, new, self.old_meta, self.new_meta)
+
+        legacy_file = os.path.join(self.temp_dir.name, 'legacy.tar.gz')
+        write_legacy_release(legacy_file, self.old, self.old_meta, work_dir=None)
+
+        bundle_dir = os.path.join(self.temp_dir.name, 'bundle/')
+        write_sharded_bundle(bundle_dir, self.old, self.old_meta)
+        sharded_file = os.path.join(self.temp_dir.name, 'sharded.tar.gz')
+        with tarfile.open(sharded_file, 'w:gz') as tar:
+            tar.add(bundle_dir, arcname='release')
+
+        for release_file in [legacy_file, sharded_file]:
+            assert compute_release_delta(release_file, new, self.new_meta) == expected
+
+            # each new entry is read once
+            sentences = CountingView(new["sentences"])
+            delta = compute_release_delta(release_file, dict(new, sentences=sentences), self.new_meta)
+            assert delta == expected
+            assert sentences.reads == Counter(list(new["sentences"]))
+
+    def test_apply_reproduces_archive(self):
+        """
+        Assert applying a release delta rebuilds the new release tarball byte for byte, in its format
+        :return:
+        """
+        # nested keys out of sorted order, as postprocess writes them
+        new = dict(self.new, papers={"10": {"title": "a"}, "12": {"title": "c", "authors": ["x"]}})
+        old_meta = {"last_updated_on": "2020-01-01T00:00:00.000000Z"}
+        new_meta = {"last_updated_on": "2020-02-01T12:30:00.000000Z"}
+
+        def write(output_file, datasets, meta, output):
+            if output["format"] == 'sharded':
+                write_sharded_release(output_file, datasets, meta, os.path.join(self.temp_dir.name, 'bundle/'),
+                                      output["compression"], release_mtime(meta["last_updated_on"]))
+            else:
+                write_legacy_release(output_file, datasets, meta, work_dir=None,
+                                     mtime=release_mtime(meta["last_updated_on"]))
+
+        for output in [{"format": "legacy"}, {"format": "sharded", "compression": None}]:
+            old_file = os.path.join(self.temp_dir.name, 'old.tar.gz')
+            new_file = os.path.join(self.temp_dir.name, 'new.tar.gz')
+            delta_file = os.path.join(self.temp_dir.name, 'new.delta.json.gz')
+            rebuilt_file = os.path.join(self.temp_dir.name, 'rebuilt.tar.gz')
+            write(old_file, self.old, old_meta, output)
+            write(new_file, new, new_meta, output)
+            write_delta(delta_file, compute_release_delta(old_file, new, new_meta, output))
+
+            work_dir = os.path.join(self.temp_dir.name, 'work/')
+            os.makedirs(work_dir, exist_ok=True)
+            apply_release_delta(old_file, delta_file, rebuilt_file, work_dir)
+            assert file_sha256(rebuilt_file) == file_sha256(new_file), output
+            assert load_release(rebuilt_file) == (new, new_meta)
@@ -1,110 +1,97 @@
-import json
 import unittest
 
+from suppai.output_validator import validate_output
 
-INTERACTION_DICT_FILE = 'output/interaction_id_dict.json'
-SENTENCE_DICT_FILE = 'output/sentence_dict.json'
-CUI_METADATA_FILE = 'output/cui_metadata.json'
-PAPER_METADATA_FILE = 'output/paper_metadata.json'
+
+OUTPUT_DIR = 'output/'
 
 
 class TestDataIntegrity(unittest.TestCase):
 
-    def setUp(self):
-        with open(INTERACTION_DICT_FILE, 'r') as f:
-            self.interaction_dict = json.load(f)
-        with open(SENTENCE_DICT_FILE, 'r') as f:
-            self.sentence_dict = json.load(f)
-        with open(CUI_METADATA_FILE, 'r') as f:
-            self.cui_metadata = json.load(f)
-        with open(PAPER_METADATA_FILE, 'r') as f:
-            self.paper_metadata = json.load(f)
+    @classmethod
+    def setUpClass(cls):
+        # one streaming pass over all output files (see scripts/validate_output.py for the pipeline stage)
+        cls.report = validate_output(OUTPUT_DIR)
+
+    def _assert_check(self, check: str):
+        violations = [v for v in self.report["violations"] if v["check"] == check]
+        assert self.report["violation_counts"][check] == 0, violations
+
+    def test_files_found(self):
+        """
+        Assert the output files were found
+        :return:
+        """
+        assert all(self.report["entries"].values()), self.report["entries"]
 
     def test_cui_keys(self):
         """
         Assert all cui keys in interaction dict have metadata
         :return:
         """
-        for cui, interactions in self.interaction_dict.items():
-            assert cui in self.cui_metadata
+        self._assert_check("cui_keys")
 
     def test_cui_keys_reverse(self):
         """
         Assert all cui keys in metadata have interaction dict entries
         :return:
         """
-        for cui, metadata in self.cui_metadata.items():
-            assert cui in self.interaction_dict
+        self._assert_check("cui_keys_reverse")
 
     def test_interaction_keys(self):
         """
         Assert all interaction keys are in sentence dict
         :return:
         """
-        for cui, interactions in self.interaction_dict.items():
-            for interaction in interactions:
-                assert interaction in self.sentence_dict
+        self._assert_check("interaction_keys")
 
     def test_papers_in_dict(self):
         """
         Assert all papers in sentence dict have entries in paper_metadata
         :return:
         """
-        for sentences in self.sentence_dict.values():
-            for sent in sentences:
-                assert sent["paper_id"] in self.paper_metadata
+        self._assert_check("papers_in_dict")
 
     def test_no_redundant_names(self):
         """
         Assert all preferred names are unique
         :return:
         """
-        pref_name = [meta['preferred_name'] for meta in self.cui_metadata.values()]
-        assert len(pref_name) == len(set(pref_name))
+        self._assert_check("no_redundant_names")
 
     def test_all_cuis_in_sentences_valid(self):
         """
         Assert all CUI pairs in sentences are valid
         :return:
         """
-        for int_key, sentences in self.sentence_dict.items():
-            cui1, cui2 = int_key.split('-')
-            for sent in sentences:
-                arg1 = sent['arg1']['id']
-                arg2 = sent['arg2']['id']
-                assert {cui1, cui2} == {arg1, arg2}
-                assert arg1 in self.cui_metadata
-                assert arg2 in self.cui_metadata
+        self._assert_check("sentence_cuis_valid")
 
     def test_no_empty_entries(self):
         """
         Assert all entries contain data
         :return:
         """
-        for sentences in self.sentence_dict.values():
-            assert sentences
-        for metadata in self.cui_metadata.values():
-            assert metadata
-        for paper in self.paper_metadata.values():
-            assert paper
+        self._assert_check("no_empty_entries")
 
     def test_all_supp_drugs(self):
         """
         Assert all entities are supplements or drugs
         :return:
         """
-        for entry in self.cui_metadata.values():
-            assert entry['ent_type'] in {'supplement', 'drug'}
+        self._assert_check("all_supp_drugs")
 
     def test_all_sentences_valid(self):
         """
         Assert all sentences contain relations between supp-supp or supp-drug
         :return:
         """
-        for sentences in self.sentence_dict.values():
-            for sent in sentences:
-                arg1 = sent['arg1']['id']
-                arg2 = sent['arg2']['id']
-                arg1_type = self.cui_metadata[arg1]['ent_type']
-                arg2_type = self.cui_metadata[arg2]['ent_type']
-                assert {arg1_type, arg2_type}.issubset({"supplement", "drug"})
\ No newline at end of file
+        # sentence arguments have metadata, and all CUIs with metadata are supplements or drugs
+        self._assert_check("sentence_cuis_valid")
+        self._assert_check("all_supp_drugs")
+
+    def test_sentence_counts(self):
+        """
+        Assert all interactions with sentences have sentence counts
+        :return:
+        """
+        self._assert_check("sentence_counts")
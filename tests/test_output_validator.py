@@ -0,0 +1,106 @@
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.output_validator import validate_output
+from suppai.output_bundle import write_sharded_bundle
+from suppai.output_delta import write_legacy_release, LEGACY_FILES
+
+
+class TestOutputValidator(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.datasets = {
+            "cuis": {
+                "C0042878": {"preferred_name": "Vitamin K", "ent_type": "supplement"},
+                "C0043031": {"preferred_name": "Warfarin", "ent_type": "drug"}
+            },
+            "interactions": {
+                "C0042878": ["C0042878-C0043031"],
+                "C0043031": ["C0042878-C0043031"]
+            },
+            "sentences": {
+                "C0042878-C0043031": [{
+                    "uid": 0, "paper_id": "1234", "sentence": "warfarin and vitamin K",
+                    "arg1": {"id": "C0043031"}, "arg2": {"id": "C0042878"}
+                }]
+            },
+            "sentence_counts": {"C0042878-C0043031": 1},
+            "papers": {"1234": {"title": "A paper", "pmid": 1}}
+        }
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _broken(self):
+        datasets = json.loads(json.dumps(self.datasets))
+        datasets["cuis"]["C0016157"] = {"preferred_name": "Warfarin", "ent_type": "disease"}
+        datasets["interactions"]["C0043031"].append("C0016157-C0043031")
+        datasets["sentences"]["C0042878-C0043031"][0]["paper_id"] = "5678"
+        return datasets
+
+    def test_valid_outputs(self):
+        """
+        Assert a consistent release validates as a directory, a legacy tarball, and a sharded bundle
+        :return:
+        """
+        tar_file = os.path.join(self.temp_dir.name, 'release.tar.gz')
+        legacy_dir = os.path.join(self.temp_dir.name, 'legacy/')
+        bundle_dir = os.path.join(self.temp_dir.name, 'bundle/')
+        os.makedirs(legacy_dir)
+        write_legacy_release(tar_file, self.datasets, {"last_updated_on": "now"}, work_dir=legacy_dir)
+        write_sharded_bundle(bundle_dir, self.datasets, meta={"last_updated_on": "now"})
+
+        for path in [legacy_dir, tar_file, bundle_dir]:
+            report = validate_output(path, workers=1)
+            assert report["valid"], report["violations"]
+            assert report["entries"] == {"interactions": 2, "sentences": 1, "cuis": 2, "papers": 1}
+
+    def test_violations(self):
+        """
+        Assert each broken invariant is reported with the offending key, sequentially and in parallel
+        :return:
+        """
+        bundle_dir = os.path.join(self.temp_dir.name, 'bundle/')
+        write_sharded_bundle(bundle_dir, self._broken(), meta={})
+        legacy_dir = os.path.join(self.temp_dir.name, 'legacy/')
+        os.makedirs(legacy_dir)
+        for name, data in self._broken().items():
+            with open(os.path.join(legacy_dir, LEGACY_FILES[name]), 'w') as f:
+                json.dump(data, f)
+
+        for path, workers in [(bundle_dir, 1), (bundle_dir, 2), (legacy_dir, 2)]:
+            report = validate_output(path, workers=workers)
+            assert not report["valid"]
+            counts = report["violation_counts"]
+            assert counts["cui_keys"] == 0
+            assert counts["cui_keys_reverse"] == 1
+            assert counts["interaction_keys"] == 1
+            assert counts["papers_in_dict"] == 1
+            assert counts["no_redundant_names"] == 1
+            assert counts["all_supp_drugs"] == 1
+            assert counts["sentence_cuis_valid"] == 0
+            violations = {(v["check"], v["key"]) for v in report["violations"]}
+            assert ("interaction_keys", "C0016157-C0043031") in violations
+            assert ("papers_in_dict", "5678") in violations
+            assert ("all_supp_drugs", "C0016157") in violations
+
+    def test_missing_datasets(self):
+        """
+        Assert a release without (or with empty) required output dicts is invalid
+        :return:
+        """
+        empty_dir = os.path.join(self.temp_dir.name, 'empty/')
+        os.makedirs(empty_dir)
+        report = validate_output(empty_dir, workers=1)
+        assert not report["valid"]
+        assert report["violation_counts"]["datasets_found"] == 4
+
+        tar_file = os.path.join(self.temp_dir.name, 'release.tar.gz')
+        write_legacy_release(tar_file, dict(self.datasets, papers=dict()), {}, work_dir=None)
+        report = validate_output(tar_file, workers=1)
+        assert not report["valid"]
+        assert report["violation_counts"]["datasets_found"] == 1
+        assert ("datasets_found", "papers") in [(v["check"], v["key"]) for v in report["violations"]]
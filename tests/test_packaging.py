@@ -0,0 +1,105 @@
+import os
+import gc
+import json
+import tarfile
+import tempfile
+import warnings
+import unittest
+import unittest.mock
+
+from suppai.packaging import write_archive, json_member, verify_archive, MANIFEST_NAME, MANIFEST_SUFFIX
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+class TestPackaging(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_file = os.path.join(self.temp_dir.name, 'release.tar.gz')
+        self.data = {f"C{i:07d}": {"preferred_name": f"name {i}", "synonyms": [str(i)] * 3} for i in range(5000)}
+        self.file_path = os.path.join(self.temp_dir.name, 'loose.txt')
+        with open(self.file_path, 'w') as f:
+            f.write('x' * 1000)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    @unittest.skipIf(zstandard is None, "zstandard is not installed")
+    def test_zst_archive(self):
+        """
+        Assert a zst archive verifies against its manifest without leaving the archive file open
+        :return:
+        """
+        write_archive(self.output_file, [
+            ('data.json', json_member(self.data)),
+            ('loose.txt', self.file_path)
+        ], compression='zst', threads=2)
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter('always', ResourceWarning)
+            assert verify_archive(self.output_file) == []
+            gc.collect()
+        assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+
+    def test_parallel_gzip_roundtrip(self):
+        """
+        Assert the multi-member gzip archive reads back with tarfile and matches its manifest
+        :return:
+        """
+        copy_dir = os.path.join(self.temp_dir.name, 'copies')
+        os.makedirs(copy_dir)
+        with unittest.mock.patch('suppai.packaging.BLOCK_SIZE', 1 << 14):
+            manifest = write_archive(self.output_file, [
+                ('data.json', json_member(self.data, indent=4, sort_keys=True)),
+                ('loose.txt', self.file_path)
+            ], threads=4, copy_dir=copy_dir)
+
+        with tarfile.open(self.output_file, 'r:gz') as tar:
+            assert tar.getnames() == ['data.json', 'loose.txt', MANIFEST_NAME]
+            assert json.load(tar.extractfile('data.json')) == self.data
+            assert json.load(tar.extractfile(MANIFEST_NAME))["members"] == manifest["members"]
+
+        with open(os.path.join(copy_dir, 'data.json')) as f:
+            assert json.load(f) == self.data
+        assert not os.path.exists(os.path.join(copy_dir, 'loose.txt'))
+        assert manifest["members"]["loose.txt"]["size"] == 1000
+        assert verify_archive(self.output_file) == []
+
+    def test_verify_detects_mismatch(self):
+        """
+        Assert a manifest that does not match the archive is reported
+        :return:
+        """
+        write_archive(self.output_file, [('data.json', json_member(self.data))], threads=2)
+        with open(self.output_file + MANIFEST_SUFFIX) as f:
+            manifest = json.load(f)
+        manifest["members"]["data.json"]["sha256"] = "0" * 64
+        manifest["members"]["missing.json"] = {"size": 0, "sha256": "0" * 64}
+        with open(self.output_file + MANIFEST_SUFFIX, 'w') as f:
+            json.dump(manifest, f)
+        assert sorted(verify_archive(self.output_file)) == [
+            "checksum mismatch for data.json", "missing member missing.json"
+        ]
+
+    def test_reproducible(self):
+        """
+        Assert rebuilding an archive with the same release time gives identical bytes, with members dated by it
+        :return:
+        """
+        copy_dir = os.path.join(self.temp_dir.name, 'copies')
+        os.makedirs(copy_dir)
+        archives = []
+        for output_file in [self.output_file, os.path.join(self.temp_dir.name, 'rebuilt.tar.gz')]:
+            manifest = write_archive(output_file, [
+                ('data.json', json_member(self.data)),
+                ('loose.txt', self.file_path)
+            ], threads=2, copy_dir=copy_dir, mtime=1577836800)
+            with open(output_file, 'rb') as f:
+                archives.append(f.read())
+        assert archives[0] == archives[1]
+        assert manifest["created"] == '2020-01-01T00:00:00Z'
+        with tarfile.open(self.output_file, 'r:gz') as tar:
+            assert {member.mtime for member in tar.getmembers()} == {1577836800}
@@ -0,0 +1,144 @@
+import os
+import gzip
+import json
+import tempfile
+import threading
+import unittest
+from http.server import HTTPServer, BaseHTTPRequestHandler
+
+from suppai.data import PaperAuthor
+from suppai.paper_metadata import (
+    PaperMetadataCache, PaperMetadataIndex, PaperMetadataIndexWriter, PaperMetadataProvider, S2PaperClient,
+    cache_papers_shards, metadata_from_dataset_record, split_author_name
+)
+
+try:
+    import requests
+except ImportError:
+    requests = None
+
+
+def make_record(corpus_id, pmid):
+    return {
+        "corpusid": corpus_id,
+        "externalids": {"PubMed": pmid, "DOI": f"10.1/{corpus_id}"},
+        "title": f"paper {corpus_id}",
+        "authors": [{"authorId": "1", "name": "Jane Q. Public"}],
+        "year": 2001,
+        "venue": "J",
+        "s2fieldsofstudy": [{"category": "Medicine", "source": "s2"}, {"category": "Medicine", "source": "x"}]
+    }
+
+
+class StubS2Handler(BaseHTTPRequestHandler):
+    requests_seen = []
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        StubS2Handler.requests_seen.append(body["ids"])
+        records = []
+        for paper_id in body["ids"]:
+            corpus_id = int(paper_id.split(':')[1])
+            # odd ids are unknown to the API
+            records.append(None if corpus_id % 2 else {
+                "title": f"paper {corpus_id}",
+                "authors": [{"name": "Madonna"}],
+                "year": 1999,
+                "venue": "V",
+                "externalIds": {"PubMed": str(corpus_id + 1000)},
+                "fieldsOfStudy": ["Biology"]
+            })
+        response = json.dumps(records).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(response)))
+        self.end_headers()
+        self.wfile.write(response)
+
+    def log_message(self, *args):
+        pass
+
+
+class TestPaperMetadata(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache = PaperMetadataCache(os.path.join(self.temp_dir.name, 'papers.sqlite'))
+
+    def tearDown(self):
+        self.cache.close()
+        self.temp_dir.cleanup()
+
+    def test_cache_shards(self):
+        """
+        Assert PubMed papers in S2 shards are cached and read back as metadata entries
+        :return:
+        """
+        shard_file = os.path.join(self.temp_dir.name, 'papers-part0.jsonl.gz')
+        with gzip.open(shard_file, 'wt') as f:
+            for record in [make_record(11, "111"), make_record(12, None), make_record(13, "113")]:
+                f.write(json.dumps(record) + '\n')
+
+        assert cache_papers_shards(self.cache, [shard_file]) == 2
+        metadata = self.cache.get_many(["11", "12", "13"])
+        assert set(metadata) == {"11", "13"}
+        assert metadata["11"]["pmid"] == 111
+        assert metadata["11"]["doi"] == "10.1/11"
+        assert metadata["11"]["fields_of_study"] == ["Medicine"]
+        assert metadata["11"]["authors"] == [PaperAuthor(first="Jane", middle="Q.", last="Public", suffix=None)]
+        assert split_author_name("Madonna") == PaperAuthor(first=None, middle=None, last="Madonna", suffix=None)
+
+    def test_metadata_index(self):
+        """
+        Assert runs merge into an index with point lookups, later runs replacing earlier entries
+        :return:
+        """
+        index_prefix = os.path.join(self.temp_dir.name, 'paper_metadata')
+        writer = PaperMetadataIndexWriter(index_prefix)
+        writer.add_run('part0', {str(i): metadata_from_dataset_record(make_record(i, str(i))) for i in [700, 3, 256]})
+        writer.add_run('part1', {str(i): metadata_from_dataset_record(make_record(i, str(i))) for i in [255, 100000]})
+        assert writer.finalize() == 5
+
+        update = metadata_from_dataset_record(make_record(256, "999"))
+        writer = PaperMetadataIndexWriter(index_prefix)
+        writer.add_run('part0', {"256": update, "1": update})
+        assert writer.finalize() == 6
+
+        index = PaperMetadataIndex(index_prefix)
+        metadata = index.get_many(["3", "256", "255", "100000", "1", "4", "99999999"])
+        assert set(metadata) == {"1", "3", "255", "256", "100000"}
+        assert metadata["256"]["pmid"] == 999
+        assert metadata["100000"]["title"] == "paper 100000"
+        assert metadata["3"]["authors"][0].last == "Public"
+
+        provider = PaperMetadataProvider(self.cache, index=index)
+        assert set(provider.get_metadata(["700", "5"])) == {"700"}
+        index.close()
+
+    @unittest.skipIf(requests is None, "requests is not installed")
+    def test_provider_fetches_misses(self):
+        """
+        Assert cache misses are fetched in batches from the API and cached
+        :return:
+        """
+        server = HTTPServer(('127.0.0.1', 0), StubS2Handler)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            client = S2PaperClient(
+                base_url=f'http://127.0.0.1:{server.server_port}', batch_size=3, max_workers=2,
+                requests_per_second=0
+            )
+            provider = PaperMetadataProvider(self.cache, client)
+            self.cache.put_many({"2": {"title": "cached", "authors": [], "year": None, "venue": None, "doi": None,
+                                       "pmid": 1, "fields_of_study": []}})
+
+            metadata = provider.get_metadata([str(i) for i in range(2, 10)])
+            assert set(metadata) == {"2", "4", "6", "8"}
+            assert metadata["2"]["title"] == "cached"
+            assert metadata["4"]["pmid"] == 1004
+            assert sorted(len(ids) for ids in StubS2Handler.requests_seen) == [1, 3, 3]
+            assert len(self.cache) == 4
+            client.close()
+        finally:
+            server.shutdown()
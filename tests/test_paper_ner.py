@@ -0,0 +1,92 @@
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.cui_handler import CUIHandler
+from suppai.paper_ner import iter_linked_papers
+from suppai.sentence_filter import filter_sentences
+
+
+CLUSTERS = {
+    "supplements": {
+        "S1": {"preferred_name": "fish oil", "synonyms": [], "tradenames": [], "definition": "", "members": ["S1"]},
+        "S2": {"preferred_name": "ginkgo", "synonyms": [], "tradenames": [], "definition": "", "members": ["S2"]}
+    },
+    "drugs": {
+        "D1": {"preferred_name": "warfarin", "synonyms": [], "tradenames": [], "definition": "", "members": ["D1"]}
+    }
+}
+
+# mention string -> linked CUI
+MENTIONS = {"fish oil": "S1", "ginkgo": "S2", "warfarin": "D1", "aspirin": "D2"}
+
+
+class StubLinker:
+    """
+    DrugSupplementLinker stand-in: sentences split on '. ', mentions found by substring
+    """
+    def get_linked_entities(self, text, top_k=1):
+        ents_per_sentence = []
+        for sent_num, sentence in enumerate(text.split('. ')):
+            if 'error' in sentence:
+                raise ValueError(sentence)
+            entities = [
+                {"string": mention, "start": sentence.index(mention), "end": sentence.index(mention) + len(mention),
+                 "linked_cuis": [(cui, ("T109",), 0.9, 0)]}
+                for mention, cui in MENTIONS.items() if mention in sentence
+            ]
+            if entities:
+                ents_per_sentence.append({"sent_num": sent_num, "sentence": sentence, "entities": entities})
+        return ents_per_sentence
+
+    def get_linked_entities_batch(self, texts, top_k=1):
+        return [self.get_linked_entities(text, top_k) for text in texts]
+
+
+class TestPaperNER(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        cluster_file = os.path.join(self.temp_dir.name, 'clusters.json')
+        with open(cluster_file, 'w') as f:
+            json.dump(CLUSTERS, f)
+        self.handler = CUIHandler(cluster_file)
+        self.entries = [
+            {"corpus_id": 1, "title": "Fish oil", "abstract": "fish oil and warfarin. ginkgo alone"},
+            {"corpus_id": 2, "title": "", "abstract": "ginkgo and warfarin"},
+            {"corpus_id": 3, "title": "Ginkgo", "abstract": "ginkgo, fish oil and warfarin. aspirin and warfarin"},
+            {"corpus_id": 4, "title": "Bad", "abstract": "an error with ginkgo and warfarin"},
+            {"corpus_id": 5, "title": "Warfarin", "abstract": "warfarin with fish oil"}
+        ]
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_worker_filter_matches_entity_files(self):
+        """
+        Assert filtering linked sentences inside the NER worker emits the same candidates as writing entity files
+        and filtering them afterwards
+        :return:
+        """
+        for two_phase in [True, False]:
+            linked = list(iter_linked_papers(StubLinker(), self.entries, batch_size=2, two_phase=two_phase))
+            assert [entry["corpus_id"] for entry, sentences in linked if sentences is None] == [2, 4]
+
+            # streamed: sentences go straight from the linker to the filter
+            streamed = list(filter_sentences(
+                (sent for _, sentences in linked if sentences for sent in sentences), self.handler
+            ))
+
+            # entity files: sentences are written as jsonl, then read back and filtered
+            entity_file = os.path.join(self.temp_dir.name, 'entities.jsonl')
+            with open(entity_file, 'w') as f:
+                for _, sentences in linked:
+                    for sent in sentences or []:
+                        json.dump(sent, f)
+                        f.write('\n')
+            with open(entity_file, 'r') as f:
+                from_files = list(filter_sentences((json.loads(line) for line in f), self.handler))
+
+            assert [json.dumps(c) for c in streamed] == [json.dumps(c) for c in from_files]
+            assert [c["id"] for c in streamed] == ["1-0", "3-1", "3-2", "3-3", "5-4"]
@@ -0,0 +1,91 @@
+import os
+import sys
+import json
+import tempfile
+import unittest
+
+from suppai.pipeline import Pipeline, Stage, topological_order, STAGE_SUCCEEDED, STAGE_SKIPPED, STAGE_FAILED, STAGE_BLOCKED
+
+
+def copy_command(in_file, out_file, suffix=''):
+    return [sys.executable, '-c', f"open({out_file!r}, 'w').write(open({in_file!r}).read() + {suffix!r})"]
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.path = lambda name: os.path.join(self.temp_dir.name, name)
+        self.state_file = self.path('state.json')
+        with open(self.path('input.txt'), 'w') as f:
+            f.write('a')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def make_stages(self, fail_c=False):
+        c_command = [sys.executable, '-c', 'raise SystemExit(1)'] if fail_c else \
+            copy_command(self.path('b.txt'), self.path('c.txt'), 'c')
+        return [
+            Stage('c', c_command, outputs=[self.path('c.txt')], depends_on=['b']),
+            Stage('a', copy_command(self.path('input.txt'), self.path('a.txt')),
+                  inputs=['{input_file}'], outputs=[self.path('a.txt')]),
+            Stage('b', copy_command(self.path('a.txt'), self.path('b.txt'), 'b'),
+                  inputs=[self.path('a.txt')], outputs=[self.path('b.txt')], depends_on=['a']),
+            Stage('d', copy_command(self.path('a.txt'), self.path('d.txt')),
+                  outputs=[self.path('d.txt')], depends_on=['c'])
+        ]
+
+    def run_pipeline(self, **kwargs):
+        pipeline = Pipeline(self.make_stages(**kwargs), self.state_file,
+                            context_fn=lambda: {"input_file": self.path('input.txt')})
+        return {name: result.status for name, result in pipeline.run().items()}
+
+    def test_order(self):
+        """
+        Assert stages are ordered after their dependencies and cycles are rejected
+        :return:
+        """
+        assert topological_order(self.make_stages()) == ['a', 'b', 'c', 'd']
+        with self.assertRaises(ValueError):
+            topological_order([Stage('x', [], depends_on=['y']), Stage('y', [], depends_on=['x'])])
+
+    def test_skip_and_resume(self):
+        """
+        Assert a failed stage blocks its dependents, and a rerun skips up-to-date stages
+        :return:
+        """
+        assert self.run_pipeline(fail_c=True) == {
+            'a': STAGE_SUCCEEDED, 'b': STAGE_SUCCEEDED, 'c': STAGE_FAILED, 'd': STAGE_BLOCKED
+        }
+        assert self.run_pipeline() == {'a': STAGE_SKIPPED, 'b': STAGE_SKIPPED, 'c': STAGE_SUCCEEDED, 'd': STAGE_SUCCEEDED}
+        with open(self.path('c.txt')) as f:
+            assert f.read() == 'abc'
+        assert self.run_pipeline() == {'a': STAGE_SKIPPED, 'b': STAGE_SKIPPED, 'c': STAGE_SKIPPED, 'd': STAGE_SKIPPED}
+
+        # changed input reruns the stage and everything whose inputs change
+        with open(self.path('input.txt'), 'w') as f:
+            f.write('x')
+        assert self.run_pipeline() == {
+            'a': STAGE_SUCCEEDED, 'b': STAGE_SUCCEEDED, 'c': STAGE_SUCCEEDED, 'd': STAGE_SUCCEEDED
+        }
+        with open(self.state_file) as f:
+            assert json.load(f)["stages"]["c"]["elapsed"] > 0
+
+    def test_context_keys(self):
+        """
+        Assert a stage reruns when a context value named in its keys changes, and only then
+        :return:
+        """
+        context = {"run_date": "2020-01-01"}
+        stages = [Stage('a', copy_command(self.path('input.txt'), self.path('a.txt')),
+                        outputs=[self.path('a.txt')], keys=['run_date'])]
+
+        def _run():
+            pipeline = Pipeline(stages, self.state_file, context_fn=lambda: context)
+            return pipeline.run()['a'].status
+
+        assert _run() == STAGE_SUCCEEDED
+        assert _run() == STAGE_SKIPPED
+        context["run_date"] = "2020-01-02"
+        assert _run() == STAGE_SUCCEEDED
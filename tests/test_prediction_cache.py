@@ -0,0 +1,99 @@
+import os
+import json
+import tempfile
+import unittest
+
+from suppai.prediction_cache import (
+    PredictionCache, candidate_key, local_model_id, partition_candidates, complete_labels, MODEL_ID_FILE
+)
+
+
+def make_candidate(cand_id, sentence, span1, span2):
+    return {
+        "id": cand_id,
+        "sentence_id": 0,
+        "sentence": sentence,
+        "arg1": {"span": [span1], "id": "C1"},
+        "arg2": {"span": [span2], "id": "C2"}
+    }
+
+
+class TestPredictionCache(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.cache_file = os.path.join(self.temp_dir.name, 'cache.sqlite')
+        self.input_file = os.path.join(self.temp_dir.name, 'sents.jsonl')
+        self.miss_file = os.path.join(self.temp_dir.name, 'misses.jsonl')
+        self.hit_file = os.path.join(self.temp_dir.name, 'hits.jsonl')
+        self.candidates = [
+            make_candidate("1-0", "warfarin and vitamin K", [0, 8], [13, 22]),
+            make_candidate("2-0", "warfarin and vitamin K", [0, 8], [13, 22]),
+            make_candidate("3-0", "fish oil and aspirin", [0, 8], [13, 20]),
+        ]
+        with open(self.input_file, 'w') as f:
+            for cand in self.candidates:
+                f.write(json.dumps(cand) + '\n')
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_key_depends_on_model(self):
+        """
+        Assert cache keys change with the model id and the marked spans
+        :return:
+        """
+        cand = self.candidates[0]
+        other_spans = make_candidate("1-0", cand["sentence"], [13, 22], [0, 8])
+        assert candidate_key(cand, 'model_a') != candidate_key(cand, 'model_b')
+        assert candidate_key(cand, 'model_a') != candidate_key(other_spans, 'model_a')
+        assert candidate_key(cand, 'model_a') == candidate_key(self.candidates[1], 'model_a')
+
+    def test_partition_and_complete(self):
+        """
+        Assert duplicates are classified once and a second run is served from the cache
+        :return:
+        """
+        cache = PredictionCache(self.cache_file, 'model_a')
+        pending = partition_candidates(cache, [self.input_file], self.miss_file, self.hit_file)
+        with open(self.miss_file, 'r') as f:
+            submitted = [json.loads(line)["id"] for line in f]
+        assert submitted == ["1-0", "3-0"]
+
+        # fake model output for the submitted candidates
+        label_file = os.path.join(self.temp_dir.name, 'labels.jsonl')
+        with open(label_file, 'w') as f:
+            f.write(json.dumps({"id": "1-0", "sentence": "", "probs": [0.1, 0.9], "label-model": 1}) + '\n')
+            f.write(json.dumps({"id": "3-0", "sentence": "", "probs": [0.8, 0.2], "label-model": 0}) + '\n')
+        assert complete_labels(cache, label_file, pending) == 2
+        with open(label_file, 'r') as f:
+            labels = {entry["id"]: entry["label-model"] for entry in map(json.loads, f)}
+        assert labels == {"1-0": 1, "2-0": 1, "3-0": 0}
+
+        # second run: everything cached
+        pending = partition_candidates(cache, [self.input_file], self.miss_file, self.hit_file)
+        assert not pending
+        with open(self.hit_file, 'r') as f:
+            assert len(f.readlines()) == 3
+        cache.close()
+
+    def test_local_model_id(self):
+        """
+        Assert local exports are identified by their recorded Beaker id or by their contents, not their path
+        :return:
+        """
+        model_dir = os.path.join(self.temp_dir.name, 'model/')
+        os.makedirs(model_dir)
+        with open(os.path.join(model_dir, 'config.json'), 'w') as f:
+            f.write('{"hidden_size": 768}')
+        first_id = local_model_id(model_dir)
+        assert first_id.startswith('sha1:') and local_model_id(model_dir) == first_id
+
+        # re-exporting different weights to the same path changes the id
+        with open(os.path.join(model_dir, 'pytorch_model.bin'), 'wb') as f:
+            f.write(b'weights')
+        assert local_model_id(model_dir) != first_id
+
+        with open(os.path.join(model_dir, MODEL_ID_FILE), 'w') as f:
+            f.write('ds_abc123\n')
+        assert local_model_id(model_dir) == 'ds_abc123'
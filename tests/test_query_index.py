@@ -0,0 +1,78 @@
+import os
+import tempfile
+import unittest
+
+from suppai.query_index import build_query_index, SuppAIIndex
+
+
+def make_sentence(uid, paper_id, arg1, arg2):
+    return {
+        "uid": uid,
+        "paper_id": paper_id,
+        "sentence_id": 0,
+        "sentence": "warfarin and vitamin K",
+        "confidence": 0.9,
+        "arg1": {"id": arg1, "span": [13, 22]},
+        "arg2": {"id": arg2, "span": [0, 8]}
+    }
+
+
+class TestQueryIndex(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.db_file = os.path.join(self.temp_dir.name, 'index.sqlite')
+        cui_dict = {
+            "C0042878": {"ent_type": "supplement", "preferred_name": "Vitamin K", "synonyms": ["phytonadione"],
+                         "tradenames": [], "definition": ""},
+            "C0043031": {"ent_type": "drug", "preferred_name": "Warfarin", "synonyms": [],
+                         "tradenames": ["Coumadin"], "definition": ""}
+        }
+        interaction_dict = {
+            "C0042878": ["C0042878-C0043031"],
+            "C0043031": ["C0042878-C0043031"]
+        }
+        sentence_dict = {
+            "C0042878-C0043031": [make_sentence(0, "11", "C0042878", "C0043031"),
+                                  make_sentence(1, "12", "C0042878", "C0043031")]
+        }
+        paper_dict = {
+            paper_id: {"title": "t", "authors": [], "year": 2000, "venue": "", "doi": None, "pmid": pmid,
+                       "fields_of_study": ["Medicine"], "retraction": False, "clinical_study": True,
+                       "human_study": True, "animal_study": False}
+            for paper_id, pmid in [("11", 111), ("12", 112)]
+        }
+        self.sentence_dict = sentence_dict
+        self.cui_dict = cui_dict
+        build_query_index(self.db_file, interaction_dict, sentence_dict, cui_dict, paper_dict, {"last_updated_on": "x"})
+        self.index = SuppAIIndex(self.db_file)
+
+    def tearDown(self):
+        self.index.close()
+        self.temp_dir.cleanup()
+
+    def test_point_queries(self):
+        """
+        Assert lookups return entries in the output dict format
+        :return:
+        """
+        assert self.index.get_cui("C0043031") == self.cui_dict["C0043031"]
+        assert self.index.get_cui("C0000000") is None
+        assert self.index.get_interactions("C0043031") == ["C0042878-C0043031"]
+        assert self.index.get_sentences("C0042878-C0043031") == self.sentence_dict["C0042878-C0043031"]
+        assert len(self.index.get_sentences("C0042878-C0043031", limit=1, offset=1)) == 1
+        assert self.index.count_sentences("C0042878-C0043031") == len(self.sentence_dict["C0042878-C0043031"])
+        assert self.index.count_sentences("C0000000-C0000001") == 0
+        assert self.index.get_paper("12")["pmid"] == 112
+        assert self.index.get_paper_by_pmid(111)[0] == "11"
+        assert self.index.meta() == {"last_updated_on": "x"}
+
+    def test_name_search(self):
+        """
+        Assert names, synonyms, and tradenames are searchable by prefix
+        :return:
+        """
+        assert self.index.search_names("coum")[0][0] == "C0043031"
+        assert self.index.search_names("vitamin k")[0][0] == "C0042878"
+        assert self.index.search_names("phyto")[0][:2] == ("C0042878", "phytonadione")
+        assert self.index.search_names("!!") == []
@@ -0,0 +1,259 @@
+import os
+import json
+import time
+import asyncio
+import tempfile
+import unittest
+from http import HTTPStatus
+
+from suppai.output_delta import write_legacy_release
+from suppai.query_index import build_query_index
+from suppai.query_server import QueryServer
+
+
+def make_sentence(uid, paper_id):
+    return {
+        "uid": uid,
+        "paper_id": paper_id,
+        "sentence_id": 0,
+        "sentence": "warfarin and vitamin K",
+        "confidence": 0.9 - uid / 100,
+        "arg1": {"id": "C0042878", "span": [13, 22]},
+        "arg2": {"id": "C0043031", "span": [0, 8]}
+    }
+
+
+class TestQueryServer(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.output_dir = os.path.join(self.temp_dir.name, 'output/')
+        os.makedirs(self.output_dir)
+        self.datasets = {
+            "cuis": {
+                "C0042878": {"ent_type": "supplement", "preferred_name": "Vitamin K", "synonyms": [],
+                             "tradenames": [], "definition": ""},
+                "C0043031": {"ent_type": "drug", "preferred_name": "Warfarin", "synonyms": [],
+                             "tradenames": ["Coumadin"], "definition": ""}
+            },
+            "interactions": {
+                "C0042878": ["C0042878-C0043031"],
+                "C0043031": ["C0042878-C0043031"]
+            },
+            "sentences": {"C0042878-C0043031": [make_sentence(uid, "11") for uid in range(5)]},
+            "sentence_counts": {"C0042878-C0043031": 8},
+            "papers": {
+                "11": {"title": "t", "authors": [], "year": 2000, "venue": "", "doi": None, "pmid": 111,
+                       "fields_of_study": [], "retraction": False, "clinical_study": True,
+                       "human_study": True, "animal_study": False}
+            }
+        }
+        self.write_release('20200101')
+        self.server = QueryServer(self.output_dir, work_dir=os.path.join(self.temp_dir.name, 'server/'),
+                                  cache_size=2, reload_interval=3600)
+
+    def tearDown(self):
+        self.server.close()
+        self.temp_dir.cleanup()
+
+    def write_release(self, header: str, query_index: bool = False):
+        tar_file = os.path.join(self.output_dir, f'{header}.tar.gz')
+        meta = {"last_updated_on": header}
+        write_legacy_release(tar_file, self.datasets, meta, work_dir=None)
+        if query_index:
+            build_query_index(
+                tar_file.replace('.tar.gz', '.sqlite'), self.datasets["interactions"], self.datasets["sentences"],
+                self.datasets["cuis"], self.datasets["papers"], meta, sentence_counts=self.datasets["sentence_counts"]
+            )
+
+    def run_async(self, coroutine):
+        return asyncio.run(coroutine)
+
+    def test_endpoints(self):
+        """
+        Assert each endpoint returns the release data, with errors for unknown keys and bad parameters
+        :return:
+        """
+        async def _requests():
+            await self.server.reload()
+            return [await self.server.handle('GET', target) for target in [
+                '/meta',
+                '/cui/C0043031',
+                '/cui/C0042878/interactions',
+                '/interaction/C0042878-C0043031/sentences?offset=3&limit=10',
+                '/paper/11',
+                '/cui/C9999999',
+                '/interaction/C0042878-C0043031/sentences?limit=1000',
+                '/nothing'
+            ]] + [await self.server.handle('POST', '/meta')]
+
+        responses = self.run_async(_requests())
+        statuses = [status.value for status, _ in responses]
+        assert statuses == [200, 200, 200, 200, 200, 404, 400, 404, 405]
+        assert responses[0][1] == {"release": "20200101", "last_updated_on": "20200101"}
+        assert responses[1][1]["tradenames"] == ["Coumadin"]
+        assert responses[2][1]["interactions"] == [{"interaction_id": "C0042878-C0043031", "sentence_count": 8}]
+        page = responses[3][1]
+        assert page["sentence_count"] == 8 and page["num_sentences"] == 5
+        assert [s["uid"] for s in page["sentences"]] == [3, 4]
+        assert responses[4][1]["pmid"] == 111
+        assert self.server.release.kind == 'legacy'
+
+    def test_cache(self):
+        """
+        Assert repeated reads are served from the LRU cache
+        :return:
+        """
+        async def _requests():
+            await self.server.reload()
+            for _ in range(3):
+                await self.server.handle('GET', '/paper/11')
+            await self.server.handle('GET', '/cui/C0043031')
+            await self.server.handle('GET', '/cui/C0042878')
+            await self.server.handle('GET', '/paper/11')
+
+        self.run_async(_requests())
+        # the third distinct key evicts the paper (cache size 2)
+        assert self.server.release.cache_hits == 2
+        assert self.server.release.cache_misses == 4
+
+    def test_sentence_pages(self):
+        """
+        Assert sentences are read from the query index one page at a time and cached per page
+        :return:
+        """
+        self.write_release('20200101', query_index=True)
+
+        async def _requests():
+            await self.server.reload()
+            release = self.server.release
+            release.cache_size = 10
+            reads = []
+            get_sentences = release.reader.get_sentences
+
+            def logged_get_sentences(interaction_id, limit=-1, offset=0):
+                reads.append((offset, limit))
+                return get_sentences(interaction_id, limit, offset)
+
+            release.reader.get_sentences = logged_get_sentences
+            pages = [
+                await self.server.handle('GET', f'/interaction/C0042878-C0043031/sentences?offset={offset}&limit=2')
+                for offset in [0, 2, 4, 0]
+            ]
+            return release, reads, pages
+
+        release, reads, pages = self.run_async(_requests())
+        assert release.kind == 'index'
+        assert reads == [(0, 2), (2, 2), (4, 2)]
+        assert [[s["uid"] for s in page["sentences"]] for _, page in pages] == [[0, 1], [2, 3], [4], [0, 1]]
+        assert all(page["num_sentences"] == 5 and page["sentence_count"] == 8 for _, page in pages)
+        assert all(len(value[1]) <= 2 for key, value in release._cache.items() if key[0] == "sentences")
+
+    def test_reload(self):
+        """
+        Assert a newer release is swapped in, and an unchanged one is not reloaded
+        :return:
+        """
+        async def _reload():
+            assert await self.server.reload()
+            assert not await self.server.reload()
+            self.datasets["cuis"]["C0043031"]["preferred_name"] = "Warfarin sodium"
+            self.write_release('20200201', query_index=True)
+            assert await self.server.reload()
+            return await self.server.handle('GET', '/cui/C0043031')
+
+        status, entry = self.run_async(_reload())
+        assert status.value == 200 and entry["preferred_name"] == "Warfarin sodium"
+        assert self.server.release.kind == 'index'
+        assert self.server.release.name == '20200201'
+
+    def test_reload_in_flight(self):
+        """
+        Assert a request in flight during a reload finishes on the old release, which is closed afterwards
+        :return:
+        """
+        async def _reload():
+            await self.server.reload()
+            old = self.server.release
+            get_sentences = old.reader.get_sentences
+
+            def slow_get_sentences(interaction_id):
+                time.sleep(0.2)
+                return get_sentences(interaction_id)
+
+            old.reader.get_sentences = slow_get_sentences
+            request = asyncio.create_task(
+                self.server.handle('GET', '/interaction/C0042878-C0043031/sentences?limit=2')
+            )
+            await asyncio.sleep(0.05)
+            self.write_release('20200201')
+            assert await self.server.reload()
+            assert old.in_flight == 1 and not old.closed
+            # the sentence count is read after the swap
+            status, page = await request
+            return old, status, page
+
+        old, status, page = self.run_async(_reload())
+        assert status.value == 200 and page["sentence_count"] == 8
+        assert old.in_flight == 0 and old.closed
+        assert self.server.release.name == '20200201'
+
+    def test_internal_error(self):
+        """
+        Assert an unexpected error while handling a request gives a 500 JSON response
+        :return:
+        """
+        async def _requests():
+            await self.server.reload()
+
+            def broken_get_cui(cui):
+                raise KeyError(cui)
+
+            self.server.release.reader.get_cui = broken_get_cui
+            return await self.server.handle('GET', '/cui/C0043031'), await self.server.handle('GET', '/paper/11')
+
+        error, ok = self.run_async(_requests())
+        assert error == (HTTPStatus.INTERNAL_SERVER_ERROR, {"error": "Internal server error"})
+        assert ok[0] == HTTPStatus.OK
+        assert self.server.release.in_flight == 0
+
+    def test_http(self):
+        """
+        Assert requests on one keep-alive connection get JSON responses, including errors
+        :return:
+        """
+        async def _http():
+            server = await self.server.start('127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            bodies = []
+            for target in ['/cui/C0042878', '/paper/12']:
+                writer.write(f'GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n'.encode('latin-1'))
+                await writer.drain()
+                status_line = await reader.readline()
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line == b'\r\n':
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.lower()] = value.strip()
+                body = json.loads(await reader.readexactly(int(headers['content-length'])))
+                bodies.append((status_line.split()[1], body))
+            writer.close()
+
+            # an unexpected error on the connection (a malformed header) is answered before closing it
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(b'GET /meta HTTP/1.1\r\nContent-Length: x\r\n\r\n')
+            await writer.drain()
+            response = await reader.read()
+            bodies.append((response.split()[1], json.loads(response.split(b'\r\n\r\n')[1])))
+            writer.close()
+            server.close()
+            await server.wait_closed()
+            return bodies
+
+        bodies = self.run_async(_http())
+        assert bodies[0] == (b'200', self.datasets["cuis"]["C0042878"])
+        assert bodies[1][0] == b'404'
+        assert bodies[2] == (b'500', {"error": "Internal server error"})
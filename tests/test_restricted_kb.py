@@ -0,0 +1,95 @@
+import math
+import unittest
+
+try:
+    from scispacy.candidate_generation import MentionCandidate
+    from scispacy.linking_utils import Entity
+    from suppai.restricted_kb import select_concepts, find_distractors, link_decisions, compare_link_decisions
+except ImportError:
+    Entity = None
+
+
+# cui -> (canonical name, types)
+KB_ENTITIES = {
+    "S1": ("vitamin c", ["T127"]),
+    "D1": ("warfarin", ["T121"]),
+    "D2": ("warfarin sodium", ["T109"]),
+    "X1": ("vitamin", ["T073"]),
+    "X2": ("patients", ["T101"]),
+    "X3": ("warfarins", ["T033"])
+}
+
+
+def trigrams(text):
+    padded = f' {text.lower()} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class StubKB:
+    def __init__(self, cuis):
+        self.cui_to_entity = {
+            cui: Entity(cui, KB_ENTITIES[cui][0], [], KB_ENTITIES[cui][1], None) for cui in cuis
+        }
+
+
+class StubCandidateGenerator:
+    """
+    Exact nearest neighbour search over the names of a KB (cosine of character trigram sets)
+    """
+    def __init__(self, cuis):
+        self.kb = StubKB(cuis)
+
+    def __call__(self, mention_texts, k):
+        batch_candidates = []
+        for text in mention_texts:
+            scored = []
+            for cui, entity in self.kb.cui_to_entity.items():
+                query, name = trigrams(text), trigrams(entity.canonical_name)
+                scored.append((len(query & name) / math.sqrt(len(query) * len(name)), cui))
+            batch_candidates.append([
+                MentionCandidate(cui, [self.kb.cui_to_entity[cui].canonical_name], [score])
+                for score, cui in sorted(scored, reverse=True)[:k]
+            ])
+        return batch_candidates
+
+
+@unittest.skipIf(Entity is None, "scispacy is not installed")
+class TestRestrictedKB(unittest.TestCase):
+
+    def setUp(self):
+        self.full = StubCandidateGenerator(KB_ENTITIES)
+        self.keep = select_concepts(self.full.kb.cui_to_entity)
+        self.mentions = ["vitamin", "Warfarin", "patients", "warfarin sodium"]
+
+    def test_select_concepts(self):
+        """
+        Assert concepts are kept by semantic type and, if given, by CUI
+        :return:
+        """
+        assert self.keep == {"S1", "D1", "D2"}
+        assert select_concepts(self.full.kb.cui_to_entity, keep_cuis={"S1", "X1"}) == {"S1"}
+
+    def test_distractor_rejection(self):
+        """
+        Assert mentions rejected by the full linker (a better match of another type) are only rejected by the
+        restricted linker when distractors are also searched for corpus mentions
+        :return:
+        """
+        full_decisions = link_decisions(self.full, self.mentions, threshold=0.9)
+        assert full_decisions == {"vitamin": [], "Warfarin": ["D1", "D2"], "patients": [], "warfarin sodium": ["D2", "D1"]}
+
+        # from kept aliases alone, no distractors: "vitamin" scores 0.88 against "vitamin c"
+        alias_distractors = find_distractors(self.full, self.keep, threshold=0.9)
+        assert alias_distractors == set()
+        restricted = StubCandidateGenerator(self.keep | alias_distractors)
+        counts = compare_link_decisions(full_decisions, link_decisions(restricted, self.mentions, threshold=0.9))
+        assert counts == {"mentions": 4, "agree": 3, "rejected_by_full_only": 1, "rejected_by_restricted_only": 0,
+                          "linked_differently": 0}
+
+        # with corpus mentions, "vitamin" is rejected by both
+        mention_distractors = find_distractors(self.full, self.keep, threshold=0.9, mentions=self.mentions)
+        assert mention_distractors == {"X1", "X2"}
+        restricted = StubCandidateGenerator(self.keep | mention_distractors)
+        restricted_decisions = link_decisions(restricted, self.mentions, threshold=0.9)
+        assert restricted_decisions == full_decisions
+        assert compare_link_decisions(full_decisions, restricted_decisions)["agree"] == 4
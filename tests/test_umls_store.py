@@ -0,0 +1,43 @@
+import os
+import tempfile
+import unittest
+
+from suppai.umls_store import UMLSStore
+
+
+MRCONSO = [
+    "C001|ENG|P|L1|PF|S1|Y|A1||||MSH|MH|D1|Vitamin K|0|N||",
+    "C001|FRE|P|L2|PF|S2|Y|A2||||MSH|MH|D1|Vitamine K|0|N||",
+    "C002|ENG|P|L3|PF|S3|Y|A3||||RXNORM|IN|D2|warfarin|0|N||",
+    "C001|ENG|S|L4|PF|S4|Y|A4||||MSH|ET|D1|phylloquinone|0|N||"
+]
+MRDEF = [
+    "C001|A1|AT1||MSH|A fat-soluble vitamin.|N||",
+    "C001|A4|AT2||NCI|Second definition.|N||",
+    "C002|A3|AT3||NCI||N||"
+]
+
+
+class TestUMLSStore(unittest.TestCase):
+
+    def test_build_and_lookup(self):
+        """
+        Assert English names and first definitions are looked up by CUI in file order
+        :return:
+        """
+        with tempfile.TemporaryDirectory() as temp_dir:
+            rrf_files = []
+            for file_name, lines in [('MRCONSO.RRF', MRCONSO), ('MRDEF.RRF', MRDEF)]:
+                rrf_files.append(os.path.join(temp_dir, file_name))
+                with open(rrf_files[-1], 'w') as f:
+                    f.write('\n'.join(lines) + '\n')
+
+            store = UMLSStore(os.path.join(temp_dir, 'umls.sqlite'))
+            store.build(*rrf_files)
+            # rebuilding replaces the contents
+            store.build(*rrf_files)
+
+            assert len(store) == 2
+            assert store.get_names(["C001", "C003"]) == {"C001": [("MH", "Vitamin K"), ("ET", "phylloquinone")]}
+            assert store.get_definitions(["C001", "C002"]) == {"C001": "A fat-soluble vitamin."}
+            store.close()